@@ -1,5 +1,11 @@
 import math
-import datetime, calendar, os
+import datetime, calendar, os, csv
+import gc, json
+import hashlib
+import threading
+import tracemalloc
+from time import perf_counter
+from collections import Counter, OrderedDict, deque
 import pytz
 import numpy as np
 import random
@@ -16,23 +22,33 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.widget import Widget
 from kivy.clock import Clock
-from kivy.graphics import (Color, Ellipse, Line, StencilPush, StencilUse,
-                           StencilUnUse, StencilPop, Rectangle, RoundedRectangle)
+from kivy.graphics import (Color, Ellipse, Line, Rectangle, RoundedRectangle, Mesh,
+                           InstructionGroup, Fbo, ClearColor, ClearBuffers, RenderContext)
+from kivy.graphics.texture import Texture, TextureRegion
+from kivy.atlas import Atlas
+from kivy.cache import Cache
+from kivy.core.text import Label as CoreLabel
+from kivy.core.image import Image as CoreImage
+from kivy.metrics import sp
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.scrollview import ScrollView
-from kivy.properties import NumericProperty, BooleanProperty, ObjectProperty, StringProperty
+from kivy.properties import NumericProperty, BooleanProperty, ObjectProperty, StringProperty, ListProperty
 from kivy.uix.textinput import TextInput
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.image import Image
 from kivy.uix.spinner import Spinner
 from kivy.uix.popup import Popup
 from kivy.uix.anchorlayout import AnchorLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 
 from kivy.config import ConfigParser
 from kivy.uix.spinner import SpinnerOption
 from kivy.uix.dropdown import DropDown
 # -------------------------------------------------------------------
-Window.size = (360, 640)
+# في وضع الخدمة دون واجهة (KIVY_WINDOW فارغ) لا توجد نافذة
+if Window is not None:
+    Window.size = (360, 640)
 
 LabelBase.register(name="Roboto", fn_regular="fonts/Amiri-Regular.ttf")
 
@@ -40,16 +56,391 @@ IMAGE_FOLDER = "images"
 if not os.path.exists(IMAGE_FOLDER):
     os.makedirs(IMAGE_FOLDER)
 
+CACHE_FOLDER = "cache"
+if not os.path.exists(CACHE_FOLDER):
+    os.makedirs(CACHE_FOLDER)
+
+EXPORT_FOLDER = "exports"
+if not os.path.exists(EXPORT_FOLDER):
+    os.makedirs(EXPORT_FOLDER)
+
+SATELLITE_FOLDER = "satellites"
+if not os.path.exists(SATELLITE_FOLDER):
+    os.makedirs(SATELLITE_FOLDER)
+
+MINOR_BODY_FOLDER = "minor_bodies"
+if not os.path.exists(MINOR_BODY_FOLDER):
+    os.makedirs(MINOR_BODY_FOLDER)
+
+HORIZON_FOLDER = "horizons"
+if not os.path.exists(HORIZON_FOLDER):
+    os.makedirs(HORIZON_FOLDER)
+
 # skyfield
 from skyfield.api import load, Topos
 from skyfield import almanac
+from skyfield.vectorlib import VectorFunction
+from skyfield.framelib import ecliptic_frame
+from skyfield.precessionlib import compute_precession
+from skyfield.nutationlib import iau2000b_radians, mean_obliquity
+from skyfield.sgp4lib import theta_GMST1982
+from sgp4.api import Satrec, SatrecArray
+
+# -------------------------------------------------------------------
+# تقويم فلكي تحليلي منخفض الدقة (بديل ملف JPL للأجهزة محدودة الذاكرة)
+#
+# ميزانية الدقة مقارنة بـ DE421 خلال 1900–2050 (الموضع الظاهري المركزي الأرضي):
+#   - الشمس: أقل من 0.5′        - القمر: أقل من 1′ (ومسافته ضمن 40 كم)
+#   - عطارد والزهرة: أقل من 1.5′  - المريخ: أقل من 3.5′   - أورانوس ونبتون: أقل من 2′
+#   - المشتري: أقل من 6′         - زحل: أقل من 10′
+#   - أوقات الشروق والغروب: ضمن دقيقة واحدة للشمس والكواكب، وضمن دقيقتين للقمر.
+# خارج 1800–2050 تتراجع دقة عناصر الكواكب سريعاً.
+
+J2000_OBLIQUITY = np.radians(23.43928)
+
+# عناصر كبلر المتوسطة ومعدلاتها لكل قرن (Standish، JPL: "Keplerian Elements for Approximate
+# Positions of the Major Planets"، الجدول 1 لفترة 1800–2050) مرجعها مستوى البروج J2000:
+# a (AU)، e، I°، L°، خط طول الحضيض°، خط طول العقدة°
+KEPLER_ELEMENTS = {
+    1: ([0.38709927, 0.20563593, 7.00497902, 252.25032350, 77.45779628, 48.33076593],
+        [0.00000037, 0.00001906, -0.00594749, 149472.67411175, 0.16047689, -0.12534081]),
+    2: ([0.72333566, 0.00677672, 3.39467605, 181.97909950, 131.60246718, 76.67984255],
+        [0.00000390, -0.00004107, -0.00078890, 58517.81538729, 0.00268329, -0.27769418]),
+    3: ([1.00000261, 0.01671123, -0.00001531, 100.46457166, 102.93768193, 0.0],
+        [0.00000562, -0.00004392, -0.01294668, 35999.37244981, 0.32327364, 0.0]),
+    4: ([1.52371034, 0.09339410, 1.84969142, -4.55343205, -23.94362959, 49.55953891],
+        [0.00001847, 0.00007882, -0.00813131, 19140.30268499, 0.44441088, -0.29257343]),
+    5: ([5.20288700, 0.04838624, 1.30439695, 34.39644051, 14.72847983, 100.47390909],
+        [-0.00011607, -0.00013253, -0.00183714, 3034.74612775, 0.21252668, 0.20469106]),
+    6: ([9.53667594, 0.05386179, 2.48599187, 49.95424423, 92.59887831, 113.66242448],
+        [-0.00125060, -0.00050991, 0.00193609, 1222.49362201, -0.41897216, -0.28867794]),
+    7: ([19.18916464, 0.04725744, 0.77263783, 313.23810451, 170.95427630, 74.01692503],
+        [-0.00196176, -0.00004397, -0.00242939, 428.48202785, 0.40805281, 0.04240589]),
+    8: ([30.06992276, 0.00859048, 1.77004347, -55.12002969, 44.96476227, 131.78422574],
+        [0.00026291, 0.00005105, 0.00035372, 218.45945325, -0.32241464, -0.00508664]),
+}
+
+# حدود الاضطراب قصيرة الدورة المتبادلة بين المشتري وزحل في خط الطول (بالدرجات):
+# (السعة، مضاعف M للمشتري، مضاعف M لزحل، الطور°، جيب أم جيب تمام). أُسقط حد "التفاوت العظيم"
+# (2Mj - 5Ms) لأن عناصر 1800–2050 المتوسطة تمتصه أصلاً.
+KEPLER_PERTURBATIONS = {
+    5: [(-0.056, 2, -2, 21.0, np.sin), (0.042, 3, -5, 21.0, np.sin), (-0.036, 1, -2, 0.0, np.sin),
+        (0.022, 1, -1, 0.0, np.cos), (0.023, 2, -3, 52.0, np.sin), (-0.016, 1, -5, -69.0, np.sin)],
+    6: [(0.119, 1, -2, -3.0, np.sin), (0.046, 2, -6, -69.0, np.sin), (0.014, 1, -3, 32.0, np.sin)],
+}
+
+# أكبر حدود نظرية القمر (Meeus، الفصل 47): مضاعفات D و M و M′ و F ثم معاملا الطول (1e-6°) والمسافة (م)
+MOON_LONGITUDE_DISTANCE_TERMS = np.array([
+    (0, 0, 1, 0, 6288774, -20905355), (2, 0, -1, 0, 1274027, -3699111),
+    (2, 0, 0, 0, 658314, -2955968), (0, 0, 2, 0, 213618, -569925),
+    (0, 1, 0, 0, -185116, 48888), (0, 0, 0, 2, -114332, -3149),
+    (2, 0, -2, 0, 58793, 246158), (2, -1, -1, 0, 57066, -152138),
+    (2, 0, 1, 0, 53322, -170733), (2, -1, 0, 0, 45758, -204586),
+    (0, 1, -1, 0, -40923, -129620), (1, 0, 0, 0, -34720, 108743),
+    (0, 1, 1, 0, -30383, 104755), (2, 0, 0, -2, 15327, 10321),
+    (0, 0, 1, 2, -12528, 0), (0, 0, 1, -2, 10980, 79661),
+    (4, 0, -1, 0, 10675, -34782), (0, 0, 3, 0, 10034, -23210),
+    (4, 0, -2, 0, 8548, -21636), (2, 1, -1, 0, -7888, 24208),
+    (2, 1, 0, 0, -6766, 30824), (1, 0, -1, 0, -5163, -8379),
+    (1, 1, 0, 0, 4987, -16675), (2, -1, 1, 0, 4036, -12831),
+    (2, 0, 2, 0, 3994, -10445), (4, 0, 0, 0, 3861, -11650),
+    (2, 0, -3, 0, 3665, 14403), (0, 1, -2, 0, -2689, -7003),
+    (2, 0, -1, 2, -2602, 0), (2, -1, -2, 0, 2390, 10056),
+    (1, 0, 1, 0, -2348, 6322), (2, -2, 0, 0, 2236, -9884),
+], dtype=float)
+
+MOON_LATITUDE_TERMS = np.array([
+    (0, 0, 0, 1, 5128122), (0, 0, 1, 1, 280602), (0, 0, 1, -1, 277693),
+    (2, 0, 0, -1, 173237), (2, 0, -1, 1, 55413), (2, 0, -1, -1, 46271),
+    (2, 0, 0, 1, 32573), (0, 0, 2, 1, 17198), (2, 0, 1, -1, 9266),
+    (0, 0, 2, -1, 8822), (2, -1, 0, -1, 8216), (2, 0, -2, -1, 4324),
+    (2, 0, 1, 1, 4200), (2, 1, 0, -1, -3359), (2, -1, -1, 1, 2463),
+    (2, -1, 0, 1, 2211), (2, -1, -1, -1, 2065), (0, 1, -1, -1, -1870),
+    (4, 0, -1, -1, 1828), (0, 1, 0, 1, -1794),
+], dtype=float)
+
+EARTH_MOON_MASS_RATIO = 81.30056
+AU_KM = 149597870.7
+
+# العناصر نفسها كمصفوفات (الزوايا بالراديان) والحركة المتوسطة (راديان/يوم) لتقييمها بعمليات متجهة قليلة،
+# وحدود الاضطراب كمصفوفات (السعة والطور بالراديان، وجيب التمام جيب بطور +90°)
+KEPLER_ARRAYS = {code: (np.array(base[:2] + list(np.radians(base[2:]))),
+                        np.array(rate[:2] + list(np.radians(rate[2:]))))
+                 for code, (base, rate) in KEPLER_ELEMENTS.items()}
+KEPLER_MEAN_MOTION = {code: np.radians(rate[3] - rate[4]) / 36525.0
+                      for code, (base, rate) in KEPLER_ELEMENTS.items()}
+KEPLER_PERTURBATION_ARRAYS = {
+    code: (np.radians([amp for amp, _, _, _, _ in terms]),
+           np.array([(j, k) for _, j, k, _, _ in terms], dtype=float),
+           np.radians([phase + (90.0 if f is np.cos else 0.0) for _, _, _, phase, f in terms]))
+    for code, terms in KEPLER_PERTURBATIONS.items()}
+
+# دوران مستوى البروج J2000 إلى خط الاستواء (ICRS) بميل ثابت
+_COS_J2000_OBLIQUITY, _SIN_J2000_OBLIQUITY = np.cos(J2000_OBLIQUITY), np.sin(J2000_OBLIQUITY)
+
+def _ecliptic_to_equatorial(x, y, z, obliquity):
+    return np.array([x,
+                     np.cos(obliquity) * y - np.sin(obliquity) * z,
+                     np.sin(obliquity) * y + np.cos(obliquity) * z])
+
+def _mean_anomaly(code, T):
+    base, rate = KEPLER_ARRAYS[code]
+    return base[3] - base[4] + (rate[3] - rate[4]) * T
+
+def _kepler_orbit(code, T):
+    """
+    الجزء البطيء من مدار الرمز code عند T (قرون منذ J2000، بأي شكل): نصف القطر الأكبر والاختلاف المركزي
+    ودوران المستوي المداري إلى ICRS بالشكل (3، 2، ...) بعد اضطراب المشتري وزحل.
+    """
+    base, rate = KEPLER_ARRAYS[code]
+    shape = (6,) + (1,) * np.ndim(T)
+    a, e, inc, _, peri, node = base.reshape(shape) + rate.reshape(shape) * T
+    w = peri - node
+    if code in KEPLER_PERTURBATION_ARRAYS:
+        # اضطراب خط الطول دوران للمدار كله حول قطب البروج، أي إزاحة لخط طول العقدة
+        amp, multiples, phase = KEPLER_PERTURBATION_ARRAYS[code]
+        anomalies = np.array([_mean_anomaly(5, T), _mean_anomaly(6, T)])
+        node = node + np.tensordot(amp, np.sin(np.tensordot(multiples, anomalies, axes=1)
+                                               + phase.reshape((-1,) + (1,) * np.ndim(T))), axes=1)
+    cw, sw, cn, sn, ci, si = np.cos(w), np.sin(w), np.cos(node), np.sin(node), np.cos(inc), np.sin(inc)
+    # صفوف دوران المدار إلى البروج (x, y, z) ثم إلى خط الاستواء في مصفوفة واحدة
+    ex = (cw * cn - sw * sn * ci, -sw * cn - cw * sn * ci)
+    ey = (cw * sn + sw * cn * ci, -sw * sn + cw * cn * ci)
+    ez = (sw * si, cw * si)
+    c, s = _COS_J2000_OBLIQUITY, _SIN_J2000_OBLIQUITY
+    rotation = np.array([ex,
+                         (c * ey[0] - s * ez[0], c * ey[1] - s * ez[1]),
+                         (s * ey[0] + c * ez[0], s * ey[1] + c * ez[1])])
+    return a, e, rotation
+
+# الجزء البطيء يتغير أقل من 0.4″ في اليوم، فيُحسب عند اليوم الأقرب لمنتصف أي مدى زمني لا يتجاوز
+# KEPLER_ORBIT_SPAN أياماً (خطأ أقل من 0.6″)، ويُحفظ لأحدث KEPLER_ORBIT_CACHE_SIZE من أزواج (الرمز، اليوم)
+KEPLER_ORBIT_SPAN = 3.0
+KEPLER_ORBIT_CACHE_SIZE = 64
+_kepler_orbit_cache = OrderedDict()
+_kepler_orbit_lock = threading.Lock()
+
+def kepler_heliocentric(code, tdb):
+    """
+    موضع مركز الكوكب (أو مركز ثقل الأرض والقمر للرمز 3) حول الشمس وسرعته بإحداثيات ICRS،
+    بوحدتي AU و AU/يوم. السرعة من حل كبلر نفسه (dE/dt = n / (1 - e cos E)) مع إهمال تغير العناصر البطيء.
+    لمدى زمني قصير يؤخذ الجزء البطيء (_kepler_orbit) من الذاكرة مرة لكل يوم، ولا يُحل إلا الشذوذ المتوسط.
+    """
+    base, rate = KEPLER_ARRAYS[code]
+    tdb = np.asarray(tdb, dtype=float)
+    T = (tdb - 2451545.0) / 36525.0
+    if np.ptp(tdb) <= KEPLER_ORBIT_SPAN:
+        key = (code, round(float(np.mean(tdb))))
+        orbit = _kepler_orbit_cache.get(key)
+        if orbit is None:
+            orbit = _kepler_orbit(code, (key[1] - 2451545.0) / 36525.0)
+            with _kepler_orbit_lock:
+                _kepler_orbit_cache[key] = orbit
+                while len(_kepler_orbit_cache) > KEPLER_ORBIT_CACHE_SIZE:
+                    _kepler_orbit_cache.popitem(last=False)
+    else:
+        orbit = _kepler_orbit(code, T)
+    a, e, rotation = orbit
+    M = (base[3] - base[4] + (rate[3] - rate[4]) * T + np.pi) % (2 * np.pi) - np.pi
+    # ثلاث خطوات نيوتن من M + e sin M تكفي لدقة 1e-9 راديان حتى لعطارد (e ≈ 0.21)
+    E = M + e * np.sin(M)
+    for _ in range(3):
+        E = E - (E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+    cos_E, sin_E, root = np.cos(E), np.sin(E), np.sqrt(1 - e * e)
+    E_dot = KEPLER_MEAN_MOTION[code] / (1 - e * cos_E)
+    position = np.einsum('ij...,j...->i...', rotation, np.array([a * (cos_E - e), a * root * sin_E]))
+    velocity = np.einsum('ij...,j...->i...', rotation, np.array([-a * sin_E * E_dot, a * root * cos_E * E_dot]))
+    return position, velocity
+
+# السلسلتان معاً لتقييمهما بتمريرة جيب وجيب تمام واحدة: مضاعفات D و M و M′ و F لكل الحدود، وأس E لكل حد،
+# ومعدل زاوية كل حد (راديان/يوم، بإهمال حدود T²) لاشتقاق السرعة.
+# مصفوفتا المعاملات تجمعان الحدود: صفوف SIN لـ Σl و Σb و dΣr/dt، وصفوف COS لـ Σr و dΣl/dt و dΣb/dt.
+MOON_ARGUMENT_RATES = np.array([445267.1114034, 35999.0502909, 477198.8675055, 483202.0175233]) / 36525.0
+MOON_SERIES_MULTIPLES = np.vstack([MOON_LONGITUDE_DISTANCE_TERMS[:, :4], MOON_LATITUDE_TERMS[:, :4]])
+MOON_SERIES_E_POWERS = np.abs(MOON_SERIES_MULTIPLES[:, 1])
+MOON_SERIES_RATES = np.radians(MOON_SERIES_MULTIPLES @ MOON_ARGUMENT_RATES)
+_moon_l = np.concatenate([MOON_LONGITUDE_DISTANCE_TERMS[:, 4], np.zeros(len(MOON_LATITUDE_TERMS))])
+_moon_r = np.concatenate([MOON_LONGITUDE_DISTANCE_TERMS[:, 5], np.zeros(len(MOON_LATITUDE_TERMS))])
+_moon_b = np.concatenate([np.zeros(len(MOON_LONGITUDE_DISTANCE_TERMS)), MOON_LATITUDE_TERMS[:, 4]])
+MOON_SIN_COEFFICIENTS = np.array([_moon_l, _moon_b, -_moon_r * MOON_SERIES_RATES])
+MOON_COS_COEFFICIENTS = np.array([_moon_r, _moon_l * MOON_SERIES_RATES, _moon_b * MOON_SERIES_RATES])
+del _moon_l, _moon_r, _moon_b
+
+# مصفوفة المبادرة لمدى زمني أقصر من هذا (يوم) تؤخذ عند منتصفه: تتغير 0.14″ في اليوم
+MOON_PRECESSION_SPAN = 10.0
+
+def moon_geocentric(tdb):
+    """
+    موضع القمر الهندسي بالنسبة لمركز الأرض وسرعته بإحداثيات ICRS، بوحدتي AU و AU/يوم (نظرية ميوس مختصرة).
+    السرعة مشتقة الحدود نفسها في التمريرة ذاتها، والمبادرة وميل البروج ثابتان خلالها.
+    """
+    tdb = np.asarray(tdb, dtype=float)
+    T = (tdb - 2451545.0) / 36525.0
+    Lp = np.radians(218.3164477 + 481267.88123421 * T - 0.0015786 * T ** 2)
+    D = np.radians(297.8501921 + 445267.1114034 * T - 0.0018819 * T ** 2)
+    M = np.radians(357.5291092 + 35999.0502909 * T - 0.0001536 * T ** 2)
+    Mp = np.radians(134.9633964 + 477198.8675055 * T + 0.0087414 * T ** 2)
+    F = np.radians(93.2720950 + 483202.0175233 * T - 0.0036539 * T ** 2)
+    A1 = np.radians(119.75 + 131.849 * T)
+    A2 = np.radians(53.09 + 479264.290 * T)
+    A3 = np.radians(313.45 + 481266.484 * T)
+    E = 1 - 0.002516 * T - 0.0000074 * T ** 2
+    Lp_r, F_r, Mp_r = np.radians([481267.88123421 / 36525.0, MOON_ARGUMENT_RATES[3], MOON_ARGUMENT_RATES[2]])
+    A1_r, A2_r, A3_r = np.radians([131.849, 479264.290, 481266.484]) / 36525.0
+
+    arg = np.tensordot(MOON_SERIES_MULTIPLES, np.array([D, M, Mp, F]), axes=1)
+    e_factor = E ** MOON_SERIES_E_POWERS.reshape((-1,) + (1,) * D.ndim)
+    sigma_l, sigma_b, sigma_r_dot = np.tensordot(MOON_SIN_COEFFICIENTS, e_factor * np.sin(arg), axes=1)
+    sigma_r, sigma_l_dot, sigma_b_dot = np.tensordot(MOON_COS_COEFFICIENTS, e_factor * np.cos(arg), axes=1)
+
+    sigma_l = sigma_l + 3958 * np.sin(A1) + 1962 * np.sin(Lp - F) + 318 * np.sin(A2)
+    sigma_l_dot = sigma_l_dot + 3958 * np.cos(A1) * A1_r + 1962 * np.cos(Lp - F) * (Lp_r - F_r) \
+        + 318 * np.cos(A2) * A2_r
+    sigma_b = sigma_b - 2235 * np.sin(Lp) + 382 * np.sin(A3) + 175 * np.sin(A1 - F) \
+        + 175 * np.sin(A1 + F) + 127 * np.sin(Lp - Mp) - 115 * np.sin(Lp + Mp)
+    sigma_b_dot = sigma_b_dot - 2235 * np.cos(Lp) * Lp_r + 382 * np.cos(A3) * A3_r \
+        + 175 * np.cos(A1 - F) * (A1_r - F_r) + 175 * np.cos(A1 + F) * (A1_r + F_r) \
+        + 127 * np.cos(Lp - Mp) * (Lp_r - Mp_r) - 115 * np.cos(Lp + Mp) * (Lp_r + Mp_r)
+
+    lon = Lp + np.radians(sigma_l / 1e6)
+    lat = np.radians(sigma_b / 1e6)
+    distance = (385000.56 + sigma_r / 1000.0) / AU_KM
+    lon_dot = Lp_r + np.radians(sigma_l_dot / 1e6)
+    lat_dot = np.radians(sigma_b_dot / 1e6)
+    distance_dot = sigma_r_dot / 1000.0 / AU_KM
+
+    # من بروج التاريخ المتوسط إلى خط الاستواء المتوسط للتاريخ، ثم عكس المبادرة إلى ICRS
+    cos_lon, sin_lon, cos_lat, sin_lat = np.cos(lon), np.sin(lon), np.cos(lat), np.sin(lat)
+    obliquity = np.radians(23.439291 - 0.0130042 * T)
+    r = _ecliptic_to_equatorial(distance * cos_lat * cos_lon,
+                                distance * cos_lat * sin_lon,
+                                distance * sin_lat, obliquity)
+    v = _ecliptic_to_equatorial(
+        distance_dot * cos_lat * cos_lon - distance * (sin_lat * lat_dot * cos_lon + cos_lat * sin_lon * lon_dot),
+        distance_dot * cos_lat * sin_lon - distance * (sin_lat * lat_dot * sin_lon - cos_lat * cos_lon * lon_dot),
+        distance_dot * sin_lat + distance * cos_lat * lat_dot, obliquity)
+    P = compute_precession(tdb if np.ptp(tdb) > MOON_PRECESSION_SPAN else np.mean(tdb))
+    return np.einsum('ji...,j...->i...', P, r), np.einsum('ji...,j...->i...', P, v)
+
+class AnalyticBody(VectorFunction):
+    """
+    جرم من التقويم التحليلي يتصرف كقطعة من ملف JPL: مركزه "مركز الثقل" (الشمس هنا) وهدفه رمز NAIF،
+    فتعمل عليه observe() و apparent() و altaz() وكل دوال almanac كما هي.
+    """
+    def __init__(self, ephemeris, code):
+        self.ephemeris = ephemeris
+        self.center = 0
+        self.target = code
 
-try:
-    eph = load('de430.bsp')
-    print("Using de430.bsp for ephemeris data.")
-except Exception as e:
-    print("de430.bsp not available, using de421.bsp. Error:", e)
-    eph = load('de421.bsp')
+    @property
+    def vector_name(self):
+        return "Analytic"
+
+    def _at(self, t):
+        position, velocity = self.ephemeris.state(self.target, t.tdb)
+        return position, velocity, None, None
+
+class AnalyticEphemeris:
+    """
+    بديل لملف JPL بالحد الأدنى من الواجهة التي يستخدمها التطبيق و Skyfield: eph[الاسم أو الرمز]،
+    و "in"، ومدى الصلاحية. الشمس في الأصل، والأرض والقمر مشتقان من مركز ثقلهما ونظرية القمر.
+    """
+    NAMES = {
+        'SUN': 10, 'SOLAR SYSTEM BARYCENTER': 0,
+        'MERCURY': 199, 'MERCURY BARYCENTER': 1, 'VENUS': 299, 'VENUS BARYCENTER': 2,
+        'EARTH': 399, 'EARTH BARYCENTER': 3, 'MOON': 301,
+        'MARS': 499, 'MARS BARYCENTER': 4, 'JUPITER BARYCENTER': 5, 'SATURN BARYCENTER': 6,
+        'URANUS BARYCENTER': 7, 'NEPTUNE BARYCENTER': 8,
+    }
+    PLANET_CODES = {199: 1, 299: 2, 499: 4}
+    VALID_YEARS = (1800, 2050)
+
+    def __init__(self):
+        self.bodies = {}
+        self.path = "analytic"
+        # آخر تقييم لكل رمز: apparent() يطلب الأرض مرتين للحظة نفسها (الراصد ثم انحراف الضوء بالأرض)،
+        # والأجرام الحارفة للحظة t ثم لحظة أقرب اقتراب التي تساويها كثيراً. مفتاح وقيمة في صف واحد
+        # ليبقى التبديل آمناً بين الخيوط.
+        self._states = {}
+
+    def __getitem__(self, key):
+        code = self.NAMES[key.upper()] if isinstance(key, str) else int(key)
+        if code not in self.NAMES.values():
+            raise KeyError(key)
+        if code not in self.bodies:
+            self.bodies[code] = AnalyticBody(self, code)
+        return self.bodies[code]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def span(self):
+        return (ts.utc(self.VALID_YEARS[0], 1, 1).tt, ts.utc(self.VALID_YEARS[1], 12, 31).tt)
+
+    def state(self, code, tdb):
+        """الموضع والسرعة (AU و AU/يوم) لرمز NAIF حول الشمس بإحداثيات ICRS، بتقييم واحد للنظرية."""
+        if code in (0, 10):
+            zeros = np.zeros((3,) + np.shape(tdb))
+            return zeros, zeros
+        key = (np.shape(tdb), np.asarray(tdb, dtype=float).tobytes())
+        cached_key, cached = self._states.get(code, (None, None))
+        if cached_key != key:
+            cached = self._compute_state(code, tdb)
+            self._states[code] = (key, cached)
+        position, velocity = cached
+        return position.copy(), velocity.copy()
+
+    def _compute_state(self, code, tdb):
+        if code in (301, 399):
+            emb, emb_velocity = kepler_heliocentric(3, tdb)
+            moon, moon_velocity = moon_geocentric(tdb)
+            earth = emb - moon / (1 + EARTH_MOON_MASS_RATIO)
+            earth_velocity = emb_velocity - moon_velocity / (1 + EARTH_MOON_MASS_RATIO)
+            return (earth + moon, earth_velocity + moon_velocity) if code == 301 else (earth, earth_velocity)
+        return kepler_heliocentric(self.PLANET_CODES.get(code, code), tdb)
+
+EPHEMERIS_BACKENDS = ["jpl", "analytic"]
+
+def read_ephemeris_backend(config_file="user_settings.ini"):
+    """اختيار محرك التقويم الفلكي المحفوظ في ملف الإعدادات (jpl افتراضياً)."""
+    parser = ConfigParser()
+    if os.path.exists(config_file):
+        parser.read(config_file)
+        if parser.has_section("Ephemeris") and parser.has_option("Ephemeris", "backend"):
+            backend = parser.get("Ephemeris", "backend")
+            if backend in EPHEMERIS_BACKENDS:
+                return backend
+    return "jpl"
+
+def save_ephemeris_backend(backend, config_file="user_settings.ini"):
+    """يحفظ المحرك المختار ليُستخدم عند التشغيل التالي (التقويم يُحمَّل مرة واحدة عند بدء التطبيق)."""
+    app = App.get_running_app()
+    parser = getattr(app, "config_parser", None)
+    if parser is None:
+        parser = ConfigParser()
+        parser.read(config_file)
+    if not parser.filename:
+        parser.filename = config_file
+    if not parser.has_section("Ephemeris"):
+        parser.add_section("Ephemeris")
+    parser.set("Ephemeris", "backend", backend)
+    parser.write()
+
+EPHEMERIS_BACKEND = read_ephemeris_backend()
+if EPHEMERIS_BACKEND == "analytic":
+    eph = AnalyticEphemeris()
+    print("Using the analytic low-precision ephemeris.")
+else:
+    try:
+        eph = load('de430.bsp')
+        print("Using de430.bsp for ephemeris data.")
+    except Exception as e:
+        print("de430.bsp not available, using de421.bsp. Error:", e)
+        eph = load('de421.bsp')
 
 ts = load.timescale()
 
@@ -77,90 +468,383 @@ def get_current_location():
     lat_str, lon_str = OMAN_LOCATIONS.get(location_name, OMAN_LOCATIONS["مسقط"])
     return Topos(lat_str, lon_str)
 
-def get_rise_set(ts, dt, body, include_date=False):
+# -------------------------------------------------------------------
+# المناطق الزمنية: لكل موقع منطقته، وتحويل أوقات UTC إلى المحلي لمصفوفات كاملة
+DEFAULT_TIMEZONE = "Asia/Muscat"
+LOCATION_TIMEZONES = {
+    "مكة": "Asia/Riyadh",
+    "جدة": "Asia/Riyadh",
+    "الرياض": "Asia/Riyadh",
+}
+UNIX_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.UTC)
+
+_timezone_cache = {}
+_offset_tables = {}
+
+def get_location_timezone(location_name=None):
+    """المنطقة الزمنية للموقع (أو للموقع الحالي)؛ يُنشأ كائن المنطقة مرة واحدة ويُعاد استخدامه."""
+    if location_name is None:
+        location_name = getattr(App.get_running_app(), "current_location_name", "مسقط")
+    zone = LOCATION_TIMEZONES.get(location_name, DEFAULT_TIMEZONE)
+    tz = _timezone_cache.get(zone)
+    if tz is None:
+        tz = _timezone_cache[zone] = pytz.timezone(zone)
+    return tz
+
+def _offset_table(tz):
+    """لحظات انتقال المنطقة (ثوانٍ منذ 1970) والإزاحة بالثواني بعد كل انتقال."""
+    table = _offset_tables.get(tz.zone)
+    if table is None:
+        transitions = getattr(tz, "_utc_transition_times", None)
+        if transitions:
+            epoch = UNIX_EPOCH.replace(tzinfo=None)
+            starts = np.array([(t - epoch).total_seconds() for t in transitions])
+            offsets = np.array([info[0].total_seconds() for info in tz._transition_info])
+        else:
+            starts = np.array([-np.inf])
+            offsets = np.array([tz.utcoffset(datetime.datetime(2000, 1, 1)).total_seconds()])
+        table = _offset_tables[tz.zone] = (starts, offsets)
+    return table
+
+def utc_offsets(tz, unix_seconds):
+    """إزاحة المنطقة tz بالثواني عند كل لحظة في unix_seconds (بحث ثنائي واحد للمصفوفة كلها)."""
+    starts, offsets = _offset_table(tz)
+    idx = np.searchsorted(starts, np.nan_to_num(unix_seconds), side='right') - 1
+    return offsets[np.clip(idx, 0, len(offsets) - 1)]
+
+def time_to_unix(t):
+    """
+    لحظات Skyfield إلى ثوانٍ منذ 1970 (UTC) كمصفوفة، من التقويم المتجه t.utc دون datetime لكل لحظة.
+    الثانية الكبيسة (60) تُحتسب كالثانية الأولى من اليوم التالي.
+    """
+    year, month, day, hour, minute, second = (np.atleast_1d(np.asarray(v, dtype=float)) for v in t.utc)
+    # عدد الأيام منذ 1970-01-01 للتقويم الميلادي (خوارزمية days_from_civil)
+    y = year - (month <= 2)
+    era = np.floor(y / 400)
+    yoe = y - era * 400
+    doy = np.floor((153 * (month + np.where(month > 2, -3, 9)) + 2) / 5) + day - 1
+    doe = yoe * 365 + np.floor(yoe / 4) - np.floor(yoe / 100) + doy
+    days = era * 146097 + doe - 719468
+    return days * 86400.0 + hour * 3600.0 + minute * 60.0 + second
+
+def unix_to_local(unix_seconds, tz):
+    """لحظة واحدة (ثوانٍ منذ 1970) إلى datetime محلي؛ للقيم التي ستُعرض فقط."""
+    return (UNIX_EPOCH + datetime.timedelta(seconds=float(unix_seconds))).astimezone(tz)
+
+def get_rise_set(ts, dt, body, include_date=False, location=None, tz=None, horizon=-34.0 / 60.0):
     """
     تحسب أوقات الشروق والغروب بحيث:
       - يُستخرج شروق ضمن نافذة 13 ساعة من dt.
       - يُستخرج غروب يكون بعد الشروق.
-        إذا كان الحدث المُرشَّح للغروب وقع قبل الشروق أو بفارق كبير (مثلاً أكثر من 3 ساعات) يتم اختيار الحدث التالي.
-    تُنسَّق النتائج مع استبدال AM بـ"ص" وPM بـ"م".
+        إذا كان الحدث المُرشَّح للغروب وقع قبل الشروق أو بفارق كبير (مثلاً أكثر من 3 ساعات) يتم اختيار الحدث التالي.
+    تُنسَّق النتائج بتوقيت tz (منطقة الموقع الحالي افتراضياً) مع استبدال AM بـ"ص" وPM بـ"م".
+    يجري الاختيار كله على مصفوفة لحظات الأحداث بالثواني، ولا يُنشأ datetime إلا للنتيجتين.
+    horizon ارتفاع مركز الجرم عند الحدث بالدرجات (-34′ افتراضياً كما في almanac). هذا البحث الدقيق
+    هو مرجع حارس الدقة لما تعرضه الشاشات من compute_sky_snapshot بتمرير snapshot_horizon(key).
     """
-    utc_tz = pytz.UTC
-    oman_tz = pytz.timezone('Asia/Muscat')
-    location = get_current_location()
-    dt_local = dt.astimezone(oman_tz)
+    tz = tz or get_location_timezone()
+    location = location or get_current_location()
 
-    dt_start = (dt - datetime.timedelta(hours=24)).astimezone(utc_tz)
-    dt_end = (dt + datetime.timedelta(hours=24)).astimezone(utc_tz)
-    t0 = ts.from_datetime(dt_start)
-    t1 = ts.from_datetime(dt_end)
-    
-    f = almanac.risings_and_settings(eph, body, location)
+    t0 = ts.from_datetime(dt - datetime.timedelta(hours=24))
+    t1 = ts.from_datetime(dt + datetime.timedelta(hours=24))
+    f = almanac.risings_and_settings(eph, body, location, horizon_degrees=horizon)
     times, events = almanac.find_discrete(t0, t1, f)
-    
-    sunrise_events = []
-    sunset_events = []
-    for t_val, e_val in zip(times, events):
-        local_time = t_val.utc_datetime().replace(tzinfo=utc_tz).astimezone(oman_tz)
-        diff_sec = abs((local_time - dt_local).total_seconds())
-        if e_val == 1 and diff_sec <= 13 * 3600:
-            sunrise_events.append(local_time)
-        elif e_val == 0 and diff_sec <= 12 * 3600:
-            sunset_events.append(local_time)
-    
-    if sunrise_events:
-        sunrise_time = min(sunrise_events, key=lambda t: abs((t - dt_local).total_seconds()))
-    else:
-        all_rising = [t_val.utc_datetime().replace(tzinfo=utc_tz).astimezone(oman_tz)
-                      for t_val, e_val in zip(times, events) if e_val == 1]
-        sunrise_time = min(all_rising, key=lambda t: abs((t - dt_local).total_seconds())) if all_rising else None
-
-    if sunrise_time:
-        valid_sunset = [t for t in sunset_events if t > sunrise_time]
-        if valid_sunset:
-            future_sunset = [t for t in valid_sunset if t >= dt_local]
-            if future_sunset:
-                sunset_time = min(future_sunset, key=lambda t: (t - dt_local).total_seconds())
-            else:
-                sunset_time = min(valid_sunset, key=lambda t: abs((t - dt_local).total_seconds()))
+
+    seconds = time_to_unix(times)
+    return select_rise_set(seconds[events == 1], seconds[events == 0], dt, tz, include_date)
+
+def select_rise_set(rising, setting, dt, tz, include_date=False):
+    """
+    منطق الاختيار والتنسيق في get_rise_set لمصفوفتي لحظات الشروق والغروب (ثوانٍ منذ 1970)
+    خلال ±24 ساعة من dt، أياً كان مصدرهما.
+    """
+    dt_local = dt.astimezone(tz)
+    ref = dt.timestamp()
+
+    def nearest(values):
+        return values[np.argmin(np.abs(values - ref))] if len(values) else None
+
+    sunrise_events = rising[np.abs(rising - ref) <= 13 * 3600]
+    sunset_events = setting[np.abs(setting - ref) <= 12 * 3600]
+    sunrise_time = nearest(sunrise_events) if len(sunrise_events) else nearest(rising)
+
+    if sunrise_time is not None:
+        valid_sunset = sunset_events[sunset_events > sunrise_time]
+        if len(valid_sunset):
+            future_sunset = valid_sunset[valid_sunset >= ref]
+            sunset_time = future_sunset.min() if len(future_sunset) else nearest(valid_sunset)
         else:
-            all_setting = [t_val.utc_datetime().replace(tzinfo=utc_tz).astimezone(oman_tz)
-                           for t_val, e_val in zip(times, events) if e_val == 0]
-            sunset_time = min(all_setting, key=lambda t: abs((t - dt_local).total_seconds())) if all_setting else None
+            sunset_time = nearest(setting)
     else:
-        all_setting = [t_val.utc_datetime().replace(tzinfo=utc_tz).astimezone(oman_tz)
-                       for t_val, e_val in zip(times, events) if e_val == 0]
-        sunset_time = min(all_setting, key=lambda t: abs((t - dt_local).total_seconds())) if all_setting else None
-
-    if sunrise_time and sunset_time:
-        if (sunset_time - sunrise_time).total_seconds() < 3 * 3600:
-            all_setting = [t_val.utc_datetime().replace(tzinfo=utc_tz).astimezone(oman_tz)
-                           for t_val, e_val in zip(times, events) if e_val == 0 and t_val.utc_datetime().replace(tzinfo=utc_tz).astimezone(oman_tz) > sunrise_time]
-            if all_setting:
-                sunset_time = min(all_setting, key=lambda t: abs((t - dt_local).total_seconds()))
-    
+        sunset_time = nearest(setting)
+
+    if sunrise_time is not None and sunset_time is not None and sunset_time - sunrise_time < 3 * 3600:
+        later = setting[setting > sunrise_time]
+        if len(later):
+            sunset_time = nearest(later)
+
     fmt = "%d/%m/%Y %I:%M %p" if include_date else "%I:%M %p"
-    
-    if sunrise_time:
-        if include_date and sunrise_time.hour == 0:
-            sunrise_str = (sunrise_time + datetime.timedelta(days=1)).strftime(fmt)
+
+    def format_event(value):
+        if value is None:
+            local_time = dt_local
         else:
-            sunrise_str = sunrise_time.strftime(fmt)
+            local_time = unix_to_local(value, tz)
+            if include_date and local_time.hour == 0:
+                local_time += datetime.timedelta(days=1)
+        return local_time.strftime(fmt).replace("AM", "ص").replace("PM", "م")
+
+    return format_event(sunrise_time), format_event(sunset_time)
+
+# -------------------------------------------------------------------
+# حسابات متجهة على شبكة زمنية كثيفة
+EARTH_RADIUS_AU = 6378.137 / 149597870.7
+EARTH_FLATTENING = 1 / 298.257223563
+
+class BodyTrack:
+    """
+    مسار الجرم الظاهري المركزي الأرضي (المطلع المستقيم، الميل، المسافة) مأخوذ بعينات متباعدة
+    عبر Skyfield مرة واحدة، ثم يُستكمل بالاستيفاء لأي مصفوفة أوقات.
+    يُحوَّل بعدها إلى ارتفاع وسمت لأي موقع (أو مصفوفة مواقع) بعمليات NumPy فقط،
+    مع تصحيح اختلاف المنظر للمراقب على سطح الأرض.
+    """
+    def __init__(self, body, tt_start, tt_end, step_days=0.25):
+        sample_tt = np.arange(tt_start - step_days, tt_end + 2 * step_days, step_days)
+        t = ts.tt_jd(sample_tt)
+        ra, dec, distance = eph['earth'].at(t).observe(body).apparent().radec(epoch='date')
+        self.sample_tt = sample_tt
+        self.ra = np.unwrap(ra.radians)
+        self.dec = dec.radians
+        self.distance = distance.au
+        self.gast = np.unwrap(t.gast * (np.pi / 12))
+
+    def radec(self, tt):
+        return (np.interp(tt, self.sample_tt, self.ra),
+                np.interp(tt, self.sample_tt, self.dec),
+                np.interp(tt, self.sample_tt, self.distance))
+
+    def sidereal_angle(self, tt):
+        return np.interp(tt, self.sample_tt, self.gast)
+
+    def altaz(self, tt, lat_deg, lon_deg, elevation_m=0.0):
+        """ارتفاع وسمت الجرم بالدرجات؛ تُبثّ الأبعاد بين tt والإحداثيات وفق قواعد NumPy."""
+        ra, dec, distance = self.radec(tt)
+        local_sidereal = self.sidereal_angle(tt) + np.radians(lon_deg)
+        return topocentric_altaz(ra, dec, distance, local_sidereal, lat_deg, elevation_m)
+
+    def hour_angle(self, tt, lon_deg):
+        """الزاوية الساعية بالراديان محصورة في (-π, π]."""
+        ra, _, _ = self.radec(tt)
+        h = self.sidereal_angle(tt) + np.radians(lon_deg) - ra
+        return (h + np.pi) % (2 * np.pi) - np.pi
+
+def topocentric_altaz(ra, dec, distance, local_sidereal, lat_deg, elevation_m=0.0):
+    """
+    ارتفاع وسمت جرم بالدرجات من مطلعه المستقيم وميله المركزيين الأرضيين (بالراديان، لخط استواء التاريخ)
+    وبعده بوحدة AU، مع تصحيح اختلاف المنظر لمراقب عند التوقيت النجمي المحلي local_sidereal.
+    """
+    lat = np.radians(lat_deg)
+
+    # موضع المراقب في إطار خط الاستواء الحقيقي للتاريخ (بوحدة AU)
+    u = np.arctan((1 - EARTH_FLATTENING) * np.tan(lat))
+    height = elevation_m / 6378137.0
+    rho_sin = (1 - EARTH_FLATTENING) * np.sin(u) + height * np.sin(lat)
+    rho_cos = np.cos(u) + height * np.cos(lat)
+
+    x = distance * np.cos(dec) * np.cos(ra) - EARTH_RADIUS_AU * rho_cos * np.cos(local_sidereal)
+    y = distance * np.cos(dec) * np.sin(ra) - EARTH_RADIUS_AU * rho_cos * np.sin(local_sidereal)
+    z = distance * np.sin(dec) - EARTH_RADIUS_AU * rho_sin
+    ra_topo = np.arctan2(y, x)
+    dec_topo = np.arctan2(z, np.hypot(x, y))
+
+    return equatorial_to_altaz(local_sidereal - ra_topo, dec_topo, lat)
+
+def equatorial_to_altaz(hour_angle, dec, lat):
+    """تحويل الزاوية الساعية والميل (بالراديان) إلى ارتفاع وسمت بالدرجات لخط عرض lat (بالراديان)."""
+    sin_alt = np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(hour_angle)
+    alt = np.degrees(np.arcsin(np.clip(sin_alt, -1, 1)))
+    az = np.degrees(np.arctan2(
+        -np.cos(dec) * np.sin(hour_angle),
+        np.sin(dec) * np.cos(lat) - np.cos(dec) * np.cos(hour_angle) * np.sin(lat)
+    )) % 360
+    return alt, az
+
+def find_sign_changes(values, rising=True):
+    """مؤشرات i حيث تعبر القيم الصفر بين i و i+1 صعوداً (أو هبوطاً)."""
+    if rising:
+        return np.nonzero((values[..., :-1] < 0) & (values[..., 1:] >= 0))
+    return np.nonzero((values[..., :-1] >= 0) & (values[..., 1:] < 0))
+
+def refine_crossings(func, tt_lo, tt_hi, f_lo, f_hi, iterations=4):
+    """
+    تحسين جذور func دفعة واحدة لكل الفترات [tt_lo, tt_hi] بطريقة Illinois (الوضع الخاطئ المعدَّل).
+    func تستقبل مصفوفة أوقات بطول الفترات نفسها وتعيد القيم المقابلة.
+    """
+    a, b = np.array(tt_lo, dtype=float), np.array(tt_hi, dtype=float)
+    fa, fb = np.array(f_lo, dtype=float), np.array(f_hi, dtype=float)
+    for _ in range(iterations):
+        denom = np.where(fb - fa == 0, 1e-12, fb - fa)
+        c = b - fb * (b - a) / denom
+        fc = func(c)
+        same_side = fc * fb > 0
+        a = np.where(same_side, a, b)
+        fa = np.where(same_side, fa / 2, fb)
+        b, fb = c, fc
+    denom = np.where(fb - fa == 0, 1e-12, fb - fa)
+    return b - fb * (b - a) / denom
+
+# -------------------------------------------------------------------
+# مظاهر الأفق المحلية: ارتفاع الأفق الحقيقي (جبال، مبانٍ) بحسب السمت لكل موقع
+HORIZON_STEP = 1.0                       # درجة بين عينات المظهر
+HORIZON_SAMPLES = int(round(360 / HORIZON_STEP))
+
+_horizon_cache = {}
+
+def _read_horizon_file(path):
+    """أزواج "السمت الارتفاع" بالدرجات سطراً سطراً (صيغة أفق Stellarium المضلّع)؛ # للتعليقات."""
+    points = []
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            parts = line.split("#", 1)[0].replace(",", " ").split()
+            if len(parts) < 2:
+                continue
+            try:
+                points.append((float(parts[0]) % 360.0, float(parts[1])))
+            except ValueError:
+                continue
+    return np.array(points, dtype=float).reshape(-1, 2)
+
+def load_horizon_profile(location_name, folder=HORIZON_FOLDER):
+    """
+    مظهر أفق الموقع من الملف horizons/<اسم الموقع>.txt: ارتفاع الأفق عند كل HORIZON_STEP درجة
+    من السمت (float32، 360 قيمة) بالاستيفاء الخطي بين نقاط الملف. None إن لم يوجد ملف (أفق مستوٍ).
+    يُقرأ الملف مرة واحدة ويُعاد قراءته فقط إذا تغيّر.
+    """
+    path = os.path.join(folder, f"{location_name}.txt")
+    if not os.path.exists(path):
+        _horizon_cache.pop(path, None)
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _horizon_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    points = _read_horizon_file(path)
+    if len(points):
+        order = np.argsort(points[:, 0], kind="stable")
+        grid = np.arange(HORIZON_SAMPLES) * HORIZON_STEP
+        profile = np.interp(grid, points[order, 0], points[order, 1], period=360.0).astype(np.float32)
     else:
-        sunrise_str = dt_local.strftime(fmt)
-    
-    if sunset_time:
-        if include_date and sunset_time.hour == 0:
-            sunset_str = (sunset_time + datetime.timedelta(days=1)).strftime(fmt)
+        profile = None
+    _horizon_cache[path] = (mtime, profile)
+    return profile
+
+def location_horizons(names):
+    """مظاهر أفق عدة مواقع كمصفوفة (المواقع، HORIZON_SAMPLES) بأصفار للأفق المستوي، أو None إن كانت كلها مستوية."""
+    profiles = [load_horizon_profile(name) for name in names]
+    if all(p is None for p in profiles):
+        return None
+    flat = np.zeros(HORIZON_SAMPLES, dtype=np.float32)
+    return np.stack([flat if p is None else p for p in profiles])
+
+def horizon_altitude(profile, az, rows=None):
+    """
+    ارتفاع الأفق المحلي بالدرجات عند كل سمت في az، بالاستيفاء الخطي في المظهر (عمليات NumPy فقط).
+    profile مظهر موقع واحد، أو مصفوفة (المواقع، HORIZON_SAMPLES) يقابل صفوفَها المحورُ الأول من az
+    (كما في horizon_crossings) ما لم يحدد rows صف كل عنصر. None يعني أفقاً مستوياً فيعيد 0.
+    """
+    if profile is None:
+        return 0.0
+    x = (np.asarray(az, dtype=float) % 360.0) / HORIZON_STEP
+    i0 = np.floor(x).astype(int)
+    frac = x - i0
+    i0 %= HORIZON_SAMPLES
+    i1 = (i0 + 1) % HORIZON_SAMPLES
+    if profile.ndim == 1:
+        return profile[i0] * (1 - frac) + profile[i1] * frac
+    if rows is None:
+        rows = np.arange(len(profile)).reshape((-1,) + (1,) * (x.ndim - 1))
+    return profile[rows, i0] * (1 - frac) + profile[rows, i1] * frac
+
+# -------------------------------------------------------------------
+# فهرس النجوم اللامعة
+STAR_CATALOGUE_FILE = "data/stars.npy"
+CONSTELLATION_LINES_FILE = "data/constellation_lines.npy"
+
+# أسماء أشهر النجوم حسب رقمها في فهرس هيبارخوس
+STAR_NAMES_AR = {
+    32349: "الشعرى اليمانية", 30438: "سهيل", 69673: "السماك الرامح", 91262: "النسر الواقع",
+    24608: "العيوق", 24436: "رجل الجبار", 37279: "الشعرى الشامية", 27989: "منكب الجوزاء",
+    7588: "آخر النهر", 97649: "النسر الطائر", 21421: "الدبران", 80763: "قلب العقرب",
+    65474: "السماك الأعزل", 37826: "رأس التوأم المؤخر", 113368: "فم الحوت",
+    102098: "ذنب الدجاجة", 49669: "قلب الأسد", 11767: "الجدي",
+}
+
+_star_catalogue = None
+
+def load_star_catalogue():
+    """
+    تحميل فهرس النجوم بالربط الذاكري (memory-map) مرة واحدة.
+    النجوم مرتبة حسب القدر، لذا فإن القطع حسب القدر الحدّي اقتطاع لبداية المصفوفة.
+    """
+    global _star_catalogue
+    if _star_catalogue is None:
+        stars = np.load(STAR_CATALOGUE_FILE, mmap_mode='r')
+        if os.path.exists(CONSTELLATION_LINES_FILE):
+            lines = np.load(CONSTELLATION_LINES_FILE, mmap_mode='r')
         else:
-            sunset_str = sunset_time.strftime(fmt)
-    else:
-        sunset_str = dt_local.strftime(fmt)
-    
-    sunrise_str = sunrise_str.replace("AM", "ص").replace("PM", "م")
-    sunset_str = sunset_str.replace("AM", "ص").replace("PM", "م")
-    
-    return sunrise_str, sunset_str
+            lines = np.empty((0, 2), dtype=np.int16)
+        ra = np.radians(stars['ra'].astype(float))
+        dec = np.radians(stars['dec'].astype(float))
+        vectors = np.array([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+        _star_catalogue = {"stars": stars, "vectors": vectors, "lines": lines}
+    return _star_catalogue
+
+def project_stars(t, lat_deg, lon_deg, limiting_magnitude=5.5):
+    """
+    ارتفاع وسمت كل النجوم الأسطع من القدر الحدّي عند اللحظة t دفعة واحدة.
+    تعيد (عدد النجوم المفحوصة، الارتفاع، السمت) بترتيب الفهرس.
+    """
+    catalogue = load_star_catalogue()
+    count = int(np.searchsorted(catalogue["stars"]['mag'], limiting_magnitude, side='right'))
+    # تحويل من ICRS إلى خط الاستواء الحقيقي للتاريخ (المبادرة والترنح)
+    v = t.M.dot(catalogue["vectors"][:, :count])
+    ra = np.arctan2(v[1], v[0])
+    dec = np.arcsin(np.clip(v[2], -1, 1))
+    hour_angle = np.radians(t.gast * 15 + lon_deg) - ra
+    alt, az = equatorial_to_altaz(hour_angle, dec, np.radians(lat_deg))
+    return count, alt, az
+
+class ScreenGridIndex:
+    """
+    فهرس شبكي لنقاط على الشاشة: تُقسَّم المساحة إلى خلايا ثابتة وتُرتَّب النقاط حسب خليتها،
+    فيصبح البحث عن أقرب نقطة لموضع اللمس فحصاً لتسع خلايا فقط.
+    """
+    def __init__(self, xs, ys, cell=24.0):
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.cell = cell
+        keys = self._keys(np.floor(self.xs / cell), np.floor(self.ys / cell))
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    @staticmethod
+    def _keys(cx, cy):
+        return cx.astype(np.int64) * 100003 + cy.astype(np.int64)
+
+    def nearest(self, x, y, max_distance=15.0):
+        cx, cy = int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+        candidates = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                key = self._keys(np.array([cx + dx]), np.array([cy + dy]))[0]
+                lo, hi = np.searchsorted(self.keys, [key, key + 1])
+                candidates.append(self.order[lo:hi])
+        candidates = np.concatenate(candidates)
+        if not len(candidates):
+            return None
+        dist = np.hypot(self.xs[candidates] - x, self.ys[candidates] - y)
+        best = int(np.argmin(dist))
+        return int(candidates[best]) if dist[best] <= max_distance else None
 
 def hex_to_rgba(hex_str, alpha=1.0):
     hex_str = hex_str.lstrip('#')
@@ -169,17 +853,6 @@ def hex_to_rgba(hex_str, alpha=1.0):
     b = int(hex_str[4:6], 16) / 255.0
     return (r, g, b, alpha)
 
-def calc_inner(outer_diameter, semi_phase):
-    abs_phase = abs(semi_phase)
-    n = (1 - abs_phase) * outer_diameter / 2 or 0.01
-    inner_radius = n/2 + (outer_diameter * outer_diameter) / (8 * n)
-    d = inner_radius * 2
-    if semi_phase > 0:
-        o = outer_diameter/2 - n
-    else:
-        o = -2 * inner_radius + outer_diameter/2 + n
-    return d, o
-
 def get_moon_phase_name(phase_angle, is_waxing):
     if phase_angle < 10 or phase_angle > 350:
         return "New Moon"
@@ -199,74 +872,2032 @@ def get_moon_phase_name(phase_angle, is_waxing):
         return "Waning Crescent" if is_waxing else "Waxing Crescent"
     return "Unknown"
 
+MOON_PHASE_AR = {
+    "New Moon": "قمر جديد",
+    "Waxing Crescent": "الهلال متزايد",
+    "First Quarter": "التربيع الأول",
+    "Waxing Gibbous": "الأحدب المتزايد",
+    "Full Moon": "البدر",
+    "Waning Gibbous": "أحدب متناقص",
+    "Last Quarter": "التربيع الأخير",
+    "Waning Crescent": "الهلال المتناقص",
+    "Unknown": "غير معروف"
+}
+
+# -------------------------------------------------------------------
+# فهرس أطوار القمر والتقويم الهجري
+HIJRI_MONTHS = [
+    "محرم", "صفر", "ربيع الأول", "ربيع الآخر", "جمادى الأولى", "جمادى الآخرة",
+    "رجب", "شعبان", "رمضان", "شوال", "ذو القعدة", "ذو الحجة"
+]
+PRINCIPAL_PHASES_AR = ["المحاق", "التربيع الأول", "البدر", "التربيع الأخير"]
+
+SYNODIC_MONTH = 29.530588861
+NEW_MOON_EPOCH_JD = 2451550.09766   # اقتران 6 يناير 2000 (k = 0 عند ميوس)
+HIJRI_LUNATION_OFFSET = 17037       # عدد الشهور الهجرية المنقضية عند k = 0 (شوال 1420)
+
+def ephemeris_span():
+    """يعيد (بداية، نهاية) مدى ملف التقويم الفلكي المحمَّل بصيغة TT."""
+    if isinstance(eph, AnalyticEphemeris):
+        return eph.span()
+    start, end = -np.inf, np.inf
+    for segment in eph.segments:
+        t0, t1 = segment.time_range(ts)
+        start = max(start, t0.tt)
+        end = min(end, t1.tt)
+    return start, end
+
+class LunarPhaseIndex:
+    """
+    فهرس مخزَّن لأوقات أطوار القمر الرئيسية ضمن المدى 1900–2100 الذي يدعمه DateAdjusterGroup،
+    مقصوراً على مدى التقويم الفلكي المحمَّل (DE421 حتى 2050، والتقويم التحليلي 1800–2050).
+    يُحسب كل عقد مرة واحدة فقط عند أول حاجة إليه ويُحفظ على القرص في ملف خاص بالمحرك،
+    فيصبح استخراج أي شهر بحثاً ثنائياً واقتطاعاً من المصفوفة.
+    """
+    YEAR_MIN = 1900
+    YEAR_MAX = 2100
+
+    def __init__(self, path=os.path.join(CACHE_FOLDER, f"lunar_phases_{EPHEMERIS_BACKEND}.npz")):
+        self.path = path
+        self.tt = np.empty(0)
+        self.phases = np.empty(0, dtype=np.int8)
+        self.decades = set()
+        # عقود قصّها مدى التقويم: تُحسب مرة في الجلسة ولا تُعلَّم مكتملة في الملف
+        self.partial_decades = set()
+        if os.path.exists(self.path):
+            try:
+                data = np.load(self.path)
+                self.tt = data["tt"]
+                self.phases = data["phases"]
+                self.decades = set(int(d) for d in data["decades"])
+            except Exception as e:
+                print("lunar phase cache unreadable, rebuilding. Error:", e)
+
+    def _save(self):
+        np.savez(self.path, tt=self.tt, phases=self.phases,
+                 decades=np.array(sorted(self.decades), dtype=np.int16))
+
+    def _build_decade(self, decade):
+        span_start, span_end = ephemeris_span()
+        decade_start, decade_end = ts.utc(decade, 1, 1).tt, ts.utc(decade + 10, 1, 1).tt
+        tt0 = max(decade_start, span_start)
+        tt1 = min(decade_end, span_end)
+        if tt0 < tt1:
+            times, phases = almanac.find_discrete(ts.tt_jd(tt0), ts.tt_jd(tt1), almanac.moon_phases(eph))
+            tt = np.concatenate([self.tt, times.tt])
+            ph = np.concatenate([self.phases, phases.astype(np.int8)])
+            order = np.argsort(tt)
+            tt, ph = tt[order], ph[order]
+            # حذف الأحداث المكررة على حدود العقود
+            keep = np.concatenate([[True], np.diff(tt) > 1e-3])
+            self.tt, self.phases = tt[keep], ph[keep]
+        if tt0 == decade_start and tt1 == decade_end:
+            self.decades.add(decade)
+        else:
+            self.partial_decades.add(decade)
+
+    def ensure_range(self, tt0, tt1):
+        year0 = max(self.YEAR_MIN, ts.tt_jd(tt0).utc.year)
+        year1 = min(self.YEAR_MAX, ts.tt_jd(tt1).utc.year)
+        missing = [d for d in range(year0 - year0 % 10, year1 + 1, 10)
+                   if d not in self.decades and d not in self.partial_decades]
+        for decade in missing:
+            self._build_decade(decade)
+        if missing:
+            self._save()
+
+    def new_moons(self):
+        return self.tt[self.phases == 0]
+
+    def phases_between(self, tt0, tt1):
+        i0, i1 = np.searchsorted(self.tt, [tt0, tt1])
+        return self.tt[i0:i1], self.phases[i0:i1]
+
+lunar_phase_index = LunarPhaseIndex()
+
+def hijri_month_number(conjunction_tt):
+    """يحوّل وقت الاقتران إلى (السنة الهجرية، رقم الشهر من 1 إلى 12) للشهر الذي يبدأ بعده."""
+    k = int(round((conjunction_tt - NEW_MOON_EPOCH_JD) / SYNODIC_MONTH))
+    count = k + HIJRI_LUNATION_OFFSET
+    return count // 12 + 1, count % 12 + 1
+
+def hijri_month_starts(conjunctions_tt, location, tz, criterion="conjunction"):
+    """
+    تحسب تاريخ بداية الشهر (بالتوقيت المحلي) لكل اقتران في المصفوفة.
+      - "conjunction": يبدأ الشهر في اليوم التالي لأول غروب بعد الاقتران.
+      - "crescent": يُشترط أيضاً عند ذلك الغروب ارتفاع القمر 5° واستطالته 8° على الأقل،
+        وإلا يُكمل الشهر السابق يوماً إضافياً.
+    """
+    t0 = ts.tt_jd(float(np.min(conjunctions_tt)))
+    t1 = ts.tt_jd(float(np.max(conjunctions_tt)) + 2.5)
+    times, events = almanac.find_discrete(t0, t1, almanac.sunrise_sunset(eph, location))
+    sunsets = times.tt[events == 0]
+    evenings = sunsets[np.searchsorted(sunsets, conjunctions_tt)]
+    extra_day = np.zeros(len(evenings), dtype=int)
+    if criterion == "crescent":
+        t = ts.tt_jd(evenings)
+        observer = eph['earth'] + location
+        moon_app = observer.at(t).observe(eph['moon']).apparent()
+        sun_app = observer.at(t).observe(eph['sun']).apparent()
+        alt, _, _ = moon_app.altaz()
+        elongation = moon_app.separation_from(sun_app).degrees
+        extra_day = np.where((alt.degrees >= 5) & (elongation >= 8), 0, 1)
+    starts = []
+    for evening_tt, extra in zip(evenings, extra_day):
+        evening_local = ts.tt_jd(evening_tt).utc_datetime().astimezone(tz)
+        starts.append(evening_local.date() + datetime.timedelta(days=1 + int(extra)))
+    return starts
+
+def compute_hijri_month(dt, offset=0, criterion="conjunction"):
+    """
+    تعيد بيانات الشهر الهجري الذي يقع فيه dt (أو الذي يبعد عنه offset شهراً):
+    بدايته وأيام الشهر مع نسبة إضاءة القمر واسم طوره لكل يوم، وأوقات الأطوار الرئيسية خلاله.
+    """
+    local_tz = get_location_timezone()
+    dt_local = dt if dt.tzinfo else local_tz.localize(dt)
+    tt = ts.from_datetime(dt_local.astimezone(pytz.UTC)).tt
+    margin = SYNODIC_MONTH * (abs(offset) + 2)
+    lunar_phase_index.ensure_range(tt - margin, tt + margin)
+    new_moons = lunar_phase_index.new_moons()
+
+    location = get_current_location()
+    i = int(np.searchsorted(new_moons, tt)) - 1
+    if i < 1 or i + 2 >= len(new_moons):
+        return None
+    candidates = new_moons[i - 1:i + 2]
+    starts = hijri_month_starts(candidates, location, local_tz, criterion)
+    # الاقتران الأخير قد لا يكون الشهر قد بدأ بعده في التاريخ المحدد
+    j = 1 if starts[1] <= dt_local.date() else 0
+    j += offset
+    idx = i - 1 + j
+    if idx < 0 or idx + 1 >= len(new_moons):
+        return None
+    if j in (0, 1):
+        start_date, end_date = starts[j], starts[j + 1]
+    else:
+        start_date, end_date = hijri_month_starts(new_moons[idx:idx + 2], location, local_tz, criterion)
+    hijri_year, hijri_month = hijri_month_number(new_moons[idx])
+
+    day_count = (end_date - start_date).days
+    day_times = [
+        local_tz.localize(datetime.datetime.combine(start_date + datetime.timedelta(days=n),
+                                                   datetime.time(dt_local.hour, dt_local.minute)))
+        for n in range(day_count)
+    ]
+    t_days = ts.from_datetimes([d.astimezone(pytz.UTC) for d in day_times])
+    illumination = almanac.fraction_illuminated(eph, "moon", t_days)
+    phase_angles = almanac.moon_phase(eph, t_days).degrees
+
+    days = []
+    for n, (day_dt, illum, angle) in enumerate(zip(day_times, illumination, phase_angles)):
+        name = get_moon_phase_name(angle, angle < 180)
+        days.append((n + 1, day_dt.date(), float(illum), MOON_PHASE_AR.get(name, name)))
+
+    t_start = ts.from_datetime(local_tz.localize(datetime.datetime.combine(start_date, datetime.time())))
+    t_end = ts.from_datetime(local_tz.localize(datetime.datetime.combine(end_date, datetime.time())))
+    phase_tt, phase_ids = lunar_phase_index.phases_between(t_start.tt, t_end.tt)
+    principal = [(PRINCIPAL_PHASES_AR[p], ts.tt_jd(x).utc_datetime().astimezone(local_tz))
+                 for x, p in zip(phase_tt, phase_ids)]
+
+    return {
+        "year": hijri_year,
+        "month": hijri_month,
+        "start": start_date,
+        "days": days,
+        "phases": principal,
+    }
+
+# -------------------------------------------------------------------
+# جدول الشفق ومواقيت الصلاة
+PRAYER_EVENTS = [
+    ("fajr", "الفجر"),
+    ("sunrise", "الشروق"),
+    ("noon", "الظهر"),
+    ("asr", "العصر"),
+    ("sunset", "المغرب"),
+    ("isha", "العشاء"),
+]
+TWILIGHT_EVENTS = [
+    ("astronomical_dawn", "بداية الشفق الفلكي"),
+    ("nautical_dawn", "بداية الشفق البحري"),
+    ("civil_dawn", "بداية الشفق المدني"),
+    ("civil_dusk", "نهاية الشفق المدني"),
+    ("nautical_dusk", "نهاية الشفق البحري"),
+    ("astronomical_dusk", "نهاية الشفق الفلكي"),
+]
+SUNRISE_ALTITUDE = -0.8333
+
+SOLAR_TIMETABLE_CACHE_SIZE = 8   # كل تعديل لزاوية الفجر أو العشاء مفتاح جديد؛ يُحذف الأقدم استخداماً
+_solar_timetable_cache = OrderedDict()
+_solar_timetable_lock = threading.Lock()
+
+def tt_to_local(tt_values, tz):
+    """يحوّل مصفوفة أوقات TT إلى قائمة datetime محلية (None للقيم المفقودة)."""
+    tt_values = np.atleast_1d(np.asarray(tt_values, dtype=float))
+    result = [None] * len(tt_values)
+    valid = np.nonzero(~np.isnan(tt_values))[0]
+    if len(valid):
+        for i, unix in zip(valid, time_to_unix(ts.tt_jd(tt_values[valid]))):
+            result[i] = unix_to_local(unix, tz)
+    return result
+
+def tt_to_local_seconds(tt_values, tz):
+    """وقت الساعة المحلية بتوقيت tz (ثوانٍ منذ 1970) لمصفوفة أوقات TT بأي شكل؛ NaN يبقى NaN."""
+    tt_values = np.asarray(tt_values, dtype=float)
+    result = np.full(tt_values.shape, np.nan)
+    valid = ~np.isnan(tt_values)
+    if np.any(valid):
+        unix = time_to_unix(ts.tt_jd(tt_values[valid]))
+        result[valid] = unix + utc_offsets(tz, unix)
+    return result
+
+def format_clock(local_seconds, missing="—"):
+    """نصوص "hh:mm ص/م" لمصفوفة أوقات محلية بالثواني، محسوبة حسابياً دون datetime."""
+    local_seconds = np.ravel(local_seconds)
+    minutes = np.floor(np.nan_to_num(local_seconds) / 60).astype(np.int64)
+    hours = (minutes // 60) % 24
+    hours12 = np.where(hours % 12 == 0, 12, hours % 12)
+    return [missing if np.isnan(s) else f"{h12:02d}:{m:02d} {'ص' if h < 12 else 'م'}"
+            for s, h, h12, m in zip(local_seconds, hours, hours12, minutes % 60)]
+
+def compute_solar_timetable(year, location=None, tz=None, fajr_angle=18.0, isha_angle=18.0,
+                            asr_factor=1, step_minutes=5):
+    """
+    يحسب جدولاً سنوياً كاملاً لأحداث الشمس لموقع واحد: الفجر والشروق والظهر والعصر والمغرب والعشاء
+    وأطوار الشفق المدني والبحري والفلكي.
+    يُحسب ارتفاع الشمس مرة واحدة على شبكة زمنية كثيفة، ثم تُحسَّن كل العبورات معاً بخطوات متجهة.
+    النتيجة قاموس يحوي التواريخ ومصفوفة أوقات TT لكل حدث (NaN إن لم يقع الحدث في ذلك اليوم).
+    """
+    location = location or get_current_location()
+    tz = tz or get_location_timezone()
+    lat = location.latitude.degrees
+    lon = location.longitude.degrees
+    key = (year, round(lat, 4), round(lon, 4), tz.zone, fajr_angle, isha_angle, asr_factor)
+    with _solar_timetable_lock:
+        table = _solar_timetable_cache.get(key)
+        if table is not None:
+            _solar_timetable_cache.move_to_end(key)
+            return table
+
+    n_days = 366 if calendar.isleap(year) else 365
+    day0 = ts.from_datetime(tz.localize(datetime.datetime(year, 1, 1)).astimezone(pytz.UTC)).tt
+    step = step_minutes / 1440.0
+    track = BodyTrack(eph['sun'], day0 - 1, day0 + n_days + 1)
+    tt = np.arange(day0, day0 + n_days + step, step)
+    alt, _ = track.altaz(tt, lat, lon)
+    sample_day = np.clip(np.floor(tt - day0).astype(int), 0, n_days - 1)
+
+    events = {name: np.full(n_days, np.nan) for name, _ in PRAYER_EVENTS + TWILIGHT_EVENTS}
+
+    def store(name, roots):
+        day = np.floor(roots - day0).astype(int)
+        ok = (day >= 0) & (day < n_days)
+        events[name][day[ok]] = roots[ok]
+
+    # الظهر: عبور الزاوية الساعية للصفر صعوداً
+    hour_angle = track.hour_angle(tt, lon)
+    idx = find_sign_changes(hour_angle, rising=True)[0]
+    idx = idx[hour_angle[idx + 1] - hour_angle[idx] < np.pi]
+    noon = refine_crossings(lambda x: track.hour_angle(x, lon),
+                            tt[idx], tt[idx + 1], hour_angle[idx], hour_angle[idx + 1])
+    store("noon", noon)
+
+    # العصر: ارتفاع تساوي عنده نسبة الظل asr_factor مضافاً إليها ظل الزوال
+    noon_alt, _ = track.altaz(events["noon"], lat, lon)
+    asr_alt = np.degrees(np.arctan(1.0 / (asr_factor + 1.0 / np.tan(np.radians(noon_alt)))))
+
+    crossings = [
+        ("astronomical_dawn", -18.0, True), ("nautical_dawn", -12.0, True),
+        ("civil_dawn", -6.0, True), ("fajr", -fajr_angle, True),
+        ("sunrise", SUNRISE_ALTITUDE, True), ("asr", asr_alt[sample_day], False),
+        ("sunset", SUNRISE_ALTITUDE, False), ("isha", -isha_angle, False),
+        ("civil_dusk", -6.0, False), ("nautical_dusk", -12.0, False),
+        ("astronomical_dusk", -18.0, False),
+    ]
+    names, lo_idx, thresholds = [], [], []
+    for name, threshold, rising in crossings:
+        threshold = np.broadcast_to(threshold, tt.shape)
+        with np.errstate(invalid='ignore'):
+            idx = find_sign_changes(alt - threshold, rising)[0]
+        names.append((name, len(idx)))
+        lo_idx.append(idx)
+        thresholds.append(threshold[idx])
+    idx = np.concatenate(lo_idx)
+    thr = np.concatenate(thresholds)
+    roots = refine_crossings(lambda x: track.altaz(x, lat, lon)[0] - thr,
+                             tt[idx], tt[idx + 1], alt[idx] - thr, alt[idx + 1] - thr)
+    start = 0
+    for name, count in names:
+        store(name, roots[start:start + count])
+        start += count
+
+    table = {
+        "year": year,
+        "tz": tz,
+        "dates": [datetime.date(year, 1, 1) + datetime.timedelta(days=i) for i in range(n_days)],
+        "events": events,
+    }
+    with _solar_timetable_lock:
+        _solar_timetable_cache[key] = table
+        while len(_solar_timetable_cache) > SOLAR_TIMETABLE_CACHE_SIZE:
+            _solar_timetable_cache.popitem(last=False)
+    return table
+
+def export_solar_timetable_csv(table, path):
+    columns = PRAYER_EVENTS + TWILIGHT_EVENTS
+    local_times = {name: tt_to_local(table["events"][name], table["tz"]) for name, _ in columns}
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["التاريخ"] + [label for _, label in columns])
+        for i, date_ in enumerate(table["dates"]):
+            row = [date_.isoformat()]
+            for name, _ in columns:
+                value = local_times[name][i]
+                row.append(value.strftime("%H:%M:%S") if value else "")
+            writer.writerow(row)
+    return path
+
+# -------------------------------------------------------------------
+# مقارنة المواقع: شروق وغروب الشمس والقمر لكل المواقع دفعة واحدة
+COMPARISON_EVENTS = [
+    ("sunrise", "sun", True), ("sunset", "sun", False),
+    ("moonrise", "moon", True), ("moonset", "moon", False),
+]
+COMPARISON_STEP_MINUTES = 10
+
+_location_comparison_cache = {}
+
+def horizon_crossings(track, tt, lat, lon, rising, horizon=SUNRISE_ALTITUDE, profiles=None):
+    """
+    عبورات الجرم للأفق (صعوداً أو هبوطاً) على الشبكة tt لكل المواقع (lat, lon) دفعة واحدة.
+    profiles (اختياري) مظاهر أفق المواقع كما تعيدها location_horizons، تُضاف إلى horizon بحسب سمت الجرم.
+    تعيد مؤشر الموقع ولحظة العبور بتوقيت TT لكل عبور، مرتبة حسب الموقع ثم الزمن.
+    """
+    lat, lon = np.atleast_1d(lat), np.atleast_1d(lon)
+    alt, az = track.altaz(tt, lat[:, None], lon[:, None])
+    alt = alt - horizon - horizon_altitude(profiles, az)
+    loc_idx, t_idx = find_sign_changes(alt, rising)
+
+    def above_horizon(x):
+        a, z = track.altaz(x, lat[loc_idx], lon[loc_idx])
+        return a - horizon - horizon_altitude(profiles, z, loc_idx)
+
+    roots = refine_crossings(above_horizon, tt[t_idx], tt[t_idx + 1],
+                             alt[loc_idx, t_idx], alt[loc_idx, t_idx + 1])
+    return loc_idx, roots
+
+def local_midnight_tt(date_, tz):
+    """بداية اليوم المحلي date_ بتوقيت tz كلحظة TT."""
+    midnight = tz.localize(datetime.datetime(date_.year, date_.month, date_.day))
+    return ts.from_datetime(midnight.astimezone(pytz.UTC)).tt
+
+def compute_location_comparison(date_, names=None):
+    """
+    أول شروق وغروب للشمس والقمر خلال اليوم المحلي date_ لكل المواقع (افتراضياً كل OMAN_LOCATIONS)،
+    واليوم المحلي لكل موقع بمنطقته الزمنية.
+    المواقع بُعد إضافي في المصفوفات: يُحسب ارتفاع الجرمين على شبكة تغطي أيام كل المواقع معاً،
+    ثم تُحسَّن كل العبورات في استدعاء واحد لـ refine_crossings.
+    الأفق للجرمين هو SUNRISE_ALTITUDE (الحافة العليا مع الانكسار) فوق مظهر أفق كل موقع إن وُجد،
+    واختلاف منظر القمر محسوب في BodyTrack.
+    النتيجة قاموس بالأسماء والمناطق والإحداثيات ومصفوفة أوقات TT لكل حدث (NaN إن لم يقع)،
+    ومسار القمر لحساب ارتفاعه الحالي عبر location_comparison_moon_altitude.
+    """
+    names = list(names or OMAN_LOCATIONS)
+    profiles = location_horizons(names)
+    key = (date_, tuple(names), None if profiles is None else hashlib.sha1(profiles.tobytes()).hexdigest())
+    if key in _location_comparison_cache:
+        return _location_comparison_cache[key]
+
+    locations = [Topos(*OMAN_LOCATIONS[name]) for name in names]
+    lat = np.array([loc.latitude.degrees for loc in locations])
+    lon = np.array([loc.longitude.degrees for loc in locations])
+    zones = [get_location_timezone(name) for name in names]
+    midnights = {tz.zone: local_midnight_tt(date_, tz) for tz in set(zones)}
+    day0 = np.array([midnights[tz.zone] for tz in zones])
+    step = COMPARISON_STEP_MINUTES / 1440.0
+    tt = np.arange(day0.min(), day0.max() + 1 + step, step)
+    tracks = {body: BodyTrack(eph[body], tt[0], tt[-1]) for body in ("sun", "moon")}
+
+    events = {}
+    for name, body, rising in COMPARISON_EVENTS:
+        loc_idx, roots = horizon_crossings(tracks[body], tt, lat, lon, rising, profiles=profiles)
+        in_day = (roots >= day0[loc_idx]) & (roots < day0[loc_idx] + 1)
+        loc_idx, roots = loc_idx[in_day], roots[in_day]
+        # أول عبور لكل موقع: النتائج مرتبة حسب الموقع ثم الزمن
+        first = np.full(len(names), np.nan)
+        unique_loc, first_idx = np.unique(loc_idx, return_index=True)
+        first[unique_loc] = roots[first_idx]
+        events[name] = first
+
+    result = {
+        "date": date_,
+        "names": names,
+        "zones": zones,
+        "lat": lat,
+        "lon": lon,
+        "events": events,
+        "moon_track": tracks["moon"],
+    }
+    _location_comparison_cache[key] = result
+    return result
+
+def location_comparison_clock(comparison, event):
+    """نصوص أوقات الحدث لكل المواقع، كل موقع بساعته المحلية (تحويل متجه لكل منطقة)."""
+    values = comparison["events"][event]
+    local = np.full(len(values), np.nan)
+    zones = np.array([tz.zone for tz in comparison["zones"]])
+    for tz in {tz.zone: tz for tz in comparison["zones"]}.values():
+        sel = zones == tz.zone
+        local[sel] = tt_to_local_seconds(values[sel], tz)
+    return format_clock(local)
+
+def location_comparison_moon_altitude(comparison, dt):
+    """ارتفاع القمر (مع الانكسار) عند dt لكل مواقع المقارنة."""
+    tt = ts.from_datetime(dt.astimezone(pytz.UTC)).tt
+    track = comparison["moon_track"]
+    if not track.sample_tt[0] <= tt <= track.sample_tt[-1]:
+        track = BodyTrack(eph["moon"], tt, tt)
+    alt, _ = track.altaz(tt, comparison["lat"], comparison["lon"])
+    return np.array([apply_refraction_correction(a) for a in alt])
+
+# -------------------------------------------------------------------
+# مسار الشمس السنوي: شبكة ارتفاع وسمت لكل دقيقة من كل يوم
+SUN_PATH_MINUTES = 1440
+SUN_PATH_CACHE_FILES = 6    # كل ملف نحو 4 م.ب (سنة لموقع واحد)؛ يُحذف الأقدم استخداماً عند تجاوز العدد
+
+_sun_path_cache = {}
+
+def _evict_sun_path_files(keep):
+    """يُبقي أحدث SUN_PATH_CACHE_FILES ملفات sunpath_*.npy استخداماً (حسب وقت التعديل) ويحذف الباقي."""
+    files = [os.path.join(CACHE_FOLDER, f) for f in os.listdir(CACHE_FOLDER)
+             if f.startswith("sunpath_") and f.endswith(".npy")]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[SUN_PATH_CACHE_FILES:]:
+        if path == keep:
+            continue
+        _sun_path_cache.pop(path, None)
+        try:
+            os.remove(path)
+        except OSError as e:
+            print("could not evict sun path cache file:", e)
+
+def sun_path_grid(year, location=None, tz=None):
+    """
+    مصفوفة float32 بالشكل (أيام السنة، 1440، 2) تحوي ارتفاع الشمس وسمتها بالدرجات لكل دقيقة
+    من الوقت المحلي. تُحسب باستدعاء متجه واحد لـ BodyTrack وتُحفظ على القرص لكل موقع وسنة،
+    ثم تُفتح لاحقاً بالربط بالذاكرة (mmap) دون قراءتها كاملة.
+    """
+    location = location or get_current_location()
+    tz = tz or get_location_timezone()
+    lat = location.latitude.degrees
+    lon = location.longitude.degrees
+    path = os.path.join(CACHE_FOLDER, f"sunpath_{year}_{lat:.4f}_{lon:.4f}_{tz.zone.replace('/', '-')}.npy")
+    if path in _sun_path_cache:
+        return _sun_path_cache[path]
+
+    grid = None
+    if os.path.exists(path):
+        try:
+            grid = np.load(path, mmap_mode='r')
+            os.utime(path)   # آخر استخدام، لترتيب الحذف في _evict_sun_path_files
+        except Exception as e:
+            print("sun path cache unreadable, rebuilding. Error:", e)
+    if grid is None:
+        n_days = 366 if calendar.isleap(year) else 365
+        day0 = ts.from_datetime(tz.localize(datetime.datetime(year, 1, 1)).astimezone(pytz.UTC)).tt
+        track = BodyTrack(eph['sun'], day0 - 1, day0 + n_days + 1)
+        tt = day0 + np.arange(n_days * SUN_PATH_MINUTES) / SUN_PATH_MINUTES
+        alt, az = track.altaz(tt, lat, lon)
+        grid = np.stack([alt, az], axis=-1).astype(np.float32).reshape(n_days, SUN_PATH_MINUTES, 2)
+        np.save(path, grid)
+        _evict_sun_path_files(keep=path)
+    _sun_path_cache[path] = grid
+    return grid
+
+# -------------------------------------------------------------------
+# ارتفاعات الأجرام خلال الليل على شبكة زمنية
+NIGHT_BODIES = [
+    ('moon', 'القمر', "#eeeeee"),
+    ('mercury', 'عطارد', "#b0bec5"),
+    ('venus', 'الزهرة', "#fff59d"),
+    ('mars', 'المريخ', "#ff7043"),
+    ('JUPITER BARYCENTER', 'المشتري', "#ffcc80"),
+    ('SATURN BARYCENTER', 'زحل', "#d4e157"),
+    ('Uranus BARYCENTER', 'أورانوس', "#80deea"),
+    ('Neptune BARYCENTER', 'نبتون', "#7986cb"),
+]
+NIGHT_START_HOUR = 16      # تبدأ الشبكة الساعة 4 مساءً بالتوقيت المحلي
+NIGHT_HOURS = 16           # وتنتهي الساعة 8 صباح اليوم التالي
+NIGHT_STEP_MINUTES = 5
+
+_night_altitude_cache = {}
+
+def compute_night_altitudes(date_, location=None, tz=None, nights=1):
+    """
+    ارتفاع الشمس وكل أجرام NIGHT_BODIES على شبكة كل 5 دقائق لليلة date_ (ولليالي التالية إن طلبت nights).
+    يُقيَّم كل جرم باستدعاء observe واحد على مصفوفة الأوقات كلها. الأوقات بالشكل (nights, samples)،
+    والنتيجة قاموس بـ tt وارتفاع الشمس sun وقاموسي altitudes و elongations (البعد عن الشمس)
+    لكل جرم بالشكل نفسه.
+    """
+    location = location or get_current_location()
+    tz = tz or get_location_timezone()
+    lat = location.latitude.degrees
+    lon = location.longitude.degrees
+    key = (date_, nights, round(lat, 4), round(lon, 4), str(tz))
+    if key in _night_altitude_cache:
+        return _night_altitude_cache[key]
+
+    samples = NIGHT_HOURS * 60 // NIGHT_STEP_MINUTES + 1
+    starts = [tz.localize(datetime.datetime(date_.year, date_.month, date_.day, NIGHT_START_HOUR)
+                          + datetime.timedelta(days=i)) for i in range(nights)]
+    start_tt = ts.from_datetimes([d.astimezone(pytz.UTC) for d in starts]).tt
+    tt = start_tt[:, None] + np.arange(samples) * (NIGHT_STEP_MINUTES / 1440.0)
+    t = ts.tt_jd(tt.ravel())
+    observer = (eph['earth'] + location).at(t)
+    sun = observer.observe(eph['sun']).apparent()
+
+    altitudes, elongations = {}, {}
+    for body, _, _ in NIGHT_BODIES:
+        apparent = observer.observe(eph[body]).apparent()
+        altitudes[body] = apparent.altaz()[0].degrees.reshape(tt.shape)
+        elongations[body] = apparent.separation_from(sun).degrees.reshape(tt.shape)
+
+    result = {
+        "date": date_,
+        "tz": tz,
+        "starts": starts,
+        "tt": tt,
+        "sun": sun.altaz()[0].degrees.reshape(tt.shape),
+        "altitudes": altitudes,
+        "elongations": elongations,
+    }
+    _night_altitude_cache[key] = result
+    return result
+
+def mask_intervals(mask):
+    """
+    الفترات المتصلة التي تكون فيها mask صحيحة على امتداد المحور الأخير لمصفوفة ثنائية الأبعاد.
+    تعيد (الصف، بداية الفترة، نهايتها) حيث النهاية آخر عينة صحيحة.
+    """
+    padded = np.pad(mask.astype(np.int8), ((0, 0), (1, 1)))
+    edges = np.diff(padded, axis=-1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends - 1
+
+def plan_observations(date_, nights=1, min_altitude=15.0, sun_depression=12.0, location=None, tz=None):
+    """
+    نافذة الرصد لكل جرم في كل ليلة: أطول فترة يكون فيها الجرم أعلى من min_altitude والشمس تحت
+    الأفق بأكثر من sun_depression، مع لحظة أعلى ارتفاع داخلها والبعد عن الشمس عندها.
+    الشرطان قناعان منطقيان على شبكة compute_night_altitudes، فيُحسب كل شيء بتمريرة متجهة واحدة.
+    النتيجة قاموس {الجرم: قائمة بطول nights}، كل عنصر None أو قاموس بـ start و end و best (TT)
+    و minutes و altitude و elongation.
+    """
+    night = compute_night_altitudes(date_, location=location, tz=tz, nights=nights)
+    tt = night["tt"]
+    dark = night["sun"] < -sun_depression
+    plan = {}
+    for key, _, _ in NIGHT_BODIES:
+        alt = night["altitudes"][key]
+        usable = dark & (alt >= min_altitude)
+        rows, starts, ends = mask_intervals(usable)
+        # أطول فترة في كل ليلة: ترتيب حسب الطول ثم أخذ آخر فترة لكل صف
+        order = np.lexsort((ends - starts, rows))
+        rows, starts, ends = rows[order], starts[order], ends[order]
+        last = np.flatnonzero(np.append(rows[1:] != rows[:-1], len(rows) > 0))
+
+        windows = [None] * nights
+        for row, start, end in zip(rows[last], starts[last], ends[last]):
+            best = start + int(np.argmax(alt[row, start:end + 1]))
+            windows[row] = {
+                "start": tt[row, start],
+                "end": tt[row, end],
+                "best": tt[row, best],
+                "minutes": int(end - start) * NIGHT_STEP_MINUTES,
+                "altitude": float(alt[row, best]),
+                "elongation": float(night["elongations"][key][row, best]),
+            }
+        plan[key] = windows
+    return plan
+
+# -------------------------------------------------------------------
+# محرك الأحداث الفلكية: اقترانات، تقابلات، استطالات عظمى، فصول
+
+EVENT_BODIES = [
+    ('sun', 'الشمس'),
+    ('moon', 'القمر'),
+    ('mercury', 'عطارد'),
+    ('venus', 'الزهرة'),
+    ('mars', 'المريخ'),
+    ('JUPITER BARYCENTER', 'المشتري'),
+    ('SATURN BARYCENTER', 'زحل'),
+    ('Uranus BARYCENTER', 'أورانوس'),
+    ('Neptune BARYCENTER', 'نبتون'),
+]
+SUN, MOON = 0, 1
+PLANETS = list(range(2, len(EVENT_BODIES)))
+INNER_PLANETS = [2, 3]
+OUTER_PLANETS = PLANETS[2:]
+
+EVENT_CONJUNCTION, EVENT_MOON_APPROACH, EVENT_OPPOSITION, EVENT_ELONGATION, EVENT_SEASON = range(5)
+EVENT_KINDS_AR = ["اقتران كوكبين", "اقتراب القمر", "تقابل", "أقصى استطالة", "الفصول"]
+SEASONS_AR = ["الاعتدال الربيعي", "الانقلاب الصيفي", "الاعتدال الخريفي", "الانقلاب الشتوي"]
+
+EVENT_DTYPE = np.dtype([('tt', '<f8'), ('kind', 'i1'), ('body1', 'i1'), ('body2', 'i1'), ('value', '<f4')])
+
+CONJUNCTION_MAX_SEPARATION = 5.0   # بالدرجات
+MIN_SOLAR_ELONGATION = 12.0        # الاقترانات الأقرب من ذلك إلى الشمس لا تُرصد فلا تُدرج
+
+def ecliptic_vectors(body_idx, tt):
+    """
+    المتجه الواحدي وخط الطول البروجي (للتاريخ، بالراديان) للجرم body_idx[i] عند tt[i].
+    تُجمع الأوقات حسب الجرم فيُستدعى Skyfield مرة واحدة لكل جرم.
+    """
+    body_idx = np.broadcast_to(body_idx, np.shape(tt))
+    vectors = np.empty(np.shape(tt) + (3,))
+    lon = np.empty(np.shape(tt))
+    for b in np.unique(body_idx):
+        sel = body_idx == b
+        t = ts.tt_jd(np.asarray(tt)[sel])
+        lat_b, lon_b, _ = eph['earth'].at(t).observe(eph[EVENT_BODIES[b][0]]).apparent().frame_latlon(ecliptic_frame)
+        cos_lat = np.cos(lat_b.radians)
+        vectors[sel] = np.stack([cos_lat * np.cos(lon_b.radians), cos_lat * np.sin(lon_b.radians),
+                                 np.sin(lat_b.radians)], axis=-1)
+        lon[sel] = lon_b.radians
+    return vectors, lon
+
+def angular_separation(u, v):
+    return np.degrees(np.arccos(np.clip(np.sum(u * v, axis=-1), -1.0, 1.0)))
+
+def _wrap_angle(x):
+    return (x + np.pi) % (2 * np.pi) - np.pi
+
+def _local_extrema(values, maxima=False):
+    """مؤشرات (الصف، العمود) للنهايات الصغرى (أو العظمى) الداخلية على امتداد المحور الأخير."""
+    mid = values[..., 1:-1]
+    if maxima:
+        found = (mid > values[..., :-2]) & (mid >= values[..., 2:])
+    else:
+        found = (mid < values[..., :-2]) & (mid <= values[..., 2:])
+    rows, cols = np.nonzero(found)
+    return rows, cols + 1
+
+class AstronomicalEventIndex:
+    """
+    فهرس الأحداث الفلكية القادمة مخزَّن سنة بسنة على القرص.
+    تُحسب السنوات الناقصة المتتالية في تمريرة واحدة: تُؤخذ مواضع كل الأجرام على شبكة كل ست ساعات،
+    ثم تُستخرج كل المسافات الزاوية الثنائية والاستطالات وفروق خطوط الطول كمصفوفات NumPy،
+    ولا يُعاد حساب المواضع الدقيقة إلا حول النهايات والعبورات المرشحة.
+    """
+    STEP_DAYS = 0.25
+    DERIVATIVE_STEP = 1e-3   # يوم؛ لحساب ميل المسافة الزاوية عند تحسين النهايات
+
+    def __init__(self, path=os.path.join(CACHE_FOLDER, f"events_{EPHEMERIS_BACKEND}.npz")):
+        self.path = path
+        self.events = np.empty(0, dtype=EVENT_DTYPE)
+        self.years = set()
+        # سنوات قصّها مدى التقويم: تبقى أحداثها في الذاكرة فقط ولا تُعلَّم مكتملة في الملف
+        self.partial_years = set()
+        if os.path.exists(self.path):
+            try:
+                data = np.load(self.path)
+                self.events = data["events"]
+                self.years = set(int(y) for y in data["years"])
+            except Exception as e:
+                print("event cache unreadable, rebuilding. Error:", e)
+
+    def _save(self):
+        events = self.events
+        for year in self.partial_years:
+            tt0, tt1 = ts.utc(year, 1, 1).tt, ts.utc(year + 1, 1, 1).tt
+            events = events[(events['tt'] < tt0) | (events['tt'] >= tt1)]
+        np.savez(self.path, events=events, years=np.array(sorted(self.years), dtype=np.int16))
+
+    def _refine_extrema(self, body_a, body_b, lo, hi):
+        """يحسّن موضع النهاية كجذر لميل المسافة الزاوية بين body_a و body_b داخل [lo, hi]."""
+        h = self.DERIVATIVE_STEP
+        n = len(lo)
+        pair_a = np.concatenate([body_a, body_a])
+        pair_b = np.concatenate([body_b, body_b])
+
+        def slope(x):
+            tt = np.concatenate([x + h, x - h])
+            u, _ = ecliptic_vectors(pair_a, tt)
+            v, _ = ecliptic_vectors(pair_b, tt)
+            sep = angular_separation(u, v)
+            return sep[:n] - sep[n:]
+
+        root = refine_crossings(slope, lo, hi, slope(lo), slope(hi))
+        u, _ = ecliptic_vectors(body_a, root)
+        v, _ = ecliptic_vectors(body_b, root)
+        return root, angular_separation(u, v)
+
+    def _build_years(self, year0, year1):
+        span_start, span_end = ephemeris_span()
+        tt0 = max(ts.utc(year0, 1, 1).tt, span_start + 1)
+        tt1 = min(ts.utc(year1 + 1, 1, 1).tt, span_end - 1)
+        if tt0 >= tt1:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        step = self.STEP_DAYS
+        tt = np.arange(tt0 - 2 * step, tt1 + 2 * step, step)
+        n_bodies = len(EVENT_BODIES)
+        vectors, lon = ecliptic_vectors(np.repeat(np.arange(n_bodies), len(tt)), np.tile(tt, n_bodies))
+        vectors = vectors.reshape(n_bodies, len(tt), 3)
+        lon = lon.reshape(n_bodies, len(tt))
+        found = []
+
+        # المسافات الزاوية الثنائية: كل أزواج الكواكب، والقمر مع كل كوكب
+        pairs = [(a, b) for i, a in enumerate(PLANETS) for b in PLANETS[i + 1:]] + [(MOON, p) for p in PLANETS]
+        pair_a = np.array([a for a, _ in pairs])
+        pair_b = np.array([b for _, b in pairs])
+        separation = angular_separation(vectors[pair_a], vectors[pair_b])
+        rows, cols = _local_extrema(separation)
+        keep = separation[rows, cols] < CONJUNCTION_MAX_SEPARATION + 1.0
+        rows, cols = rows[keep], cols[keep]
+        if len(rows):
+            when, sep = self._refine_extrema(pair_a[rows], pair_b[rows], tt[cols - 1], tt[cols + 1])
+            planet, _ = ecliptic_vectors(pair_b[rows], when)
+            sun, _ = ecliptic_vectors(SUN, when)
+            elong = angular_separation(planet, sun)
+            ok = (sep < CONJUNCTION_MAX_SEPARATION) & (elong > MIN_SOLAR_ELONGATION)
+            kind = np.where(pair_a[rows] == MOON, EVENT_MOON_APPROACH, EVENT_CONJUNCTION)
+            found.append((when[ok], kind[ok], pair_a[rows][ok], pair_b[rows][ok], sep[ok]))
+
+        # الاستطالات العظمى لعطارد والزهرة (موجبة شرقاً أي في سماء المساء)
+        inner = np.array(INNER_PLANETS)
+        elongation = angular_separation(vectors[inner], vectors[SUN][None])
+        rows, cols = _local_extrema(elongation, maxima=True)
+        if len(rows):
+            when, elong = self._refine_extrema(inner[rows], np.full(len(rows), SUN), tt[cols - 1], tt[cols + 1])
+            _, lon_p = ecliptic_vectors(inner[rows], when)
+            _, lon_s = ecliptic_vectors(np.full(len(rows), SUN), when)
+            elong = np.where(_wrap_angle(lon_p - lon_s) > 0, elong, -elong)
+            found.append((when, np.full(len(rows), EVENT_ELONGATION), np.full(len(rows), SUN), inner[rows], elong))
+
+        # عبورات خط الطول: التقابل (فرق 180° عن الشمس) والفصول (خط طول الشمس مضاعفات 90°)
+        crossings = [(EVENT_OPPOSITION, p, _wrap_angle(lon[p] - lon[SUN] - np.pi), 0) for p in OUTER_PLANETS]
+        crossings += [(EVENT_SEASON, SUN, _wrap_angle(lon[SUN] - k * np.pi / 2), k) for k in range(4)]
+        for kind, body, diff, tag in crossings:
+            idx = np.nonzero((np.sign(diff[:-1]) != np.sign(diff[1:])) & (np.abs(diff[1:] - diff[:-1]) < np.pi))[0]
+            if not len(idx):
+                continue
+
+            def offset(x, body=body, tag=tag, kind=kind):
+                _, lon_b = ecliptic_vectors(body, x)
+                if kind == EVENT_SEASON:
+                    return _wrap_angle(lon_b - tag * np.pi / 2)
+                _, lon_s = ecliptic_vectors(SUN, x)
+                return _wrap_angle(lon_b - lon_s - np.pi)
+
+            when = refine_crossings(offset, tt[idx], tt[idx + 1], diff[idx], diff[idx + 1])
+            found.append((when, np.full(len(idx), kind), np.full(len(idx), SUN), np.full(len(idx), body),
+                          np.full(len(idx), tag)))
+
+        events = np.empty(sum(len(f[0]) for f in found), dtype=EVENT_DTYPE)
+        start = 0
+        for when, kind, body1, body2, value in found:
+            end = start + len(when)
+            events['tt'][start:end] = when
+            events['kind'][start:end] = kind
+            events['body1'][start:end] = body1
+            events['body2'][start:end] = body2
+            events['value'][start:end] = value
+            start = end
+        events = events[(events['tt'] >= tt0) & (events['tt'] < tt1)]
+        return events[np.argsort(events['tt'])]
+
+    def ensure_years(self, year0, year1):
+        missing = [y for y in range(year0, year1 + 1) if y not in self.years and y not in self.partial_years]
+        if not missing:
+            return
+        # كل مجموعة سنوات متتالية ناقصة تُحسب في تمريرة واحدة
+        runs = []
+        for y in missing:
+            if runs and y == runs[-1][1] + 1:
+                runs[-1][1] = y
+            else:
+                runs.append([y, y])
+        new_events = [self.events] + [self._build_years(y0, y1) for y0, y1 in runs]
+        events = np.concatenate(new_events)
+        self.events = events[np.argsort(events['tt'], kind='stable')]
+        span_start, span_end = ephemeris_span()
+        for y in missing:
+            if ts.utc(y, 1, 1).tt >= span_start + 1 and ts.utc(y + 1, 1, 1).tt <= span_end - 1:
+                self.years.add(y)
+            else:
+                self.partial_years.add(y)
+        self._save()
+
+    def between(self, tt0, tt1, kinds=None):
+        self.ensure_years(ts.tt_jd(tt0).utc.year, ts.tt_jd(tt1).utc.year)
+        i0, i1 = np.searchsorted(self.events['tt'], [tt0, tt1])
+        events = self.events[i0:i1]
+        if kinds is not None:
+            events = events[np.isin(events['kind'], kinds)]
+        return events
+
+astronomical_event_index = AstronomicalEventIndex()
+
+def describe_event(event):
+    """وصف عربي مختصر لحدث من AstronomicalEventIndex."""
+    kind = int(event['kind'])
+    name1 = EVENT_BODIES[int(event['body1'])][1]
+    name2 = EVENT_BODIES[int(event['body2'])][1]
+    value = float(event['value'])
+    if kind == EVENT_CONJUNCTION:
+        return f"اقتران {name1} و{name2} (تفصلهما {value:.1f}°)"
+    if kind == EVENT_MOON_APPROACH:
+        return f"اقتراب القمر من {name2} (على بعد {value:.1f}°)"
+    if kind == EVENT_OPPOSITION:
+        return f"تقابل {name2} مع الشمس"
+    if kind == EVENT_ELONGATION:
+        side = "شرقية (مسائية)" if value > 0 else "غربية (صباحية)"
+        return f"أقصى استطالة {side} لـ{name2} ({abs(value):.1f}°)"
+    return SEASONS_AR[int(value)]
+
+# -------------------------------------------------------------------
+# تصدير التقويم (ICS / CSV) من مولّد أحداث
+CALENDAR_KINDS = [
+    ("moon", "شروق القمر وغروبه"),
+    ("planets", "شروق الكواكب وغروبها"),
+    ("phases", "أطوار القمر"),
+    ("twilight", "الشروق والغروب والشفق"),
+    ("events", "الأحداث الفلكية"),
+]
+CALENDAR_CHUNK_DAYS = 31       # تُحسب الأحداث شهراً بشهر فتبقى الذاكرة محدودة مهما طال المدى
+CALENDAR_STEP_MINUTES = 10
+CALENDAR_TWILIGHT = [
+    ("astronomical_dawn", "بداية الشفق الفلكي"), ("nautical_dawn", "بداية الشفق البحري"),
+    ("civil_dawn", "بداية الشفق المدني"), ("sunrise", "شروق الشمس"), ("sunset", "غروب الشمس"),
+    ("civil_dusk", "نهاية الشفق المدني"), ("nautical_dusk", "نهاية الشفق البحري"),
+    ("astronomical_dusk", "نهاية الشفق الفلكي"),
+]
+
+def _chunk_calendar_events(location, tz, tt0, tt1, kinds):
+    """أحداث الفترة [tt0, tt1) لموقع واحد كقائمة (tt، العنوان، الفئة) غير مرتبة."""
+    lat = np.array([location.latitude.degrees])
+    lon = np.array([location.longitude.degrees])
+    found = []
+
+    bodies = []
+    if "moon" in kinds:
+        bodies.append(('moon', 'القمر'))
+    if "planets" in kinds:
+        bodies += [(key, name) for key, name, _ in NIGHT_BODIES if key != 'moon']
+    step = CALENDAR_STEP_MINUTES / 1440.0
+    tt = np.arange(tt0, tt1 + step, step)
+    for key, name in bodies:
+        track = BodyTrack(eph[key], tt0, tt1)
+        # الأفق نفسه الذي تعرضه لقطة السماء وشاشة الكواكب
+        horizon = snapshot_horizon(key)
+        for rising, verb in ((True, "شروق"), (False, "غروب")):
+            _, roots = horizon_crossings(track, tt, lat, lon, rising, horizon)
+            found += [(r, f"{verb} {name}", "moon" if key == 'moon' else "planets")
+                      for r in roots if tt0 <= r < tt1]
+
+    if "phases" in kinds:
+        lunar_phase_index.ensure_range(tt0, tt1)
+        phase_tt, phase_ids = lunar_phase_index.phases_between(tt0, tt1)
+        found += [(t, MOON_PHASE_AR.get(almanac.MOON_PHASES[p], almanac.MOON_PHASES[p]), "phases")
+                  for t, p in zip(phase_tt, phase_ids)]
+
+    if "twilight" in kinds:
+        years = range(ts.tt_jd(tt0).utc.year, ts.tt_jd(tt1).utc.year + 1)
+        for year in years:
+            table = compute_solar_timetable(year, location, tz)
+            for name, label in CALENDAR_TWILIGHT:
+                values = table["events"][name]
+                sel = (values >= tt0) & (values < tt1)
+                found += [(t, label, "twilight") for t in values[sel]]
+
+    if "events" in kinds:
+        found += [(float(e['tt']), describe_event(e), "events")
+                  for e in astronomical_event_index.between(tt0, tt1)]
+    return found
+
+def iter_calendar_events(location_names, date_start, date_end, kinds=None, tz=None):
+    """
+    مولّد أحداث التقويم بين تاريخين محليين (date_end غير مشمول) لكل موقع في location_names،
+    والأيام بمنطقة كل موقع ما لم تُحدَّد tz.
+    يعيد قواميس بـ tt و dt (UTC) و summary و category و location بترتيب زمني داخل كل موقع،
+    ويحسب شهراً واحداً في كل مرة: إعادة استخدام BodyTrack وجداول الشمس وفهرسي الأطوار والأحداث
+    بدلاً من get_rise_set لكل يوم.
+    """
+    kinds = set(kinds or [k for k, _ in CALENDAR_KINDS])
+    for location_name in location_names:
+        location = Topos(*OMAN_LOCATIONS[location_name])
+        location_tz = tz or get_location_timezone(location_name)
+        day = date_start
+        while day < date_end:
+            next_day = min(day + datetime.timedelta(days=CALENDAR_CHUNK_DAYS), date_end)
+            tt0, tt1 = local_midnight_tt(day, location_tz), local_midnight_tt(next_day, location_tz)
+            chunk = sorted(_chunk_calendar_events(location, location_tz, tt0, tt1, kinds))
+            if chunk:
+                times = ts.tt_jd([t for t, _, _ in chunk]).utc_datetime()
+                for (t, summary, category), utc_dt in zip(chunk, times):
+                    yield {"tt": t, "dt": utc_dt, "summary": summary,
+                           "category": category, "location": location_name}
+            day = next_day
+
+def _ics_escape(text):
+    return (text.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+def _ics_fold(line):
+    """يطوي السطر عند 75 بايت (RFC 5545 §3.1) دون قطع حرف UTF-8 متعدد البايتات."""
+    data = line.encode("utf-8")
+    parts = []
+    limit = 75
+    while len(data) > limit:
+        cut = limit
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        limit = 74   # الأسطر التالية تبدأ بمسافة
+    parts.append(data)
+    return b"\r\n ".join(parts) + b"\r\n"
+
+def write_calendar_ics(events, path):
+    """يكتب أحداث المولّد إلى ملف ICS حدثاً بحدث؛ الأوقات بتوقيت UTC فلا حاجة لـ VTIMEZONE."""
+    stamp = datetime.datetime.now(pytz.UTC).strftime("%Y%m%dT%H%M%SZ")
+    count = 0
+    with open(path, "wb") as f:
+        for line in ("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//astroApp//Oman Astronomy//AR",
+                     "CALSCALE:GREGORIAN", "METHOD:PUBLISH"):
+            f.write(_ics_fold(line))
+        for event in events:
+            start = event["dt"].strftime("%Y%m%dT%H%M%SZ")
+            digest = hashlib.md5(f"{event['summary']}|{event['location']}".encode("utf-8")).hexdigest()[:12]
+            uid = f"{start}-{event['category']}-{digest}@astroapp"
+            # حدث لحظي: DTSTART وحده دون DTEND (RFC 5545 §3.6.1 يشترط أن يكون DTEND بعد DTSTART)
+            for line in ("BEGIN:VEVENT", f"UID:{uid}", f"DTSTAMP:{stamp}", f"DTSTART:{start}",
+                         f"SUMMARY:{_ics_escape(event['summary'])}",
+                         f"LOCATION:{_ics_escape(event['location'])}",
+                         f"CATEGORIES:{event['category'].upper()}",
+                         "TRANSP:TRANSPARENT", "END:VEVENT"):
+                f.write(_ics_fold(line))
+            count += 1
+        f.write(_ics_fold("END:VCALENDAR"))
+    return count
+
+def write_calendar_csv(events, path, tz=None):
+    """يكتب الأحداث بالوقت المحلي لموقع كل حدث (أو بتوقيت tz إن حُدِّد)."""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["الموقع", "التاريخ", "الوقت", "الحدث", "الفئة"])
+        for event in events:
+            local = event["dt"].astimezone(tz or get_location_timezone(event["location"]))
+            writer.writerow([event["location"], local.date().isoformat(), local.strftime("%H:%M:%S"),
+                             event["summary"], event["category"]])
+            count += 1
+    return count
+
+# -------------------------------------------------------------------
+# ممرات الأقمار الصناعية من ملفات TLE محلية
+
+EARTH_RADIUS_KM = 6378.137
+SATELLITE_STEP_SECONDS = 60      # خطوة المسح الخشن؛ أقصر ممر فوق الأفق يتجاوز دقيقتين
+SATELLITE_CHUNK_DAYS = 1.0       # تُنتشر المدارات يوماً بيوم لتبقى الذاكرة محدودة
+
+_tle_cache = {}
+_satellite_pass_cache = {}
+
+def load_tle_files(folder=SATELLITE_FOLDER):
+    """
+    يقرأ كل ملفات TLE (.tle أو .txt) في المجلد ويعيد قائمة (الاسم، Satrec).
+    يقبل الصيغة الثلاثية (سطر الاسم ثم السطران) والثنائية، ويتجاهل الأسطر التالفة.
+    """
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith((".tle", ".txt"))) \
+        if os.path.isdir(folder) else []
+    key = tuple((f, os.path.getmtime(os.path.join(folder, f))) for f in files)
+    if _tle_cache.get("key") == key:
+        return _tle_cache["satellites"]
+
+    satellites = []
+    for filename in files:
+        with open(os.path.join(folder, filename), encoding="utf-8", errors="ignore") as f:
+            lines = [line.rstrip() for line in f if line.strip()]
+        name = None
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            if line.startswith("1 ") and i + 1 < len(lines) and lines[i + 1].startswith("2 "):
+                try:
+                    satrec = Satrec.twoline2rv(line, lines[i + 1])
+                except Exception:
+                    satrec = None
+                if satrec is not None:
+                    satellites.append((name or line[2:7].strip(), satrec))
+                name = None
+                i += 2
+                continue
+            name = line.lstrip("0 ").strip()
+            i += 1
+    _tle_cache["key"] = key
+    _tle_cache["satellites"] = satellites
+    return satellites
+
+def _split_jd(jd):
+    whole = np.floor(jd - 0.5) + 0.5
+    return whole, jd - whole
+
+def _observer_ecef_km(lat_deg, lon_deg, elevation_m=0.0):
+    lat, lon = np.radians(lat_deg), np.radians(lon_deg)
+    e2 = EARTH_FLATTENING * (2 - EARTH_FLATTENING)
+    n = EARTH_RADIUS_KM / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    h = elevation_m / 1000.0
+    return np.array([(n + h) * np.cos(lat) * np.cos(lon),
+                     (n + h) * np.cos(lat) * np.sin(lon),
+                     (n * (1 - e2) + h) * np.sin(lat)])
+
+def teme_to_altaz(r_teme, jd_utc, lat_deg, lon_deg, elevation_m=0.0):
+    """
+    ارتفاع وسمت (بالدرجات) لمواضع TEME بالكيلومتر (آخر بُعد = 3) كما يراها المراقب.
+    التدوير إلى الإطار الأرضي بزاوية GMST 1982 فقط (تُهمل حركة القطب، وأثرها أقل من ثانية قوسية هنا).
+    """
+    theta, _ = theta_GMST1982(jd_utc)
+    cos_t, sin_t = np.cos(theta), np.sin(theta)
+    x = cos_t * r_teme[..., 0] + sin_t * r_teme[..., 1]
+    y = -sin_t * r_teme[..., 0] + cos_t * r_teme[..., 1]
+    obs = _observer_ecef_km(lat_deg, lon_deg, elevation_m)
+    dx, dy, dz = x - obs[0], y - obs[1], r_teme[..., 2] - obs[2]
+
+    lat, lon = np.radians(lat_deg), np.radians(lon_deg)
+    east = -np.sin(lon) * dx + np.cos(lon) * dy
+    north = (-np.sin(lat) * np.cos(lon) * dx - np.sin(lat) * np.sin(lon) * dy
+             + np.cos(lat) * dz)
+    up = (np.cos(lat) * np.cos(lon) * dx + np.cos(lat) * np.sin(lon) * dy
+          + np.sin(lat) * dz)
+    alt = np.degrees(np.arctan2(up, np.hypot(east, north)))
+    az = np.degrees(np.arctan2(east, north)) % 360
+    return alt, az
+
+def _propagate_pairs(satrecs, sat_idx, jd_utc):
+    """موضع TEME لكل زوج (قمر، وقت)؛ تُجمع الأوقات حسب القمر لتُنتشر كل مجموعة باستدعاء واحد."""
+    r = np.full((len(sat_idx), 3), np.nan)
+    whole, frac = _split_jd(np.asarray(jd_utc, dtype=float))
+    for i in np.unique(sat_idx):
+        sel = np.nonzero(sat_idx == i)[0]
+        err, pos, _ = satrecs[i].sgp4_array(whole[sel], frac[sel])
+        pos[err != 0] = np.nan
+        r[sel] = pos
+    return r
+
+def _utc_jd_to_time(jd_utc):
+    # الأيام الكاملة تُضاف لليوم والكسر للثواني، حتى لا تُحتسب الثواني الكبيسة مرتين
+    days = np.floor(np.asarray(jd_utc) - 2451545.0)
+    return ts.utc(2000, 1, 1 + days, 12, 0, (np.asarray(jd_utc) - 2451545.0 - days) * 86400.0)
+
+J2000_UTC = datetime.datetime(2000, 1, 1, 12, tzinfo=pytz.UTC)
+
+def jd_to_local(jd_utc, tz):
+    return (J2000_UTC + datetime.timedelta(days=float(jd_utc) - 2451545.0)).astimezone(tz)
+
+def local_to_jd(dt):
+    return 2451545.0 + (dt - J2000_UTC).total_seconds() / 86400.0
+
+def compute_satellite_passes(dt_start, days=7, location=None, min_altitude=10.0,
+                             satellites=None):
+    """
+    يتنبأ بممرات كل الأقمار في ملفات TLE المحلية خلال days يوماً بدءاً من dt_start.
+    1) مسح خشن: تُنتشر كل الأقمار معاً عبر SatrecArray على شبكة زمنية كل دقيقة، يوماً بيوم.
+    2) تُحسَّن أوقات الطلوع والغروب (عبور min_altitude) والذروة (انعدام تغيّر الارتفاع) بطريقة Illinois
+       المتجهة، حيث ينتشر كل قمر مرة واحدة لكل دفعة من أوقاته.
+    3) يُحدَّد عند الذروة إن كان القمر مضاءً بالشمس أم في ظل الأرض (نموذج الظل الأسطواني)،
+       ويُعدّ الممر مرئياً إن كان مضاءً والشمس تحت -6° عند المراقب.
+    تعيد قائمة قواميس مرتبة حسب وقت الطلوع، والأوقات فيها بالتاريخ اليولياني UTC.
+    """
+    location = location or get_current_location()
+    lat = location.latitude.degrees
+    lon = location.longitude.degrees
+    satellites = load_tle_files() if satellites is None else satellites
+    # نافذة فارغة: لا دفعات مسح، فلا طلوع ولا غروب
+    if not satellites or days <= 0:
+        return []
+
+    jd_start = local_to_jd(dt_start)
+    key = (tuple((name, s.jdsatepoch + s.jdsatepochF) for name, s in satellites),
+           round(jd_start, 6), days, round(lat, 4), round(lon, 4), min_altitude)
+    if key in _satellite_pass_cache:
+        return _satellite_pass_cache[key]
+
+    names = [name for name, _ in satellites]
+    satrecs = [satrec for _, satrec in satellites]
+    sat_array = SatrecArray(satrecs)
+    step = SATELLITE_STEP_SECONDS / 86400.0
+    samples_per_chunk = int(round(SATELLITE_CHUNK_DAYS / step))
+
+    def altitude(sat_idx, jd):
+        r = _propagate_pairs(satrecs, sat_idx, jd)
+        return teme_to_altaz(r, jd, lat, lon)[0] - min_altitude
+
+    rise_parts, set_parts = [], []
+    for chunk in range(int(np.ceil(days / SATELLITE_CHUNK_DAYS))):
+        jd = jd_start + (chunk * samples_per_chunk + np.arange(samples_per_chunk + 1)) * step
+        whole, frac = _split_jd(jd)
+        err, r, _ = sat_array.sgp4(whole, frac)
+        r[err != 0] = np.nan
+        alt = teme_to_altaz(r, jd, lat, lon)[0] - min_altitude
+        with np.errstate(invalid='ignore'):
+            for rising, parts in ((True, rise_parts), (False, set_parts)):
+                sat_idx, t_idx = find_sign_changes(alt, rising)
+                parts.append((sat_idx, jd[t_idx], jd[t_idx + 1],
+                              alt[sat_idx, t_idx], alt[sat_idx, t_idx + 1]))
+        if chunk == 0:
+            # قمر فوق الأفق لحظة البداية: يبدأ ممره من بداية النافذة
+            first_up = np.nonzero(alt[:, 0] >= 0)[0]
+        last_alt = alt[:, -1]
+
+    def refine(parts):
+        sat_idx = np.concatenate([p[0] for p in parts])
+        lo, hi = np.concatenate([p[1] for p in parts]), np.concatenate([p[2] for p in parts])
+        f_lo, f_hi = np.concatenate([p[3] for p in parts]), np.concatenate([p[4] for p in parts])
+        roots = refine_crossings(lambda x: altitude(sat_idx, x), lo, hi, f_lo, f_hi)
+        return sat_idx, roots
+
+    rise_sat, rise_jd = refine(rise_parts)
+    set_sat, set_jd = refine(set_parts)
+    jd_end = jd_start + days
+    rise_sat = np.concatenate([rise_sat, first_up])
+    rise_jd = np.concatenate([rise_jd, np.full(len(first_up), jd_start)])
+    still_up = np.nonzero(last_alt >= 0)[0]
+    set_sat = np.concatenate([set_sat, still_up])
+    set_jd = np.concatenate([set_jd, np.full(len(still_up), jd_end)])
+
+    # مطابقة كل طلوع بأول غروب يليه للقمر نفسه
+    rise_order = np.lexsort((rise_jd, rise_sat))
+    set_order = np.lexsort((set_jd, set_sat))
+    rise_sat, rise_jd = rise_sat[rise_order], rise_jd[rise_order]
+    set_sat, set_jd = set_sat[set_order], set_jd[set_order]
+    if len(rise_sat) != len(set_sat) or np.any(rise_sat != set_sat):
+        matched = np.searchsorted(set_sat * 1e6 + (set_jd - jd_start), rise_sat * 1e6 + (rise_jd - jd_start))
+        matched = np.clip(matched, 0, len(set_sat) - 1)
+        set_sat, set_jd = set_sat[matched], set_jd[matched]
+        ok = set_sat == rise_sat
+        rise_sat, rise_jd, set_jd = rise_sat[ok], rise_jd[ok], set_jd[ok]
+    if not len(rise_sat):
+        _satellite_pass_cache[key] = []
+        return []
+
+    # الذروة: جذر الفرق المركزي للارتفاع داخل كل ممر
+    h = 1.0 / 86400.0
+    slope = lambda x: altitude(rise_sat, x + h) - altitude(rise_sat, x - h)
+    lo, hi = rise_jd + h, set_jd - h
+    culm_jd = refine_crossings(slope, lo, hi, slope(lo), slope(hi), iterations=6)
+    culm_jd = np.clip(culm_jd, rise_jd, set_jd)
+
+    all_jd = np.concatenate([rise_jd, culm_jd, set_jd])
+    all_sat = np.tile(rise_sat, 3)
+    r = _propagate_pairs(satrecs, all_sat, all_jd)
+    alt_all, az_all = teme_to_altaz(r, all_jd, lat, lon)
+    n = len(rise_sat)
+    r_culm = r[n:2 * n]
+
+    # الإضاءة: الشمس في إطار GCRS تكفي لاختبار الظل (الفرق عن TEME دقائق قوسية)
+    t_culm = _utc_jd_to_time(culm_jd)
+    sun = (eph['sun'] - eph['earth']).at(t_culm).position.km.T
+    sun_dir = sun / np.linalg.norm(sun, axis=1)[:, None]
+    along = np.sum(r_culm * sun_dir, axis=1)
+    perp = np.linalg.norm(r_culm - along[:, None] * sun_dir, axis=1)
+    sunlit = (along > 0) | (perp > EARTH_RADIUS_KM)
+
+    track = BodyTrack(eph['sun'], t_culm.tt.min(), t_culm.tt.max() + 1e-3)
+    sun_alt, _ = track.altaz(t_culm.tt, lat, lon)
+    visible = sunlit & (sun_alt < -6.0)
+
+    passes = []
+    for i in np.argsort(rise_jd):
+        passes.append({
+            "name": names[rise_sat[i]],
+            "rise": rise_jd[i], "culmination": culm_jd[i], "set": set_jd[i],
+            "rise_az": az_all[i], "culmination_az": az_all[n + i], "set_az": az_all[2 * n + i],
+            "max_altitude": alt_all[n + i],
+            "sunlit": bool(sunlit[i]),
+            "visible": bool(visible[i]),
+        })
+    _satellite_pass_cache[key] = passes
+    return passes
+
+# -------------------------------------------------------------------
+# الكويكبات والمذنبات من ملفات عناصر مدارية محلية بصيغة MPC
+GAUSS_K = 0.01720209895                    # ثابت غاوس للجاذبية (AU^1.5 لكل يوم)
+LIGHT_TIME_PER_AU = 499.004783836 / 86400  # زمن قطع الضوء لوحدة فلكية بالأيام
+MINOR_BODY_HORIZON = -34.0 / 60.0          # أجرام نقطية: الانكسار عند الأفق وحده
+MINOR_BODY_STEP_MINUTES = 10
+MINOR_BODY_MAX_ROWS = 300
+KEPLER_TOLERANCE = 1e-12
+KEPLER_MAX_ITERATIONS = 30
+
+# أرقام التواريخ المضغوطة في ملفات MPC: 1-9 ثم A=10 حتى V=31
+_MPC_PACKED_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUV"
+
+_minor_body_cache = {}
+
+def _parse_mpcorb_line(line):
+    """
+    سطر كويكب من MPCORB.DAT: (الاسم، q، e، i، Ω، ω، (سنة، شهر، يوم) لحقبة العناصر، إزاحة زمن الحضيض عنها، H، G).
+    يعيد None للترويسة والأسطر التالفة والكويكبات بلا قدر مطلق.
+    """
+    packed = line[20:25]
+    if len(line) < 103 or packed[:1] not in "IJK" or not line[8:13].strip():
+        return None
+    try:
+        year = (ord(packed[0]) - ord('A') + 10) * 100 + int(packed[1:3])
+        epoch = (year, _MPC_PACKED_DIGITS.index(packed[3]), _MPC_PACKED_DIGITS.index(packed[4]))
+        mean_anomaly, peri, node, inc, e, mean_motion, a = (
+            float(line[i:j]) for i, j in ((26, 35), (37, 46), (48, 57), (59, 68), (70, 79), (80, 91), (92, 103)))
+        h = float(line[8:13])
+        g = float(line[14:19]) if line[14:19].strip() else 0.15
+    except ValueError:
+        return None
+    if mean_motion <= 0 or not 0 <= e < 1:
+        return None
+    name = line[166:194].strip() or line[0:7].strip()
+    return name, a * (1 - e), e, inc, node, peri, epoch, -mean_anomaly / mean_motion, h, g
+
+def _parse_comet_line(line):
+    """سطر مذنب من CometEls.txt بالترتيب نفسه، وزمن الحضيض فيه مباشرة (الإزاحة صفر)، و G هو معامل الميل k."""
+    if len(line) < 100 or line[4:5] not in "CPDXIA" or not line[14:18].isdigit() or not line[91:95].strip():
+        return None
+    try:
+        perihelion = (int(line[14:18]), int(line[19:21]), float(line[22:29]))
+        q, e, peri, node, inc, h, k = (
+            float(line[i:j]) for i, j in ((30, 39), (41, 49), (51, 59), (61, 69), (71, 79), (91, 95), (96, 100)))
+    except ValueError:
+        return None
+    if q <= 0 or e < 0:
+        return None
+    name = line[102:158].strip() or line[0:12].strip()
+    return name, q, e, inc, node, peri, perihelion, 0.0, h, k
+
+def load_minor_body_elements(folder=MINOR_BODY_FOLDER):
+    """
+    يقرأ كل ملفات العناصر المدارية في المجلد (.dat أو .txt): أسطر MPCORB.DAT للكويكبات
+    وأسطر CometEls.txt للمذنبات، ويجوز خلطهما في ملف واحد. تُعاد كل الأجرام بعناصر حضيض موحّدة
+    (q، e، الزوايا بالراديان، زمن الحضيض TT) في مصفوفات NumPy، وتُخزَّن حتى يتغير أي ملف.
+    """
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith((".dat", ".txt"))) \
+        if os.path.isdir(folder) else []
+    key = tuple((f, os.path.getmtime(os.path.join(folder, f))) for f in files)
+    if _minor_body_cache.get("key") == key:
+        return _minor_body_cache["elements"]
+
+    rows, comet = [], []
+    for filename in files:
+        with open(os.path.join(folder, filename), encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                row = _parse_mpcorb_line(line)
+                is_comet = row is None
+                if is_comet:
+                    row = _parse_comet_line(line)
+                if row is not None:
+                    rows.append(row)
+                    comet.append(is_comet)
+
+    names, q, e, inc, node, peri, dates, offsets, h, g = zip(*rows) if rows else ([],) * 10
+    year, month, day = (np.array(column, dtype=float) for column in zip(*dates)) if rows else ([],) * 3
+    elements = {
+        "names": list(names),
+        "comet": np.array(comet, dtype=bool),
+        "q": np.array(q, dtype=float),
+        "e": np.array(e, dtype=float),
+        "inc": np.radians(np.array(inc, dtype=float)),
+        "node": np.radians(np.array(node, dtype=float)),
+        "peri": np.radians(np.array(peri, dtype=float)),
+        "tp": (ts.tt(year, month, day).tt + np.array(offsets)) if rows else np.empty(0),
+        "H": np.array(h, dtype=float),
+        "G": np.array(g, dtype=float),
+    }
+    _minor_body_cache["key"] = key
+    _minor_body_cache["elements"] = elements
+    return elements
+
+def solve_kepler_orbits(q, e, dt):
+    """
+    الإحداثيات في مستوى المدار (x نحو الحضيض، y) بوحدة AU بعد dt يوماً من الحضيض لكل الأجرام معاً:
+    نيوتن على معادلة كبلر للمدارات الإهليلجية (بدءاً من π للمدارات شديدة التفلطح فيتقارب دائماً)،
+    وعلى صيغتها الزائدية للمدارات المفتوحة، وحل باركر المغلق للمدار القطعي المكافئ (e = 1).
+    """
+    q, e, dt = np.broadcast_arrays(np.asarray(q, dtype=float), np.asarray(e, dtype=float),
+                                   np.asarray(dt, dtype=float))
+    x = np.empty(q.shape)
+    y = np.empty(q.shape)
+
+    ellipse = e < 1.0
+    if np.any(ellipse):
+        qe, ee = q[ellipse], e[ellipse]
+        a = qe / (1.0 - ee)
+        M = (GAUSS_K * a ** -1.5 * dt[ellipse] + np.pi) % (2 * np.pi) - np.pi
+        E = np.where(ee < 0.8, M, np.pi * np.sign(M))
+        for _ in range(KEPLER_MAX_ITERATIONS):
+            step = (E - ee * np.sin(E) - M) / (1.0 - ee * np.cos(E))
+            E -= step
+            if np.max(np.abs(step)) < KEPLER_TOLERANCE:
+                break
+        x[ellipse] = a * (np.cos(E) - ee)
+        y[ellipse] = a * np.sqrt(1.0 - ee * ee) * np.sin(E)
+
+    hyperbola = e > 1.0
+    if np.any(hyperbola):
+        qh, eh = q[hyperbola], e[hyperbola]
+        a = qh / (eh - 1.0)
+        M = GAUSS_K * a ** -1.5 * dt[hyperbola]
+        H = np.sign(M) * np.log(2 * np.abs(M) / eh + 1.8)
+        for _ in range(KEPLER_MAX_ITERATIONS):
+            step = (eh * np.sinh(H) - H - M) / (eh * np.cosh(H) - 1.0)
+            H -= step
+            if np.max(np.abs(step)) < KEPLER_TOLERANCE:
+                break
+        x[hyperbola] = a * (eh - np.cosh(H))
+        y[hyperbola] = a * np.sqrt(eh * eh - 1.0) * np.sinh(H)
+
+    parabola = ~ellipse & ~hyperbola
+    if np.any(parabola):
+        qp = q[parabola]
+        # معادلة باركر: s + s³/3 = k·dt / √(2q³) حيث s = tan(ν/2)
+        b = 1.5 * GAUSS_K * dt[parabola] / np.sqrt(2 * qp ** 3)
+        w = np.cbrt(b + np.sqrt(b * b + 1.0))
+        s = w - 1.0 / w
+        x[parabola] = qp * (1.0 - s * s)
+        y[parabola] = 2.0 * qp * s
+    return x, y
+
+def minor_body_heliocentric(elements, tt, index=None):
+    """
+    مواضع الأجرام حول الشمس بإحداثيات ICRS وبوحدة AU، مصفوفة (3, ...).
+    index يختار بعض الأجرام، و tt عدد أو مصفوفة تُبثّ مع عددها (مثلاً (أوقات، 1) لشبكة زمنية).
+    """
+    pick = (lambda name: elements[name]) if index is None else (lambda name: elements[name][index])
+    xp, yp = solve_kepler_orbits(pick("q"), pick("e"), np.asarray(tt) - pick("tp"))
+    w, node, inc = pick("peri"), pick("node"), pick("inc")
+    cw, sw, cn, sn, ci, si = np.cos(w), np.sin(w), np.cos(node), np.sin(node), np.cos(inc), np.sin(inc)
+    x = (cw * cn - sw * sn * ci) * xp + (-sw * cn - cw * sn * ci) * yp
+    y = (cw * sn + sw * cn * ci) * xp + (-sw * sn + cw * cn * ci) * yp
+    z = sw * si * xp + cw * si * yp
+    return _ecliptic_to_equatorial(x, y, z, J2000_OBLIQUITY)
+
+def minor_body_magnitude(elements, r, delta, earth_sun, index=None):
+    """
+    القدر الظاهري: نظام H-G للكويكبات، و H + 5 log Δ + 2.5 k log r للمذنبات.
+    r و delta بعدا الجرم عن الشمس والأرض، و earth_sun بعد الأرض عن الشمس (AU).
+    """
+    pick = (lambda name: elements[name]) if index is None else (lambda name: elements[name][index])
+    h, g, comet = pick("H"), pick("G"), pick("comet")
+    slope = np.where(comet, 0.15, g)
+    cos_phase = np.clip((r * r + delta * delta - earth_sun * earth_sun) / (2 * r * delta), -1, 1)
+    tan_half = np.tan(np.arccos(cos_phase) / 2)
+    phi1 = np.exp(-3.33 * tan_half ** 0.63)
+    phi2 = np.exp(-1.87 * tan_half ** 1.22)
+    asteroid = h + 5 * np.log10(r * delta) - 2.5 * np.log10((1 - slope) * phi1 + slope * phi2)
+    return np.where(comet, h + 5 * np.log10(delta) + 2.5 * g * np.log10(r), asteroid)
+
+def _minor_body_apparent(elements, index, tt, earth, precession):
+    """
+    المطلع المستقيم والميل (لخط استواء التاريخ) والبعد لأجرام index عند tt، بعد تكرار واحد لزمن قطع الضوء.
+    earth موضع الأرض حول الشمس عند tt، و tt و earth يُبثّان مع الأجرام.
+    """
+    geo = minor_body_heliocentric(elements, tt, index) - earth
+    delta = np.sqrt(np.sum(geo * geo, axis=0))
+    geo = minor_body_heliocentric(elements, tt - delta * LIGHT_TIME_PER_AU, index) - earth
+    x, y, z = np.tensordot(precession, geo, axes=1)
+    distance = np.sqrt(x * x + y * y + z * z)
+    return np.arctan2(y, x), np.arcsin(z / distance), distance
+
+def compute_minor_bodies(dt, limiting_magnitude=12.0, max_objects=MINOR_BODY_MAX_ROWS, location_name=None,
+                         location=None, tz=None):
+    """
+    أسطع الكويكبات والمذنبات عند اللحظة dt للموقع (الحالي افتراضياً): القدر والارتفاع والسمت والبعد، مع أول شروق
+    وأول غروب في اليوم المحلي فوق مظهر أفق الموقع إن وُجد. تُحسب المواضع الهندسية والأقدار لكل الأجرام
+    بمعادلة كبلر المتجهة أولاً، ثم يُقطع ما هو أخفت من القدر الحدّي (ويُبقى أسطع max_objects منه)،
+    فلا يمر بزمن قطع الضوء والمبادرة والارتفاع والبحث عن الشروق والغروب إلا ما سيُعرض.
+    """
+    if location_name is None:
+        location_name = getattr(App.get_running_app(), "current_location_name", "مسقط")
+    location = location or Topos(*OMAN_LOCATIONS.get(location_name, OMAN_LOCATIONS["مسقط"]))
+    tz = tz or get_location_timezone(location_name)
+    profile = load_horizon_profile(location_name)
+    elements = load_minor_body_elements()
+    t = ts.from_datetime(dt)
+    tt = t.tt
+
+    def earth_heliocentric(times):
+        return eph['earth'].at(times).position.au - eph['sun'].at(times).position.au
+
+    earth = earth_heliocentric(t)
+    helio = minor_body_heliocentric(elements, tt)
+    geo = helio - earth[:, None]
+    r = np.sqrt(np.sum(helio * helio, axis=0))
+    delta = np.sqrt(np.sum(geo * geo, axis=0))
+    magnitude = minor_body_magnitude(elements, r, delta, np.sqrt(np.sum(earth * earth)))
+
+    bright = np.nonzero(magnitude <= limiting_magnitude)[0]
+    index = bright[np.argsort(magnitude[bright], kind="stable")][:max_objects]
+
+    lat, lon = location.latitude.degrees, location.longitude.degrees
+    ra, dec, distance = _minor_body_apparent(elements, index, tt, earth[:, None], t.M)
+    altitude, azimuth = topocentric_altaz(ra, dec, distance, np.radians(t.gast * 15 + lon), lat)
+
+    # شروق الأجرام المختارة وغروبها في اليوم المحلي على شبكة زمنية كثيفة ثم تحسين العبورات معاً
+    day0 = local_midnight_tt(dt.astimezone(tz).date(), tz)
+    grid_tt = day0 + np.arange(0, 1440 + MINOR_BODY_STEP_MINUTES, MINOR_BODY_STEP_MINUTES) / 1440.0
+    grid = ts.tt_jd(grid_tt)
+    grid_earth = earth_heliocentric(grid)
+    precession = ts.tt_jd(day0 + 0.5).M
+    sidereal = np.unwrap(grid.gast * (np.pi / 12)) + np.radians(lon)
+
+    def altitude_at(times, which):
+        earth_at = np.array([np.interp(times, grid_tt, axis) for axis in grid_earth])
+        ra_, dec_, distance_ = _minor_body_apparent(elements, index[which], times, earth_at, precession)
+        alt, az = topocentric_altaz(ra_, dec_, distance_, np.interp(times, grid_tt, sidereal), lat)
+        return alt - MINOR_BODY_HORIZON - horizon_altitude(profile, az)
+
+    which = np.repeat(np.arange(len(index)), len(grid_tt))
+    times = np.tile(grid_tt, len(index))
+    grid_altitude = altitude_at(times, which).reshape(len(index), len(grid_tt))
+    crossings = {}
+    for event, rising in (("rise", True), ("set", False)):
+        body_idx, t_idx = find_sign_changes(grid_altitude, rising)
+        # المؤشرات مرتبة حسب الجرم ثم الزمن، فأول ظهور لكل جرم هو أول عبور في اليوم
+        body_idx, first = np.unique(body_idx, return_index=True)
+        t_idx = t_idx[first]
+        roots = refine_crossings(lambda x: altitude_at(x, body_idx), grid_tt[t_idx], grid_tt[t_idx + 1],
+                                 grid_altitude[body_idx, t_idx], grid_altitude[body_idx, t_idx + 1])
+        crossings[event] = np.full(len(index), np.nan)
+        crossings[event][body_idx] = roots
+
+    return {
+        "total": len(magnitude),
+        "bright": len(bright),
+        "names": [elements["names"][i] for i in index],
+        "comet": elements["comet"][index],
+        "magnitude": magnitude[index],
+        "altitude": altitude,
+        "azimuth": azimuth,
+        "distance": delta[index],
+        "sun_distance": r[index],
+        "rise": crossings["rise"],
+        "set": crossings["set"],
+    }
+
+# -------------------------------------------------------------------
+# هندسة قرص القمر كما يُرى من الموقع: الطور واتجاه الطرف المضيء والترنح
+
+MOON_EQUATOR_INCLINATION = np.radians(1.54242)
+
+def moon_disc_geometry(t, location=None):
+    """
+    ما يلزم لرسم قرص القمر من هندسة الشمس والقمر عند t (بالدرجات):
+      - phase_angle: زاوية الطور عند القمر بين الشمس والأرض (0 بدر، 180 محاق).
+      - bright_limb: زاوية موضع منتصف الطرف المضيء من الشمال السماوي نحو الشرق (ميوس 48.5).
+      - axis: زاوية موضع محور دوران القمر (ميوس 53، دون الترنح الفيزيائي).
+      - parallactic: الزاوية بين الشمال السماوي وسمت الرأس عند القمر، فيُدار القرص ليكون سمت الرأس للأعلى.
+      - libration_lon و libration_lat: الترنح البصري، أي إحداثيا النقطة المقابلة للمراقب على سطح القمر.
+    """
+    location = location or get_current_location()
+    observer = eph['earth'] + location
+    moon = observer.at(t).observe(eph['moon']).apparent()
+    sun = observer.at(t).observe(eph['sun']).apparent()
+    ra, dec, moon_distance = moon.radec(epoch='date')
+    ra_sun, dec_sun, sun_distance = sun.radec(epoch='date')
+    a, d, a0, d0 = ra.radians, dec.radians, ra_sun.radians, dec_sun.radians
+
+    elongation = moon.separation_from(sun).radians
+    phase_angle = np.arctan2(sun_distance.au * np.sin(elongation),
+                             moon_distance.au - sun_distance.au * np.cos(elongation))
+    bright_limb = np.arctan2(np.cos(d0) * np.sin(a0 - a),
+                             np.sin(d0) * np.cos(d) - np.cos(d0) * np.sin(d) * np.cos(a0 - a))
+
+    lat = np.radians(location.latitude.degrees)
+    hour_angle = np.radians(t.gast * 15 + location.longitude.degrees) - a
+    parallactic = np.arctan2(np.sin(hour_angle), np.tan(lat) * np.cos(d) - np.sin(d) * np.cos(hour_angle))
+
+    # الترنح البصري وزاوية المحور من الطول والعرض البروجيين الظاهريين (ميوس 53.1 و 53.2)
+    beta, lam, _ = moon.frame_latlon(ecliptic_frame)
+    dpsi, deps = iau2000b_radians(t)
+    T = (t.tt - 2451545.0) / 36525.0
+    F = np.radians(93.2720950 + 483202.0175233 * T - 0.0036539 * T * T)
+    node = np.radians(125.0445479 - 1934.1362891 * T + 0.0020754 * T * T)
+    b_ = beta.radians
+    W = lam.radians - dpsi - node
+    I = MOON_EQUATOR_INCLINATION
+    A = np.arctan2(np.sin(W) * np.cos(b_) * np.cos(I) - np.sin(b_) * np.sin(I), np.cos(W) * np.cos(b_))
+    libration_lon = (A - F + np.pi) % (2 * np.pi) - np.pi
+    libration_lat = np.arcsin(-np.sin(W) * np.cos(b_) * np.sin(I) - np.sin(b_) * np.cos(I))
+
+    obliquity = np.radians(mean_obliquity(t.tdb) / 3600.0) + deps
+    X = np.sin(I) * np.sin(node + dpsi)
+    Y = np.sin(I) * np.cos(node + dpsi) * np.cos(obliquity) - np.cos(I) * np.sin(obliquity)
+    omega = np.arctan2(X, Y)
+    axis = np.arcsin(np.clip(np.hypot(X, Y) * np.cos(a - omega) / np.cos(libration_lat), -1, 1))
+
+    return {name: float(np.degrees(value)) for name, value in (
+        ("phase_angle", phase_angle), ("bright_limb", bright_limb % (2 * np.pi)),
+        ("axis", axis), ("parallactic", parallactic),
+        ("libration_lon", libration_lon), ("libration_lat", libration_lat),
+    )}
+
+# -------------------------------------------------------------------
+# لقطات السماء المحسوبة مسبقاً للأيام المجاورة
+SNAPSHOT_BODIES = [
+    'Neptune BARYCENTER', 'Uranus BARYCENTER', 'SATURN BARYCENTER', 'JUPITER BARYCENTER',
+    'mars', 'venus', 'mercury', 'moon', 'sun',
+]
+
+SNAPSHOT_STEP_MINUTES = 10
+
+def snapshot_horizon(key):
+    """
+    ارتفاع مركز الجرم عند شروقه وغروبه في اللقطة: الشمس والقمر بحافتهما العليا (SUNRISE_ALTITUDE، -50′)
+    والكواكب أجرام نقطية لا يؤثر فيها إلا الانكسار (MINOR_BODY_HORIZON، -34′).
+    """
+    return SUNRISE_ALTITUDE if key in ("sun", "moon") else MINOR_BODY_HORIZON
+
+def compute_sky_snapshot(dt, location_name, should_stop=None):
+    """
+    لقطة لكل ما تعرضه الشاشات الرئيسية للحظة dt والموقع: ارتفاع كل جرم وسمته وظهوره فوق الأفق
+    وشروقه وغروبه، وإضاءة القمر وزاوية طوره. تعيد None إن طلبت should_stop الإيقاف أثناء الحساب.
+    الظهور والشروق والغروب بالنسبة لمظهر أفق الموقع إن وُجد: تُحسب عبورات الأفق لكل جرم على شبكة
+    ±24 ساعة بعمليات متجهة (BodyTrack و horizon_crossings) بدلاً من بحث almanac لكل جرم،
+    ثم يُختار الحدثان بمنطق get_rise_set نفسه (select_rise_set).
+    الأفق حسب snapshot_horizon لا -34′ لكل الأجرام كما في get_rise_set الافتراضية: شروق الشمس والقمر
+    بحافتهما العليا أبكر بدقيقة إلى دقيقتين، وغروبهما متأخر بمثل ذلك.
+    """
+    location = Topos(*OMAN_LOCATIONS.get(location_name, OMAN_LOCATIONS["مسقط"]))
+    tz = get_location_timezone(location_name)
+    profile = load_horizon_profile(location_name)
+    t = ts.from_datetime(dt.astimezone(pytz.UTC))
+    observer = eph['earth'] + location
+    lat, lon = location.latitude.degrees, location.longitude.degrees
+    step = SNAPSHOT_STEP_MINUTES / 1440.0
+    tt = np.arange(t.tt - 1, t.tt + 1 + step, step)
+    bodies = {}
+    for key in SNAPSHOT_BODIES:
+        if should_stop and should_stop():
+            return None
+        body = eph[key]
+        alt, az, _ = observer.at(t).observe(body).apparent().altaz()
+        horizon = snapshot_horizon(key)
+        track = BodyTrack(body, tt[0], tt[-1])
+        _, rising = horizon_crossings(track, tt, lat, lon, True, horizon, profile)
+        _, setting = horizon_crossings(track, tt, lat, lon, False, horizon, profile)
+        # الشبكة قد تتجاوز +24 ساعة بخطوة؛ تُسقط العبورات خارج نافذة get_rise_set (±24 ساعة)
+        rising = rising[np.abs(rising - t.tt) <= 1.0]
+        setting = setting[np.abs(setting - t.tt) <= 1.0]
+        rise_str, set_str = select_rise_set(time_to_unix(ts.tt_jd(rising)) if len(rising) else rising,
+                                            time_to_unix(ts.tt_jd(setting)) if len(setting) else setting,
+                                            dt, tz, include_date=True)
+        bodies[key] = {
+            "altitude": alt.degrees,
+            "azimuth": az.degrees,
+            "visible": bool(alt.degrees > horizon_altitude(profile, az.degrees)),
+            "rise": rise_str,
+            "set": set_str,
+        }
+    return {
+        "dt": dt,
+        "location_name": location_name,
+        "bodies": bodies,
+        "illumination": float(almanac.fraction_illuminated(eph, "moon", t)),
+        "phase_angle": float(almanac.moon_phase(eph, t).degrees),
+        "moon_disc": moon_disc_geometry(t, location),
+    }
+
+def snapshot_time(text):
+    """الجزء الزمني فقط من نص شروق/غروب يحمل التاريخ ("dd/mm/YYYY hh:mm ص")."""
+    return text.split(" ", 1)[1] if "/" in text else text
+
+class SnapshotPrefetcher:
+    """
+    ذاكرة محدودة للقطات السماء مع حساب مسبق في الخلفية لليوم التالي والسابق والساعة التالية،
+    فيظهر اليوم المجاور فوراً عند التنقل. يُلغى كل عمل معلّق عند القفز بعيداً أو تغيير الموقع
+    (عبر رقم جيل يتحقق منه الحساب بين جرم وآخر).
+    """
+    MAX_ENTRIES = 8
+    FAR_JUMP = datetime.timedelta(days=2)
+    NEIGHBOURS = [datetime.timedelta(days=1), datetime.timedelta(days=-1), datetime.timedelta(hours=1)]
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.center = None
+        self.location_name = None
+        self.in_progress = None
+        self.thread = None
+        self.latest = None
+        self.requested = None
+        self.busy = 0       # حسابات لقطات جارية في أي خيط
+        self.foreground = 0  # منها حسابات get/get_async التي لا تتوقف عند pause
+        self.pauses = 0
+
+    @staticmethod
+    def _key(dt, location_name):
+        return location_name, dt.astimezone(pytz.UTC).replace(second=0, microsecond=0)
+
+    def _store(self, key, snapshot):
+        self.cache[key] = snapshot
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.MAX_ENTRIES:
+            self.cache.popitem(last=False)
+
+    def _request(self, dt, location_name):
+        if location_name is None:
+            location_name = getattr(App.get_running_app(), "current_location_name", "مسقط")
+        key = self._key(dt, location_name)
+        self.requested = key
+        return location_name, key
+
+    def get(self, dt, location_name=None):
+        """اللقطة المطلوبة من الذاكرة أو محسوبة الآن، ثم جدولة جيرانها في الخلفية."""
+        location_name, key = self._request(dt, location_name)
+        return self._fetch(dt, location_name, key)
+
+    def _fetch(self, dt, location_name, key):
+        with self.condition:
+            # إن كان الحساب المسبق جارياً لهذه اللحظة نفسها فانتظاره أسرع من البدء من جديد
+            while self.in_progress == key:
+                self.condition.wait()
+            snapshot = self.cache.get(key)
+            if snapshot is not None:
+                self.cache.move_to_end(key)
+        if snapshot is None:
+            with self.condition:
+                while self.pauses:
+                    self.condition.wait()
+                self.busy += 1
+                self.foreground += 1
+            try:
+                snapshot = compute_sky_snapshot(dt, location_name)
+            finally:
+                with self.condition:
+                    self.busy -= 1
+                    self.foreground -= 1
+                    self.condition.notify_all()
+            with self.condition:
+                self._store(key, snapshot)
+        # نتيجة متأخرة لطلب تجاوزه المستخدم لا تحل محل آخر لقطة ولا تنقل مركز الحساب المسبق
+        if self.requested == key:
+            self.latest = snapshot
+            self.prefetch_around(dt, location_name)
+        return snapshot
+
+    def get_async(self, dt, location_name, callback):
+        """
+        مثل get لكن في خيط منفصل، ثم تُستدعى callback باللقطة في خيط الواجهة،
+        أو بـ None إن فشل الحساب.
+        """
+        location_name, key = self._request(dt, location_name)
+
+        def run():
+            try:
+                snapshot = self._fetch(dt, location_name, key)
+            except Exception as e:
+                print("snapshot computation failed:", e)
+                snapshot = None
+            Clock.schedule_once(lambda _: callback(snapshot), 0)
+        threading.Thread(target=run, daemon=True).start()
+
+    def put(self, snapshot):
+        """يضع لقطة محسوبة سابقاً (لقطة البدء الدافئ) في الذاكرة كأنها حُسبت الآن."""
+        key = self._key(snapshot["dt"], snapshot["location_name"])
+        with self.condition:
+            self._store(key, snapshot)
+        self.requested = key
+        self.latest = snapshot
+        self.prefetch_around(snapshot["dt"], snapshot["location_name"])
+
+    def prefetch_around(self, dt, location_name):
+        with self.condition:
+            if (location_name != self.location_name or self.center is None
+                    or abs(dt - self.center) > self.FAR_JUMP):
+                self.generation += 1
+                self.queue.clear()
+            self.center = dt
+            self.location_name = location_name
+            queued = {self._key(job_dt, loc) for _, job_dt, loc in self.queue}
+            for offset in self.NEIGHBOURS:
+                target = dt + offset
+                key = self._key(target, location_name)
+                if key not in self.cache and key not in queued and key != self.in_progress:
+                    self.queue.append((self.generation, target, location_name))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._worker, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def cancel(self):
+        with self.condition:
+            self.generation += 1
+            self.queue.clear()
+            self.cache.clear()
+
+    def pause(self):
+        """
+        يوقف كل حساب في الخلفية وينتظر انتهاء الجاري منه (الحساب المسبق يتوقف عند الجرم التالي
+        ويُعاد إلى رأس الطابور). يُستدعى من خيط الواجهة ويقابله resume.
+        """
+        with self.condition:
+            self.pauses += 1
+            while self.busy:
+                self.condition.wait()
+
+    def try_pause(self):
+        """
+        مثل pause لكن دون انتظار حساب أمامي (get أو get_async) قد يستغرق لقطة كاملة: تعيد False
+        ولا توقف شيئاً إن كان أحدها جارياً. عند True يقابلها resume.
+        """
+        with self.condition:
+            if self.foreground:
+                return False
+            self.pauses += 1
+            while self.busy:
+                self.condition.wait()
+            return True
+
+    def resume(self):
+        with self.condition:
+            self.pauses -= 1
+            self.condition.notify_all()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while not self.queue or self.pauses:
+                    self.condition.wait()
+                generation, dt, location_name = self.queue.popleft()
+                if generation != self.generation:
+                    continue
+                key = self._key(dt, location_name)
+                if key in self.cache:
+                    continue
+                self.in_progress = key
+                self.busy += 1
+            failed = False
+            try:
+                snapshot = compute_sky_snapshot(dt, location_name,
+                                                should_stop=lambda: generation != self.generation or self.pauses)
+            except Exception as e:
+                print("snapshot prefetch failed:", e)
+                snapshot, failed = None, True
+            with self.condition:
+                if generation == self.generation:
+                    if snapshot is not None:
+                        self._store(key, snapshot)
+                    elif not failed:
+                        # قُطع الحساب بسبب pause: يُستأنف بعد resume
+                        self.queue.appendleft((generation, dt, location_name))
+                self.in_progress = None
+                self.busy -= 1
+                self.condition.notify_all()
+
+sky_snapshots = SnapshotPrefetcher()
+
+# لقطة البدء الدافئ: آخر لقطة محسوبة تُحفظ عند الخروج أو الانتقال للخلفية، وتُعرض فور التشغيل التالي
+WARM_START_FILE = os.path.join(CACHE_FOLDER, "warm_start.npz")
+WARM_START_VERSION = 1
+WARM_BODY_DTYPE = np.dtype([('key', 'U24'), ('altitude', '<f8'), ('azimuth', '<f8'), ('visible', '?'),
+                            ('rise', 'U24'), ('set', 'U24')])
+
+def save_warm_snapshot(snapshot, path=WARM_START_FILE):
+    """يحفظ اللقطة في ملف npz صغير (بضعة كيلوبايت)؛ الكتابة إلى ملف مؤقت ثم استبداله كي لا يتلف عند الإنهاء."""
+    bodies = np.array([(key, b["altitude"], b["azimuth"], b["visible"], b["rise"], b["set"])
+                       for key, b in snapshot["bodies"].items()], dtype=WARM_BODY_DTYPE)
+    disc = snapshot["moon_disc"]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, version=WARM_START_VERSION, backend=EPHEMERIS_BACKEND,
+                 location=snapshot["location_name"], timestamp=snapshot["dt"].timestamp(),
+                 bodies=bodies, illumination=snapshot["illumination"], phase_angle=snapshot["phase_angle"],
+                 disc_names=np.array(list(disc)), disc_values=np.array(list(disc.values()), dtype=float))
+    os.replace(tmp_path, path)
+
+def load_warm_snapshot(path=WARM_START_FILE):
+    """
+    لقطة البدء الدافئ بصيغة compute_sky_snapshot نفسها، أو None إن لم توجد أو كانت من صيغة
+    أو محرك تقويم مختلف.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != WARM_START_VERSION or str(data["backend"]) != EPHEMERIS_BACKEND:
+                return None
+            location_name = str(data["location"])
+            bodies = {
+                str(row["key"]): {
+                    "altitude": float(row["altitude"]),
+                    "azimuth": float(row["azimuth"]),
+                    "visible": bool(row["visible"]),
+                    "rise": str(row["rise"]),
+                    "set": str(row["set"]),
+                }
+                for row in data["bodies"]
+            }
+            return {
+                "dt": unix_to_local(float(data["timestamp"]), get_location_timezone(location_name)),
+                "location_name": location_name,
+                "bodies": bodies,
+                "illumination": float(data["illumination"]),
+                "phase_angle": float(data["phase_angle"]),
+                "moon_disc": {str(k): float(v) for k, v in zip(data["disc_names"], data["disc_values"])},
+            }
+    except Exception as e:
+        print("warm-start snapshot unreadable, ignoring. Error:", e)
+        return None
+
+# -------------------------------------------------------------------
+# بناء الودجات على دفعات موزّعة على الإطارات
+FRAME_BUILD_BUDGET = 0.006  # ثوانٍ من كل إطار تُخصَّص لإنشاء الودجات وإضافتها
+
+class IncrementalBuildScheduler:
+    """
+    يبني محتوى الشاشات الثقيلة على دفعات: كل شاشة تمرّر مولّداً يعيد أزواج (الحاوية، قائمة ودجات)،
+    ويُنشئ المولّد الودجات عند طلب الدفعة فقط. تُضاف الدفعة الأولى فوراً فتظهر نتيجة جزئية في الحال،
+    ثم يستهلك Clock الباقي إطاراً بإطار دون تجاوز ميزانية زمنية واحدة مشتركة بين كل الشاشات.
+    بدء بناء جديد للشاشة نفسها (عند وصول وقت أحدث) يغلق مولّدها السابق قبل أن يكمل.
+    """
+    def __init__(self, budget=FRAME_BUILD_BUDGET):
+        self.budget = budget
+        self.jobs = OrderedDict()
+        self._event = None
+
+    def start(self, owner, generator):
+        self.cancel(owner)
+        self.jobs[owner] = generator
+        self._commit_next(owner, generator)
+        if self.jobs and self._event is None:
+            self._event = Clock.schedule_once(self._step, 0)
+
+    def cancel(self, owner):
+        generator = self.jobs.pop(owner, None)
+        if generator is not None:
+            generator.close()
+
+    def pending(self, owner):
+        return owner in self.jobs
+
+    def _commit_next(self, owner, generator):
+        try:
+            parent, widgets = next(generator)
+        except StopIteration:
+            if self.jobs.get(owner) is generator:
+                del self.jobs[owner]
+            return
+        for widget in widgets:
+            parent.add_widget(widget)
+
+    def _step(self, dt):
+        self._event = None
+        deadline = perf_counter() + self.budget
+        # الأقدم أولاً، فتكتمل الشاشات واحدة بعد أخرى بدلاً من أن تتقدم كلها ببطء
+        while self.jobs and perf_counter() < deadline:
+            owner, generator = next(iter(self.jobs.items()))
+            self._commit_next(owner, generator)
+        if self.jobs:
+            self._event = Clock.schedule_once(self._step, 0)
+
+widget_builds = IncrementalBuildScheduler()
+
 default_config = {
     'shadow_colour': hex_to_rgba("#333333"),
     'light_colour': hex_to_rgba("#6f456e"),
     'diameter': 150,
     'earthshine': 0.1,
-    'blur': 2,
+    'terminator_softness': 0.03,
+}
+
+# صورة اختيارية لوجه القمر القريب (إسقاط عمودي، الشمال للأعلى، كما يُرى بالعين)
+MOON_TEXTURE_FILE = "data/moon_disc.png"
+
+_moon_texture = None
+
+def get_moon_texture():
+    """نسيج صورة القمر إن وُجد الملف، يُحمَّل مرة واحدة؛ وإلا None فيُرسم القرص بالألوان فقط."""
+    global _moon_texture
+    if _moon_texture is None and os.path.exists(MOON_TEXTURE_FILE):
+        _moon_texture = CoreImage(MOON_TEXTURE_FILE, mipmap=True).texture
+    return _moon_texture
+
+# مظلل القرص: كل جزء يحسب متجه سطح الكرة عنده ويقارنه باتجاه الشمس، فيُرسم الطور بمرور واحد
+# وبزمن ثابت مهما كان الحجم. مكتوب بـ GLSL ES 1.0 ليعمل مع OpenGL البرمجي أيضاً.
+MOON_FRAGMENT_SHADER = """
+$HEADER$
+uniform vec2 limb_dir;
+uniform vec2 axis_dir;
+uniform float phase_angle;
+uniform vec2 libration;
+uniform float softness;
+uniform float earthshine;
+uniform float radius_px;
+uniform float use_texture;
+uniform vec2 texture_origin;
+uniform vec2 texture_scale;
+uniform vec4 light_colour;
+uniform vec4 shadow_colour;
+
+void main(void) {
+    vec2 p = tex_coord0 * 2.0 - 1.0;
+    float r = length(p);
+    float edge = 1.0 - smoothstep(1.0 - 1.5 / radius_px, 1.0, r);
+    if (edge <= 0.0) {
+        discard;
+    }
+    vec3 n = vec3(p, sqrt(max(0.0, 1.0 - r * r)));
+    vec3 sun = vec3(sin(phase_angle) * limb_dir, cos(phase_angle));
+    float lit = smoothstep(-softness, softness, dot(n, sun));
+
+    vec3 base = light_colour.rgb;
+    if (use_texture > 0.5) {
+        // النقطة في إطار القمر المتوسط (x نحو الشرق، y نحو الشمال) بعد إزاحتها بالترنح
+        vec2 east = vec2(axis_dir.y, -axis_dir.x);
+        vec3 v = vec3(dot(n.xy, east), dot(n.xy, axis_dir), n.z);
+        float cl = cos(libration.x);
+        float sl = sin(libration.x);
+        float cb = cos(libration.y);
+        float sb = sin(libration.y);
+        vec3 m = v.x * vec3(cl, 0.0, -sl) + v.y * vec3(-sb * sl, cb, -sb * cl) + v.z * vec3(cb * sl, sb, cb * cl);
+        vec3 surface = texture2D(texture0, texture_origin + texture_scale * (0.5 + 0.5 * m.xy)).rgb;
+        // ما يكشفه الترنح من الوجه البعيد غير موجود في الصورة فيُرسم بلون محايد
+        base = mix(vec3(0.35), surface, step(0.0, m.z));
+    }
+    // ضوء الأرض على الجزء المظلم يتبع طور الأرض كما يُرى من القمر
+    float earthlight = earthshine * 0.5 * (1.0 - cos(phase_angle));
+    vec3 dark = mix(shadow_colour.rgb, base, earthlight);
+    gl_FragColor = vec4(mix(dark, base, lit), edge) * frag_color;
 }
+"""
 
 # -------------------------------------------------------------------
 # ودجت رسم القمر
 class MoonPhaseWidget(Widget):
-    phase = NumericProperty(0.0)      
-    is_waxing = BooleanProperty(True) 
+    """
+    قرص القمر كما يُرى من الموقع وسمت الرأس للأعلى: الطرف المضيء في اتجاهه الحقيقي، وخط الفصل
+    بين الضوء والظل من هندسة الشمس والقمر، وضوء الأرض على الجزء المظلم، وصورة القمر (إن وُجدت)
+    مُدارة بزاوية محوره ومُزاحة بالترنح. geometry هو قاموس moon_disc_geometry.
+    """
+    geometry = ObjectProperty(None, allownone=True)
     config = ObjectProperty(default_config)
 
-    def update_canvas(self, *args):
-        self.canvas.clear()
-        with self.canvas:
-            side = min(self.width, self.height)
-            square_x = self.center_x - side/2
-            square_y = self.center_y - side/2
-
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        texture = get_moon_texture()
+        self.moon_context = RenderContext(use_parent_projection=True, use_parent_modelview=True,
+                                          use_parent_frag_modelview=True)
+        self.moon_context.shader.fs = MOON_FRAGMENT_SHADER
+        with self.moon_context:
             Color(1, 1, 1, 1)
-            Line(rectangle=(square_x, square_y, side, side), width=2)
-
-            margin = 10
-            diameter = side - margin
-            outer_pos = (square_x + margin/2, square_y + margin/2)
-
-            phase_value = self.phase
-            if phase_value < 0.5:
-                outer_colour = self.config.get('light_colour', default_config['light_colour'])
-                inner_colour = self.config.get('shadow_colour', default_config['shadow_colour'])
-                phase_adj = -phase_value if self.is_waxing else phase_value
-            else:
-                outer_colour = self.config.get('shadow_colour', default_config['shadow_colour'])
-                inner_colour = self.config.get('light_colour', default_config['light_colour'])
-                phase_adj = 1 - phase_value
-                if not self.is_waxing:
-                    phase_adj = -phase_adj
-
-            semi_phase = phase_adj * 2
-            inner_diameter, inner_offset = calc_inner(diameter, semi_phase)
-
-            Color(*outer_colour)
-            Ellipse(pos=outer_pos, size=(diameter, diameter))
-
-            StencilPush()
-            Ellipse(pos=outer_pos, size=(diameter, diameter))
-            StencilUse()
-            inner_x = outer_pos[0] + inner_offset
-            inner_y = self.center_y - inner_diameter/2
-            Color(*inner_colour)
-            Ellipse(pos=(inner_x, inner_y), size=(inner_diameter, inner_diameter))
-            StencilUnUse()
-            StencilPop()
+            # إحداثيات ثابتة من أسفل اليسار يحسب منها المظلل موضع الجزء على القرص، أما الصورة
+            # فتُقرأ عبر uvpos و uvsize الخاصين بها (قد تكون مقلوبة عمودياً أو جزءاً من أطلس)
+            self.disc = Rectangle(texture=texture, tex_coords=(0, 0, 1, 0, 1, 1, 0, 1))
+        self.moon_context['use_texture'] = 1.0 if texture is not None else 0.0
+        if texture is not None:
+            self.moon_context['texture_origin'] = tuple(map(float, texture.uvpos))
+            self.moon_context['texture_scale'] = tuple(map(float, texture.uvsize))
 
+        with self.canvas:
+            Color(1, 1, 1, 1)
+            self.frame = Line(width=2)
+        self.canvas.add(self.moon_context)
+        with self.canvas:
             Color(0, 0, 0, 1)
-            Line(circle=(self.center_x, self.center_y, diameter/2), width=1)
-
-    def on_size(self, *args):
-        self.update_canvas()
-
-    def on_phase(self, *args):
-        self.update_canvas()
-
-    def on_is_waxing(self, *args):
-        self.update_canvas()
+            self.outline = Line(width=1)
+
+        self.bind(pos=self.update_layout, size=self.update_layout,
+                  geometry=self.update_uniforms, config=self.update_uniforms)
+        self.update_layout()
+        self.update_uniforms()
+
+    def update_layout(self, *args):
+        side = min(self.width, self.height)
+        square_x = self.center_x - side / 2
+        square_y = self.center_y - side / 2
+        self.frame.rectangle = (square_x, square_y, side, side)
+
+        margin = 10
+        diameter = max(side - margin, 1)
+        self.disc.pos = (self.center_x - diameter / 2, self.center_y - diameter / 2)
+        self.disc.size = (diameter, diameter)
+        self.outline.circle = (self.center_x, self.center_y, diameter / 2)
+        self.moon_context['radius_px'] = float(diameter / 2)
+
+    def update_uniforms(self, *args):
+        g = self.geometry or {"phase_angle": 0.0, "bright_limb": 0.0, "axis": 0.0, "parallactic": 0.0,
+                              "libration_lon": 0.0, "libration_lat": 0.0}
+        # زوايا الموضع تُقاس من الشمال نحو الشرق، والشرق إلى اليسار في السماء؛ وسمت الرأس للأعلى
+        limb = np.radians(g["bright_limb"] - g["parallactic"])
+        axis = np.radians(g["axis"] - g["parallactic"])
+        ctx = self.moon_context
+        ctx['limb_dir'] = (float(-np.sin(limb)), float(np.cos(limb)))
+        ctx['axis_dir'] = (float(-np.sin(axis)), float(np.cos(axis)))
+        ctx['phase_angle'] = float(np.radians(g["phase_angle"]))
+        ctx['libration'] = (float(np.radians(g["libration_lon"])), float(np.radians(g["libration_lat"])))
+        ctx['softness'] = float(self.config.get('terminator_softness', default_config['terminator_softness']))
+        ctx['earthshine'] = float(self.config.get('earthshine', default_config['earthshine']))
+        ctx['light_colour'] = tuple(map(float, self.config.get('light_colour', default_config['light_colour'])))
+        ctx['shadow_colour'] = tuple(map(float, self.config.get('shadow_colour', default_config['shadow_colour'])))
 
 # -------------------------------------------------------------------
 # صندوق معلومات القمر
@@ -296,69 +2927,332 @@ class MoonContent(BoxLayout):
         self.update_content(dt)
 
     def update_content(self, dt):
-        oman_tz = pytz.timezone('Asia/Muscat')
-        dt_local = dt if dt.tzinfo else oman_tz.localize(dt)
-        dt_utc = dt_local.astimezone(pytz.UTC)
-        t = ts.from_datetime(dt_utc)
-        
-        illumination = float(almanac.fraction_illuminated(eph, "moon", t))
-        phase_angle = almanac.moon_phase(eph, t).degrees
+        local_tz = get_location_timezone()
+        dt_local = dt if dt.tzinfo else local_tz.localize(dt)
+        snapshot = sky_snapshots.get(dt_local)
+        illumination = snapshot["illumination"]
+        phase_angle = snapshot["phase_angle"]
         waxing = True if phase_angle < 180 else False
-        self.moon_widget.phase = illumination
-        self.moon_widget.is_waxing = waxing
+        disc = snapshot["moon_disc"]
+        self.moon_widget.geometry = disc
 
         phase_name = get_moon_phase_name(phase_angle, waxing)
-        phase_ar_map = {
-            "New Moon": "قمر جديد",
-            "Waxing Crescent": "الهلال متزايد",
-            "First Quarter": "التربيع الأول",
-            "Waxing Gibbous": "الأحدب المتزايد",
-            "Full Moon": "البدر",
-            "Waning Gibbous": "أحدب متناقص",
-            "Last Quarter": "التربيع الأخير",
-            "Waning Crescent": "الهلال المتناقص",
-            "Unknown": "غير معروف"
-        }
-        phase_name_ar = phase_ar_map.get(phase_name, phase_name)
+        phase_name_ar = MOON_PHASE_AR.get(phase_name, phase_name)
 
-        location = get_current_location()
-        observer = eph['earth'] + location
-        moon = eph["moon"]
-        astrometric = observer.at(t).observe(moon).apparent()
-        alt, az, _ = astrometric.altaz()
-        alt_deg = alt.degrees
-        az_deg = az.degrees
-
-        rise_str, set_str = get_rise_set(ts, dt, moon, include_date=True)
-        rise_str = rise_str.replace("AM", "ص").replace("PM", "م")
-        set_str = set_str.replace("AM", "ص").replace("PM", "م")
+        moon = snapshot["bodies"]["moon"]
+        alt_deg = moon["altitude"]
+        az_deg = moon["azimuth"]
+        rise_str, set_str = moon["rise"], moon["set"]
         
         info_text = (
             f"الطور: {phase_name_ar}\n"
             f"الشروق: {rise_str}\nالغروب: {set_str}\n"
             f"الارتفاع: {alt_deg:.2f}°\nالسمت: {az_deg:.2f}°\n"
-            f"نسبة الإضاءة: {illumination*100:.1f}%"
+            f"نسبة الإضاءة: {illumination*100:.1f}%\n"
+            f"الترنح: {disc['libration_lon']:+.1f}° طولاً، {disc['libration_lat']:+.1f}° عرضاً"
         )
         self.info_label.text = process_text(info_text)
 
 # -------------------------------------------------------------------
-# عنصر الكوكب (صورة + معلومات)
-class PlanetItem(BoxLayout):
-    def __init__(self, image_path, arabic_name, rise_str, set_str, altitude, azimuth, **kwargs):
+# التقويم الهجري
+class HijriCalendarContent(BoxLayout):
+    def __init__(self, dt, **kwargs):
         super().__init__(**kwargs)
-        self.orientation = 'vertical'
-        self.padding = 2
+        self.orientation = "vertical"
         self.spacing = 5
+        self.padding = [10, 10, 10, 10]
         self.size_hint_y = None
-        self.height = 200
-        with self.canvas.before:
-            Color(1, 1, 1, 1)
-            self.rect = Line(rectangle=(self.x, self.y, self.width, self.height), width=1)
-        self.bind(pos=self.update_rect, size=self.update_rect)
-        
-        rise_str = rise_str.replace("AM", "ص").replace("PM", "م")
-        set_str = set_str.replace("AM", "ص").replace("PM", "م")
-        
+        self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+        self.month_offset = 0
+        self.criterion = "conjunction"
+
+        nav_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=44, spacing=5)
+        next_btn = Button(
+            text=process_text("التالي"),
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='16sp',
+            size_hint_x=None, width=70,
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        next_btn.bind(on_release=lambda inst: self.shift_month(1))
+        nav_box.add_widget(next_btn)
+        self.title_label = Label(
+            text="",
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            halign="center", valign="middle"
+        )
+        self.title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        nav_box.add_widget(self.title_label)
+        prev_btn = Button(
+            text=process_text("السابق"),
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='16sp',
+            size_hint_x=None, width=70,
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        prev_btn.bind(on_release=lambda inst: self.shift_month(-1))
+        nav_box.add_widget(prev_btn)
+        self.add_widget(nav_box)
+
+        self.criterion_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='14sp',
+            size_hint_y=None, height=36,
+            background_normal='',
+            background_color=hex_to_rgba("#410a63")
+        )
+        self.criterion_button.bind(on_release=self.toggle_criterion)
+        self.add_widget(self.criterion_button)
+
+        self.phases_label = Label(
+            text="",
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None,
+            halign='center', valign='middle'
+        )
+        self.phases_label.bind(width=lambda inst, value: setattr(inst, 'text_size', (value, None)))
+        self.phases_label.bind(texture_size=lambda inst, value: setattr(inst, 'height', value[1]))
+        self.add_widget(self.phases_label)
+
+        self.days_grid = GridLayout(cols=4, spacing=2, size_hint_y=None)
+        self.days_grid.bind(minimum_height=self.days_grid.setter('height'))
+        self.add_widget(self.days_grid)
+
+        self.update_content(dt)
+
+    def shift_month(self, step):
+        self.month_offset += step
+        self.refresh()
+
+    def toggle_criterion(self, instance):
+        self.criterion = "crescent" if self.criterion == "conjunction" else "conjunction"
+        self.refresh()
+
+    def update_content(self, dt):
+        self.dt = dt
+        self.month_offset = 0
+        self.refresh()
+
+    def refresh(self):
+        self.criterion_button.text = process_text(
+            "بداية الشهر: رؤية الهلال" if self.criterion == "crescent" else "بداية الشهر: الاقتران"
+        )
+        widget_builds.cancel(self)
+        self.days_grid.clear_widgets()
+        month = compute_hijri_month(self.dt, self.month_offset, self.criterion)
+        if month is None:
+            self.title_label.text = process_text("خارج نطاق البيانات")
+            self.phases_label.text = ""
+            return
+
+        self.title_label.text = process_text(f"{HIJRI_MONTHS[month['month'] - 1]} {month['year']} هـ")
+        phase_lines = [f"{name}: {when.strftime('%d/%m %I:%M %p')}" for name, when in month["phases"]]
+        self.phases_label.text = process_text(
+            "\n".join(phase_lines).replace("AM", "ص").replace("PM", "م")
+        )
+
+        widget_builds.start(self, self.build_days(month["days"]))
+
+    def build_days(self, days):
+        selected_date = self.dt.date()
+        yield self.days_grid, [self._cell(header, bold=True) for header in ["الإضاءة", "الطور", "الميلادي", "الهجري"]]
+        for hijri_day, date_, illum, phase_name_ar in days:
+            highlight = date_ == selected_date
+            yield self.days_grid, [
+                self._cell(f"{illum * 100:.0f}%", highlight),
+                self._cell(phase_name_ar, highlight),
+                self._cell(date_.strftime("%d/%m/%Y"), highlight),
+                self._cell(str(hijri_day), highlight),
+            ]
+
+    def _cell(self, text, highlight=False, bold=False):
+        lbl = Label(
+            text=process_text(text),
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            bold=bold,
+            color=hex_to_rgba("#FDB813") if highlight else (1, 1, 1, 1),
+            size_hint_y=None,
+            height=28,
+            halign='center', valign='middle'
+        )
+        lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        return lbl
+
+# -------------------------------------------------------------------
+# مواقيت الصلاة والشفق
+class PrayerTimesContent(BoxLayout):
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+        self.asr_factor = 1
+
+        self.title_label = Label(
+            text="",
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        self.title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.title_label)
+
+        settings_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=70, spacing=5)
+        self.asr_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='14sp',
+            background_normal='',
+            background_color=hex_to_rgba("#410a63")
+        )
+        self.asr_button.bind(on_release=self.toggle_asr)
+        settings_box.add_widget(self.asr_button)
+        self.isha_adjuster = ValueAdjuster(18, 12, 20, on_value_change=lambda v: self.refresh())
+        settings_box.add_widget(self.isha_adjuster)
+        settings_box.add_widget(self._caption("العشاء°"))
+        self.fajr_adjuster = ValueAdjuster(18, 12, 20, on_value_change=lambda v: self.refresh())
+        settings_box.add_widget(self.fajr_adjuster)
+        settings_box.add_widget(self._caption("الفجر°"))
+        self.add_widget(settings_box)
+
+        self.times_grid = GridLayout(cols=2, spacing=2, size_hint_y=None)
+        self.times_grid.bind(minimum_height=self.times_grid.setter('height'))
+        self.add_widget(self.times_grid)
+
+        export_btn = Button(
+            text=process_text("تصدير جدول السنة (CSV)"),
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='16sp',
+            size_hint_y=None, height=44,
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        export_btn.bind(on_release=self.export_year)
+        self.add_widget(export_btn)
+
+        self.status_label = Label(
+            text="",
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=30,
+            halign="center", valign="middle"
+        )
+        self.status_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.status_label)
+
+        self.update_content(dt)
+
+    def _caption(self, text):
+        lbl = Label(
+            text=process_text(text),
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_x=None, width=50
+        )
+        return lbl
+
+    def toggle_asr(self, instance):
+        self.asr_factor = 2 if self.asr_factor == 1 else 1
+        self.refresh()
+
+    def current_table(self):
+        return compute_solar_timetable(
+            self.dt.year,
+            fajr_angle=float(self.fajr_adjuster.current_value),
+            isha_angle=float(self.isha_adjuster.current_value),
+            asr_factor=self.asr_factor
+        )
+
+    def update_content(self, dt):
+        self.dt = dt
+        self.refresh()
+
+    def refresh(self):
+        self.asr_button.text = process_text("العصر: حنفي" if self.asr_factor == 2 else "العصر: الجمهور")
+        self.title_label.text = process_text(f"مواقيت يوم {self.dt.strftime('%d/%m/%Y')}")
+        self.status_label.text = ""
+        table = self.current_table()
+        day_index = (self.dt.date() - table["dates"][0]).days
+
+        self.times_grid.clear_widgets()
+        for name, label in PRAYER_EVENTS + TWILIGHT_EVENTS:
+            local_time = tt_to_local(table["events"][name][day_index], table["tz"])[0]
+            time_str = local_time.strftime("%I:%M %p") if local_time else "--"
+            time_str = time_str.replace("AM", "ص").replace("PM", "م")
+            self.times_grid.add_widget(self._row_label(time_str))
+            self.times_grid.add_widget(self._row_label(label))
+
+    def _row_label(self, text):
+        lbl = Label(
+            text=process_text(text),
+            font_size='15sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=30,
+            halign="center", valign="middle"
+        )
+        lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        return lbl
+
+    def export_year(self, instance):
+        loc = getattr(App.get_running_app(), "current_location_name", "مسقط")
+        path = os.path.join(EXPORT_FOLDER, f"solar_{loc}_{self.dt.year}.csv")
+        export_solar_timetable_csv(self.current_table(), path)
+        self.status_label.text = process_text(f"تم الحفظ: {path}")
+
+# -------------------------------------------------------------------
+# أطلس الأيقونات: صور planetimg مصغّرة ومجمّعة في نسيج واحد وقت البناء (tools/build_icon_atlas.py)
+ICON_FOLDER = "planetimg"
+ICON_ATLAS = "data/icons"
+
+_icon_atlas = None
+
+def preload_icon_atlas():
+    """
+    يحمّل أطلس الأيقونات مرة واحدة ويسجّله في ذاكرة Kivy للأطالس، فتُحل بعدها روابط atlas://
+    من الذاكرة دون قراءة ملفات. يعيد None إن لم يُبنَ الأطلس (التشغيل من المصدر مباشرة).
+    """
+    global _icon_atlas
+    if _icon_atlas is None and os.path.exists(ICON_ATLAS + ".atlas"):
+        _icon_atlas = Atlas(ICON_ATLAS + ".atlas")
+        Cache.append('kv.atlas', ICON_ATLAS, _icon_atlas)
+    return _icon_atlas
+
+def icon_source(name):
+    """مصدر الأيقونة name: منطقتها في الأطلس إن وُجدت فيه، وإلا ملفها المستقل في planetimg."""
+    atlas = preload_icon_atlas()
+    if atlas is not None and name in atlas.textures:
+        return f"atlas://{ICON_ATLAS}/{name}"
+    return f"{ICON_FOLDER}/{name}.png"
+
+# -------------------------------------------------------------------
+# عنصر الكوكب (صورة + معلومات)
+class PlanetItem(BoxLayout):
+    def __init__(self, icon_name, arabic_name, rise_str, set_str, altitude, azimuth, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = 'vertical'
+        self.padding = 2
+        self.spacing = 5
+        self.size_hint_y = None
+        self.height = 200
+        with self.canvas.before:
+            Color(1, 1, 1, 1)
+            self.rect = Line(rectangle=(self.x, self.y, self.width, self.height), width=1)
+        self.bind(pos=self.update_rect, size=self.update_rect)
+        
+        rise_str = rise_str.replace("AM", "ص").replace("PM", "م")
+        set_str = set_str.replace("AM", "ص").replace("PM", "م")
+        
         top_box = BoxLayout(orientation='horizontal', spacing=5, size_hint_y=None, height=40)
         top_box.add_widget(Widget(size_hint_x=1))
         name_label = Label(
@@ -368,7 +3262,7 @@ class PlanetItem(BoxLayout):
         )
         name_label.bind(size=lambda inst, val: setattr(inst, 'text_size', (inst.width, None)))
         top_box.add_widget(name_label)
-        img = Image(source=image_path, size_hint_x=None, width=30)
+        img = Image(source=icon_source(icon_name), size_hint_x=None, width=30)
         top_box.add_widget(img)
         top_box.add_widget(Widget(size_hint_x=1))
         self.add_widget(top_box)
@@ -390,64 +3284,1287 @@ class PlanetItem(BoxLayout):
     def update_rect(self, *args):
         self.rect.rectangle = (self.x + 5, self.y, self.width - 10, self.height)
 
-class PlanetsContent(BoxLayout):
+class PlanetsContent(BoxLayout):
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.update_content(dt)
+
+    def update_content(self, dt):
+        self.clear_widgets()
+        widget_builds.start(self, self.build_items(dt))
+
+    def build_items(self, dt):
+        local_tz = get_location_timezone()
+        dt_local = dt if dt.tzinfo else local_tz.localize(dt)
+        snapshot = sky_snapshots.get(dt_local)
+
+        planets = {
+            'venus': 'الزهرة',
+            'mercury': 'عطارد',
+            'JUPITER BARYCENTER': 'المشتري',
+            'mars': 'المريخ',
+            'Uranus BARYCENTER': 'أورانوس',
+            'SATURN BARYCENTER': 'زحل',
+            'Neptune BARYCENTER': 'نبتون'
+        }
+        icon_map = {
+            'mercury': 'mercury',
+            'venus': 'venus',
+            'mars': 'mars',
+            'JUPITER BARYCENTER': 'jupiter',
+            'SATURN BARYCENTER': 'saturn',
+            'Uranus BARYCENTER': 'uranus',
+            'Neptune BARYCENTER': 'neptune'
+        }
+
+        grid = GridLayout(cols=2, spacing=10, size_hint_y=None)
+        grid.bind(minimum_height=grid.setter('height'))
+        yield self, [grid]
+
+        for key, arabic_name in planets.items():
+            body = snapshot["bodies"][key]
+            alt_corrected = apply_refraction_correction(body["altitude"])
+            item = PlanetItem(
+                icon_name=icon_map[key],
+                arabic_name=arabic_name,
+                rise_str=snapshot_time(body["rise"]),
+                set_str=snapshot_time(body["set"]),
+                altitude=alt_corrected,
+                azimuth=body["azimuth"]
+            )
+            yield grid, [item]
+
+# -------------------------------------------------------------------
+# قائمة الأحداث الفلكية القادمة
+class EventsContent(BoxLayout):
+    FILTERS = [None, [EVENT_CONJUNCTION, EVENT_MOON_APPROACH], [EVENT_OPPOSITION, EVENT_ELONGATION],
+               [EVENT_SEASON]]
+    FILTER_NAMES = ["كل الأحداث", "الاقترانات", "التقابلات والاستطالات", "الفصول"]
+    DAYS_AHEAD = 365
+
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+        self.filter_index = 0
+
+        self.filter_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='16sp',
+            size_hint_y=None, height=44,
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        self.filter_button.bind(on_release=self.cycle_filter)
+        self.add_widget(self.filter_button)
+
+        self.events_grid = GridLayout(cols=2, spacing=2, size_hint_y=None)
+        self.events_grid.bind(minimum_height=self.events_grid.setter('height'))
+        self.add_widget(self.events_grid)
+
+        self.update_content(dt)
+
+    def _cell(self, text, width=None):
+        lbl = Label(
+            text=process_text(text),
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        if width:
+            lbl.size_hint_x = None
+            lbl.width = width
+        lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        return lbl
+
+    def cycle_filter(self, instance):
+        self.filter_index = (self.filter_index + 1) % len(self.FILTERS)
+        self.refresh()
+
+    def update_content(self, dt):
+        self.dt = dt
+        self.refresh()
+
+    def refresh(self):
+        self.filter_button.text = process_text(self.FILTER_NAMES[self.filter_index])
+        local_tz = get_location_timezone()
+        dt_local = self.dt if self.dt.tzinfo else local_tz.localize(self.dt)
+        tt0 = ts.from_datetime(dt_local.astimezone(pytz.UTC)).tt
+        events = astronomical_event_index.between(tt0, tt0 + self.DAYS_AHEAD, self.FILTERS[self.filter_index])
+
+        self.events_grid.clear_widgets()
+        widget_builds.start(self, self.build_rows(events, local_tz))
+
+    def build_rows(self, events, local_tz):
+        local_times = tt_to_local(events['tt'], local_tz)
+        for event, local_time in zip(events, local_times):
+            when = local_time.strftime("%d/%m/%Y %I:%M %p").replace("AM", "ص").replace("PM", "م")
+            yield self.events_grid, [self._cell(describe_event(event)), self._cell(when, width=130)]
+
+# -------------------------------------------------------------------
+# قائمة ممرات الأقمار الصناعية
+class SatellitePassesContent(BoxLayout):
+    DAY_OPTIONS = [1, 3, 7]
+    MAX_ROWS = 150
+
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+        self.days = 7
+        self.visible_only = True
+
+        controls = BoxLayout(orientation="horizontal", size_hint_y=None, height=44, spacing=5)
+        self.days_button = self._button(self.cycle_days)
+        controls.add_widget(self.days_button)
+        self.filter_button = self._button(self.toggle_filter)
+        controls.add_widget(self.filter_button)
+        self.add_widget(controls)
+
+        self.status_label = Label(
+            text="",
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=50,
+            halign="center", valign="middle"
+        )
+        self.status_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.status_label)
+
+        self.passes_grid = GridLayout(cols=4, spacing=2, size_hint_y=None)
+        self.passes_grid.bind(minimum_height=self.passes_grid.setter('height'))
+        self.add_widget(self.passes_grid)
+
+        self.update_content(dt)
+
+    def _button(self, callback):
+        btn = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='15sp',
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        btn.bind(on_release=callback)
+        return btn
+
+    def _cell(self, text):
+        lbl = Label(
+            text=process_text(text),
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=44,
+            halign="center", valign="middle"
+        )
+        lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        return lbl
+
+    def cycle_days(self, instance):
+        i = self.DAY_OPTIONS.index(self.days)
+        self.days = self.DAY_OPTIONS[(i + 1) % len(self.DAY_OPTIONS)]
+        self.refresh()
+
+    def toggle_filter(self, instance):
+        self.visible_only = not self.visible_only
+        self.refresh()
+
+    def update_content(self, dt):
+        self.dt = dt
+        self.refresh()
+
+    def refresh(self):
+        self.days_button.text = process_text(f"المدة: {self.days} أيام" if self.days > 1 else "المدة: يوم واحد")
+        self.filter_button.text = process_text("المرئية فقط" if self.visible_only else "كل الممرات")
+        widget_builds.cancel(self)
+        self.passes_grid.clear_widgets()
+
+        satellites = load_tle_files()
+        if not satellites:
+            self.status_label.text = process_text(
+                f"لا توجد بيانات مدارية. ضع ملف TLE في مجلد {SATELLITE_FOLDER}")
+            return
+
+        local_tz = get_location_timezone()
+        dt_local = self.dt if self.dt.tzinfo else local_tz.localize(self.dt)
+        passes = compute_satellite_passes(dt_local, days=self.days, satellites=satellites)
+        if self.visible_only:
+            passes = [p for p in passes if p["visible"]]
+        self.status_label.text = process_text(
+            f"{len(passes)} ممراً لـ {len(satellites)} قمراً صناعياً (ارتفاع أعلى من 10°)")
+
+        widget_builds.start(self, self.build_rows(passes[:self.MAX_ROWS], local_tz))
+
+    def build_rows(self, passes, local_tz):
+        yield self.passes_grid, [self._cell(header) for header in ["الحالة", "أقصى ارتفاع", "الطلوع ← الغروب", "القمر"]]
+        for p in passes:
+            rise = jd_to_local(p["rise"], local_tz)
+            set_ = jd_to_local(p["set"], local_tz)
+            if p["visible"]:
+                state = "مرئي"
+            elif p["sunlit"]:
+                state = "مضاء نهاراً"
+            else:
+                state = "في ظل الأرض"
+            yield self.passes_grid, [
+                self._cell(state),
+                self._cell(f"{p['max_altitude']:.0f}°"),
+                self._cell(f"{rise.strftime('%d/%m %H:%M')} ← {set_.strftime('%H:%M')}"),
+                self._cell(p["name"]),
+            ]
+
+class ComparisonRow(BoxLayout):
+    """
+    صف واحد في قوائم RecycleView (مقارنة المواقع، الكويكبات والمذنبات)؛ تُعاد الصفوف نفسها
+    بتعيين الخصائص فقط، وتُنشأ التسميات عند أول تعيين بعدد الخلايا.
+    """
+    cells = ListProperty([])
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "horizontal"
+        self.labels = []
+        self.bind(cells=self.on_cells)
+
+    def on_cells(self, instance, cells):
+        while len(self.labels) < len(cells):
+            lbl = Label(
+                font_size='13sp',
+                font_name="fonts/Amiri-Regular.ttf",
+                halign="center", valign="middle"
+            )
+            lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+            self.labels.append(lbl)
+            self.add_widget(lbl)
+        for lbl, text in zip(self.labels, cells):
+            lbl.text = text
+
+class SortableTableContent(BoxLayout):
+    """
+    جدول RecycleView بعنوان وأزرار ترويسة تفرز حسب العمود (الضغط ثانية يعكس الاتجاه)، وصفوفه ComparisonRow.
+    ترث منه الشاشات وتحدد COLUMNS و DEFAULT_SORT و update_content (تملأ self.rows ثم تستدعي refresh_list)
+    وقد تغيّر row_cells (نص كل عمود كما هو افتراضياً)، وتضيف عناصر تحكم بين العنوان والترويسة عبر add_controls.
+    """
+    # (المفتاح، العنوان) بترتيب العرض من اليسار إلى اليمين
+    COLUMNS = []
+    DEFAULT_SORT = "name"
+    ROW_HEIGHT = 40
+    VISIBLE_ROWS = 12
+
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+        self.sort_key = self.DEFAULT_SORT
+        self.sort_reverse = False
+        self.rows = []
+
+        self.title_label = Label(
+            text="",
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        self.title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.title_label)
+        self.add_controls()
+
+        header = BoxLayout(orientation="horizontal", size_hint_y=None, height=44, spacing=2)
+        self.header_buttons = {}
+        for key, title in self.COLUMNS:
+            btn = Button(
+                text="",
+                font_name="fonts/Amiri-Regular.ttf",
+                font_size='13sp',
+                background_normal='',
+                background_color=hex_to_rgba("#521876")
+            )
+            btn.bind(on_release=lambda inst, k=key: self.sort_by(k))
+            self.header_buttons[key] = btn
+            header.add_widget(btn)
+        self.add_widget(header)
+
+        self.list_view = RecycleView(size_hint_y=None, height=self.ROW_HEIGHT * self.VISIBLE_ROWS,
+                                     do_scroll_x=False)
+        rows_layout = RecycleBoxLayout(orientation="vertical", size_hint_y=None,
+                                       default_size=(None, self.ROW_HEIGHT), default_size_hint=(1, None))
+        rows_layout.bind(minimum_height=rows_layout.setter('height'))
+        self.list_view.add_widget(rows_layout)
+        # viewclass يُمرَّر إلى مدير التخطيط، فيُضبط بعد إضافته
+        self.list_view.viewclass = ComparisonRow
+        self.add_widget(self.list_view)
+
+        self.update_content(dt)
+
+    def add_controls(self):
+        pass
+
+    def row_cells(self, row):
+        return [str(row[key]) for key, _ in self.COLUMNS]
+
+    def sort_by(self, key):
+        if key == self.sort_key:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_key, self.sort_reverse = key, False
+        self.refresh_list()
+
+    def refresh_list(self):
+        for key, title in self.COLUMNS:
+            arrow = (" ▼" if self.sort_reverse else " ▲") if key == self.sort_key else ""
+            self.header_buttons[key].text = process_text(title) + arrow
+
+        if self.sort_key == "name":
+            rows = sorted(self.rows, key=lambda r: r["name"], reverse=self.sort_reverse)
+        else:
+            # الصفوف التي لا يقع فيها الحدث (NaN) تبقى في آخر القائمة في الاتجاهين
+            present = [r for r in self.rows if not np.isnan(r[self.sort_key])]
+            missing = [r for r in self.rows if np.isnan(r[self.sort_key])]
+            rows = sorted(present, key=lambda r: r[self.sort_key], reverse=self.sort_reverse) + missing
+
+        self.list_view.data = [{"cells": self.row_cells(r)} for r in rows]
+
+class LocationComparisonContent(SortableTableContent):
+    COLUMNS = [
+        ("moon_altitude", "ارتفاع القمر"),
+        ("moonset", "غروب القمر"),
+        ("moonrise", "شروق القمر"),
+        ("sunset", "غروب الشمس"),
+        ("sunrise", "شروق الشمس"),
+        ("name", "الموقع"),
+    ]
+    DEFAULT_SORT = "name"
+
+    def update_content(self, dt):
+        local_tz = get_location_timezone()
+        self.dt = dt if dt.tzinfo else local_tz.localize(dt)
+        self.title_label.text = process_text(
+            f"مقارنة المواقع ليوم {self.dt.strftime('%d/%m/%Y')} (بالتوقيت المحلي لكل موقع)")
+
+        comparison = compute_location_comparison(self.dt.date())
+        moon_altitude = location_comparison_moon_altitude(comparison, self.dt)
+        clock = {name: location_comparison_clock(comparison, name) for name, _, _ in COMPARISON_EVENTS}
+        self.rows = []
+        for i, name in enumerate(comparison["names"]):
+            row = {"name": name, "moon_altitude": moon_altitude[i]}
+            for event, _, _ in COMPARISON_EVENTS:
+                row[event] = comparison["events"][event][i]
+                row[event + "_text"] = clock[event][i]
+            row["shaped_name"] = process_text(name)
+            self.rows.append(row)
+        self.refresh_list()
+
+    def row_cells(self, row):
+        cells = []
+        for key, _ in self.COLUMNS:
+            if key == "name":
+                cells.append(row["shaped_name"])
+            elif key == "moon_altitude":
+                cells.append(f"{row['moon_altitude']:.1f}°")
+            else:
+                cells.append(row[key + "_text"])
+        return cells
+
+class MinorBodiesContent(SortableTableContent):
+    COLUMNS = [
+        ("set", "الغروب"),
+        ("rise", "الشروق"),
+        ("azimuth", "السمت"),
+        ("altitude", "الارتفاع"),
+        ("magnitude", "القدر"),
+        ("name", "الجرم"),
+    ]
+    DEFAULT_SORT = "magnitude"
+
+    def add_controls(self):
+        settings_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=70, spacing=5)
+        self.status_label = Label(
+            text="",
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            halign="center", valign="middle"
+        )
+        self.status_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        settings_box.add_widget(self.status_label)
+        self.magnitude_adjuster = ValueAdjuster(12, 6, 20, on_value_change=lambda v: self.refresh())
+        settings_box.add_widget(self.magnitude_adjuster)
+        settings_box.add_widget(Label(
+            text=process_text("القدر الحدّي"),
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_x=None, width=80
+        ))
+        self.add_widget(settings_box)
+
+    def update_content(self, dt):
+        local_tz = get_location_timezone()
+        self.dt = dt if dt.tzinfo else local_tz.localize(dt)
+        self.refresh()
+
+    def refresh(self):
+        local_tz = get_location_timezone()
+        limit = float(self.magnitude_adjuster.current_value)
+        self.title_label.text = process_text(
+            f"الكويكبات والمذنبات في {self.dt.strftime('%d/%m/%Y %H:%M')}")
+
+        result = compute_minor_bodies(self.dt, limiting_magnitude=limit)
+        if result["total"] == 0:
+            self.status_label.text = process_text(
+                f"ضع ملف عناصر MPC (MPCORB.DAT أو CometEls.txt) في مجلد {MINOR_BODY_FOLDER}")
+        else:
+            self.status_label.text = process_text(
+                f"{result['bright']} من {result['total']} أسطع من القدر {limit:g}"
+                + (f"، يُعرض أسطع {len(result['names'])}" if result["bright"] > len(result["names"]) else ""))
+
+        clock = {event: format_clock(tt_to_local_seconds(result[event], local_tz)) for event in ("rise", "set")}
+        self.rows = []
+        for i, name in enumerate(result["names"]):
+            row = {key: float(result[key][i]) for key in ("magnitude", "altitude", "azimuth", "rise", "set")}
+            row["name"] = name
+            row["rise_text"], row["set_text"] = clock["rise"][i], clock["set"][i]
+            self.rows.append(row)
+        self.refresh_list()
+
+    def row_cells(self, row):
+        return [row["set_text"], row["rise_text"], f"{row['azimuth']:.0f}°", f"{row['altitude']:.1f}°",
+                f"{row['magnitude']:.1f}", row["name"]]
+
+# -------------------------------------------------------------------
+# مخطط مسار الشمس وشكل الأنالِما
+SUN_PATH_MONTH_COLOURS = ["#4fc3f7", "#81d4fa", "#aed581", "#dce775", "#fff176", "#ffb74d",
+                          "#ff8a65", "#ffb74d", "#fff176", "#dce775", "#aed581", "#81d4fa"]
+
+def polar_segments(alt, az, cx, cy, radius):
+    """
+    نقاط Line لمسار فوق الأفق في مخطط قطبي متساوي الأبعاد (الأفق عند الحافة والسمت عند المركز،
+    الشمال إلى الأعلى والشرق إلى اليمين)، مقسومة إلى أجزاء متصلة حيث يعبر المسار الأفق.
+    """
+    alt = np.asarray(alt, dtype=np.float64)
+    az = np.radians(np.asarray(az, dtype=np.float64))
+    r = (90.0 - alt) / 90.0 * radius
+    xy = np.stack([cx + r * np.sin(az), cy + r * np.cos(az)], axis=-1)
+    above = alt > 0
+    edges = np.flatnonzero(np.diff(above.astype(np.int8))) + 1
+    segments = []
+    for start, stop in zip(np.concatenate([[0], edges]), np.concatenate([edges, [len(alt)]])):
+        if above[start] and stop - start > 1:
+            segments.append(xy[start:stop].ravel().tolist())
+    return segments
+
+class SunPathWidget(Widget):
+    """
+    مخطط قطبي لمسار الشمس: منحنى يوم 21 من كل شهر، وشكل الأنالِما عند ساعة محددة، ومسار اليوم الحالي
+    وموضع الشمس. كل المنحنيات تُقتطع مباشرة من شبكة sun_path_grid، وكل طبقة في مجموعة تعليمات خاصة بها:
+    تغيير الساعة أو الدقيقة يحرّك العلامة فقط، وتغيير اليوم أو ساعة الأنالِما يعيد بناء منحناه وحده.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.grid = None
+        self.year = 2001
+        self.day_index = 0
+        self.minute = 0
+        self.analemma_hour = 12
+        self.static_group = InstructionGroup()
+        self.analemma_group = InstructionGroup()
+        self.day_group = InstructionGroup()
+        for group in (self.static_group, self.analemma_group, self.day_group):
+            self.canvas.add(group)
+        with self.canvas:
+            Color(*hex_to_rgba("#ffd54f"))
+            self.marker = Ellipse(pos=(0, 0), size=(0, 0))
+        self.bind(pos=self.redraw, size=self.redraw)
+
+    def set_state(self, grid, year, day_index, minute, analemma_hour):
+        day_index = min(day_index, len(grid) - 1)
+        rebuild = grid is not self.grid or year != self.year
+        new_day = day_index != self.day_index
+        new_analemma = analemma_hour != self.analemma_hour
+        self.grid = grid
+        self.year = year
+        self.day_index = day_index
+        self.minute = minute
+        self.analemma_hour = analemma_hour
+        if rebuild:
+            self.redraw()
+            return
+        if new_analemma:
+            self.draw_analemma()
+        if new_day:
+            self.draw_day()
+        self.draw_marker()
+
+    def _geometry(self):
+        cx, cy = self.center
+        return cx, cy, min(self.width, self.height) / 2 - 10
+
+    def _add_curve(self, group, column, width):
+        cx, cy, radius = self._geometry()
+        for points in polar_segments(column[:, 0], column[:, 1], cx, cy, radius):
+            group.add(Line(points=points, width=width))
+
+    def redraw(self, *args):
+        self.static_group.clear()
+        if self.grid is None:
+            self.analemma_group.clear()
+            self.day_group.clear()
+            self.marker.size = (0, 0)
+            return
+        cx, cy, radius = self._geometry()
+        self.static_group.add(Color(1, 1, 1, 0.35))
+        for alt in (0, 30, 60):
+            self.static_group.add(Line(circle=(cx, cy, (90 - alt) / 90 * radius), width=1))
+        self.static_group.add(Line(points=[cx - radius, cy, cx + radius, cy], width=1))
+        self.static_group.add(Line(points=[cx, cy - radius, cx, cy + radius], width=1))
+
+        year_start = datetime.date(self.year, 1, 1)
+        for month, colour in enumerate(SUN_PATH_MONTH_COLOURS, start=1):
+            day = (datetime.date(self.year, month, 21) - year_start).days
+            self.static_group.add(Color(*hex_to_rgba(colour, 0.8)))
+            self._add_curve(self.static_group, self.grid[day], 1)
+
+        self.draw_analemma()
+        self.draw_day()
+        self.draw_marker()
+
+    def draw_analemma(self):
+        self.analemma_group.clear()
+        self.analemma_group.add(Color(*hex_to_rgba("#e040fb")))
+        self._add_curve(self.analemma_group, self.grid[:, self.analemma_hour * 60], 1.5)
+
+    def draw_day(self):
+        self.day_group.clear()
+        self.day_group.add(Color(1, 1, 1, 1))
+        self._add_curve(self.day_group, self.grid[self.day_index], 2)
+
+    def draw_marker(self):
+        alt, az = (float(v) for v in self.grid[self.day_index, self.minute])
+        if alt <= 0:
+            self.marker.size = (0, 0)
+            return
+        cx, cy, radius = self._geometry()
+        r = (90.0 - alt) / 90.0 * radius
+        x = cx + r * math.sin(math.radians(az))
+        y = cy + r * math.cos(math.radians(az))
+        self.marker.pos = (x - 7, y - 7)
+        self.marker.size = (14, 14)
+
+class SunPathContent(BoxLayout):
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+
+        self.title_label = Label(
+            text="",
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        self.title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.title_label)
+
+        self.chart = SunPathWidget(size_hint_y=None, height=400)
+        self.add_widget(self.chart)
+
+        hour_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=70, spacing=5)
+        hour_box.add_widget(Widget())
+        self.hour_adjuster = ValueAdjuster(dt.hour, 0, 23, rollover=True,
+                                           on_value_change=lambda v: self.refresh())
+        hour_box.add_widget(self.hour_adjuster)
+        hour_caption = Label(
+            text=process_text("ساعة الأنالِما"),
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_x=None, width=110
+        )
+        hour_box.add_widget(hour_caption)
+        hour_box.add_widget(Widget())
+        self.add_widget(hour_box)
+
+        self.info_label = Label(
+            text="",
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None,
+            halign='center', valign='middle'
+        )
+        self.info_label.bind(width=lambda inst, value: setattr(inst, 'text_size', (value, None)))
+        self.info_label.bind(texture_size=lambda inst, value: setattr(inst, 'height', value[1]))
+        self.add_widget(self.info_label)
+
+        self.update_content(dt)
+
+    def update_content(self, dt):
+        self.dt = dt
+        self.refresh()
+
+    def refresh(self):
+        loc = getattr(App.get_running_app(), "current_location_name", "مسقط")
+        self.title_label.text = process_text(f"مسار الشمس لعام {self.dt.year} - {loc}")
+        grid = sun_path_grid(self.dt.year)
+        day_index = self.dt.timetuple().tm_yday - 1
+        minute = self.dt.hour * 60 + self.dt.minute
+        self.chart.set_state(grid, self.dt.year, day_index, minute, int(self.hour_adjuster.current_value))
+
+        alt, az = (float(v) for v in grid[min(day_index, len(grid) - 1), minute])
+        self.info_label.text = process_text(
+            f"الآن: الارتفاع {alt:.1f}° | السمت {az:.1f}°\n"
+            f"الدوائر: الأفق و30° و60° | الشمال إلى الأعلى والشرق إلى اليمين\n"
+            f"منحنيات يوم 21 من كل شهر، والأنالِما بالبنفسجي عند الساعة "
+            f"{int(self.hour_adjuster.current_value):02d}:00")
+
+# -------------------------------------------------------------------
+# مخطط ارتفاعات الليلة
+# أحزمة الشفق: (أدنى ارتفاع للشمس، اللون)؛ ما تحت آخر حزام ليل كامل بلون الخلفية
+TWILIGHT_BANDS = [
+    (SUNRISE_ALTITUDE, hex_to_rgba("#3d6e9e", 0.55)),
+    (-6.0, hex_to_rgba("#2c4f80", 0.55)),
+    (-12.0, hex_to_rgba("#1f3463", 0.55)),
+    (-18.0, hex_to_rgba("#17204a", 0.55)),
+]
+NIGHT_CHART_MIN_ALT = -10.0
+NIGHT_CHART_MAX_ALT = 90.0
+
+class NightAltitudeChart(Widget):
+    """
+    منحنى ارتفاع لكل جرم عبر الليل فوق أحزمة الشفق المظللة.
+    تُنشأ تعليمات الرسم مرة واحدة؛ عند تغيير التاريخ أو الحجم تُستبدل نقاط كل Line
+    ورؤوس Mesh الأحزمة في مكانها فقط.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.night = None
+        self.current_tt = None
+        self.band_meshes = []
+        self.lines = {}
+        with self.canvas:
+            for _, rgba in TWILIGHT_BANDS:
+                Color(*rgba)
+                self.band_meshes.append(Mesh(mode='triangles'))
+            Color(1, 1, 1, 0.35)
+            self.grid_lines = [Line(points=[], width=1) for _ in range(4)]
+            Color(1, 1, 1, 0.8)
+            self.horizon_line = Line(points=[], width=1.2)
+            for key, _, colour in NIGHT_BODIES:
+                Color(*hex_to_rgba(colour))
+                self.lines[key] = Line(points=[], width=1.5)
+            Color(*hex_to_rgba("#e040fb"))
+            self.now_line = Line(points=[], width=1.2)
+        self.bind(pos=self.redraw, size=self.redraw)
+
+    def set_night(self, night, current_tt=None):
+        self.night = night
+        self.current_tt = current_tt
+        self.redraw()
+
+    def _y(self, alt):
+        alt = np.clip(alt, NIGHT_CHART_MIN_ALT, NIGHT_CHART_MAX_ALT)
+        return self.y + (alt - NIGHT_CHART_MIN_ALT) / (NIGHT_CHART_MAX_ALT - NIGHT_CHART_MIN_ALT) * self.height
+
+    def redraw(self, *args):
+        if self.night is None:
+            return
+        tt = self.night["tt"][0]
+        x = self.x + (tt - tt[0]) / (tt[-1] - tt[0]) * self.width
+
+        # كل فترة بين عينتين تُظلَّل بحزام ارتفاع الشمس في منتصفها
+        sun = self.night["sun"][0]
+        sun_mid = (sun[:-1] + sun[1:]) / 2
+        upper = np.inf
+        for (lower, _), mesh in zip(TWILIGHT_BANDS, self.band_meshes):
+            idx = np.flatnonzero((sun_mid < upper) & (sun_mid >= lower))
+            quads = np.zeros((len(idx), 4, 4), dtype=np.float32)
+            quads[:, 0, :2] = np.stack([x[idx], np.full(len(idx), self.y)], axis=-1)
+            quads[:, 1, :2] = np.stack([x[idx + 1], np.full(len(idx), self.y)], axis=-1)
+            quads[:, 2, :2] = np.stack([x[idx + 1], np.full(len(idx), self.top)], axis=-1)
+            quads[:, 3, :2] = np.stack([x[idx], np.full(len(idx), self.top)], axis=-1)
+            set_mesh_data(mesh, quads.reshape(-1), _QUAD_INDICES[:len(idx)].reshape(-1))
+            upper = lower
+
+        for line, alt in zip(self.grid_lines, (30, 60, 90, NIGHT_CHART_MIN_ALT)):
+            y = float(self._y(alt))
+            line.points = [self.x, y, self.right, y]
+        y0 = float(self._y(0))
+        self.horizon_line.points = [self.x, y0, self.right, y0]
+
+        for key, line in self.lines.items():
+            y = self._y(self.night["altitudes"][key][0])
+            line.points = np.stack([x, y], axis=-1).ravel().tolist()
+
+        if self.current_tt is not None and tt[0] <= self.current_tt <= tt[-1]:
+            xn = float(self.x + (self.current_tt - tt[0]) / (tt[-1] - tt[0]) * self.width)
+            self.now_line.points = [xn, self.y, xn, self.top]
+        else:
+            self.now_line.points = []
+
+class NightChartContent(BoxLayout):
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+
+        self.title_label = Label(
+            text="",
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        self.title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.title_label)
+
+        self.chart = NightAltitudeChart(size_hint_y=None, height=320)
+        self.add_widget(self.chart)
+
+        hours = BoxLayout(orientation="horizontal", size_hint_y=None, height=24)
+        for h in range(NIGHT_START_HOUR, NIGHT_START_HOUR + NIGHT_HOURS + 1, 4):
+            hours.add_widget(Label(text=f"{h % 24:02d}:00", font_size='12sp'))
+        self.add_widget(hours)
+
+        legend = GridLayout(cols=4, spacing=2, size_hint_y=None)
+        legend.bind(minimum_height=legend.setter('height'))
+        for _, arabic_name, colour in NIGHT_BODIES:
+            legend.add_widget(Label(
+                text=process_text(arabic_name),
+                color=hex_to_rgba(colour),
+                font_size='14sp',
+                font_name="fonts/Amiri-Regular.ttf",
+                size_hint_y=None, height=30
+            ))
+        self.add_widget(legend)
+
+        note = Label(
+            text=process_text("الخطوط الأفقية: الأفق و30° و60° و90° | الظلال: النهار والشفق المدني والبحري والفلكي"),
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None,
+            halign='center', valign='middle'
+        )
+        note.bind(width=lambda inst, value: setattr(inst, 'text_size', (value, None)))
+        note.bind(texture_size=lambda inst, value: setattr(inst, 'height', value[1]))
+        self.add_widget(note)
+
+        self.update_content(dt)
+
+    def update_content(self, dt):
+        local_tz = get_location_timezone()
+        dt_local = dt if dt.tzinfo else local_tz.localize(dt)
+        # قبل الظهر تُعرض الليلة التي بدأت مساء الأمس
+        night_date = dt_local.date() - datetime.timedelta(days=1 if dt_local.hour < 12 else 0)
+        loc = getattr(App.get_running_app(), "current_location_name", "مسقط")
+        self.title_label.text = process_text(
+            f"ارتفاعات ليلة {night_date.strftime('%d/%m/%Y')} - {loc}")
+        night = compute_night_altitudes(night_date)
+        self.chart.set_night(night, ts.from_datetime(dt_local.astimezone(pytz.UTC)).tt)
+
+class ObservationPlanContent(BoxLayout):
+    WEEK_NIGHTS = 7
+
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+        self.week_mode = False
+
+        self.title_label = Label(
+            text="",
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        self.title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.title_label)
+
+        settings_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=70, spacing=5)
+        self.mode_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='14sp',
+            background_normal='',
+            background_color=hex_to_rgba("#410a63")
+        )
+        self.mode_button.bind(on_release=self.toggle_mode)
+        settings_box.add_widget(self.mode_button)
+        self.depression_adjuster = ValueAdjuster(12, 0, 18, on_value_change=lambda v: self.refresh())
+        settings_box.add_widget(self.depression_adjuster)
+        settings_box.add_widget(self._caption("الشمس تحت°"))
+        self.altitude_adjuster = ValueAdjuster(15, 0, 60, on_value_change=lambda v: self.refresh())
+        settings_box.add_widget(self.altitude_adjuster)
+        settings_box.add_widget(self._caption("أدنى ارتفاع°"))
+        self.add_widget(settings_box)
+
+        self.plan_grid = GridLayout(cols=4, spacing=2, size_hint_y=None)
+        self.plan_grid.bind(minimum_height=self.plan_grid.setter('height'))
+        self.add_widget(self.plan_grid)
+
+        self.update_content(dt)
+
+    def _caption(self, text):
+        return Label(
+            text=process_text(text),
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_x=None, width=80
+        )
+
+    def _cell(self, text):
+        lbl = Label(
+            text=process_text(text),
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=44,
+            halign="center", valign="middle"
+        )
+        lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        return lbl
+
+    def toggle_mode(self, instance):
+        self.week_mode = not self.week_mode
+        self.refresh()
+
+    def update_content(self, dt):
+        self.dt = dt
+        self.refresh()
+
+    def refresh(self):
+        local_tz = get_location_timezone()
+        dt_local = self.dt if self.dt.tzinfo else local_tz.localize(self.dt)
+        night_date = dt_local.date() - datetime.timedelta(days=1 if dt_local.hour < 12 else 0)
+        nights = self.WEEK_NIGHTS if self.week_mode else 1
+        self.mode_button.text = process_text("أفضل ليلة في الأسبوع" if self.week_mode else "خطة الليلة")
+        self.title_label.text = process_text(
+            f"خطة الرصد من ليلة {night_date.strftime('%d/%m/%Y')}"
+            + (f" ولمدة {nights} ليالٍ" if self.week_mode else ""))
+
+        plan = plan_observations(night_date, nights=nights,
+                                 min_altitude=float(self.altitude_adjuster.current_value),
+                                 sun_depression=float(self.depression_adjuster.current_value))
+        self.plan_grid.clear_widgets()
+        widget_builds.start(self, self.build_rows(plan, night_date, local_tz))
+
+    def build_rows(self, plan, night_date, local_tz):
+        yield self.plan_grid, [self._cell(header) for header in ["البعد عن الشمس", "أعلى ارتفاع", "نافذة الرصد", "الجرم"]]
+
+        def hm(tt_value):
+            return tt_to_local(tt_value, local_tz)[0].strftime("%H:%M")
+
+        for key, arabic_name, _ in NIGHT_BODIES:
+            windows = plan[key]
+            # في وضع الأسبوع تُختار الليلة ذات النافذة الأطول ثم الارتفاع الأعلى
+            candidates = [(w["minutes"], w["altitude"], i) for i, w in enumerate(windows) if w]
+            if not candidates:
+                cells = ["—", "—", "غير متاح", arabic_name]
+            else:
+                _, _, i = max(candidates)
+                w = windows[i]
+                window_text = f"{hm(w['start'])} ← {hm(w['end'])}"
+                if self.week_mode:
+                    window_text = f"{(night_date + datetime.timedelta(days=i)).strftime('%d/%m')}: " + window_text
+                cells = [f"{w['elongation']:.0f}°", f"{w['altitude']:.0f}° عند {hm(w['best'])}",
+                         window_text, arabic_name]
+            yield self.plan_grid, [self._cell(text) for text in cells]
+
+class CalendarExportContent(BoxLayout):
+    # (عدد الأشهر، الوصف)
+    SPANS = [(1, "شهر"), (12, "سنة"), (36, "ثلاث سنوات")]
+
     def __init__(self, dt, **kwargs):
         super().__init__(**kwargs)
         self.orientation = "vertical"
         self.spacing = 5
+        self.padding = [10, 10, 10, 10]
         self.size_hint_y = None
         self.bind(minimum_height=self.setter('height'))
+        self.dt = dt
+        self.span_index = 1
+        self.kinds = {key for key, _ in CALENDAR_KINDS}
+        self.exporting = False
+
+        self.title_label = Label(
+            text="",
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        self.title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.title_label)
+
+        self.span_button = self._button(self.cycle_span)
+        self.span_button.size_hint_y = None
+        self.span_button.height = 44
+        self.add_widget(self.span_button)
+
+        kinds_grid = GridLayout(cols=2, spacing=2, size_hint_y=None)
+        kinds_grid.bind(minimum_height=kinds_grid.setter('height'))
+        self.kind_buttons = {}
+        for key, _ in CALENDAR_KINDS:
+            btn = self._button(lambda inst, k=key: self.toggle_kind(k))
+            btn.size_hint_y = None
+            btn.height = 44
+            self.kind_buttons[key] = btn
+            kinds_grid.add_widget(btn)
+        self.add_widget(kinds_grid)
+
+        export_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=44, spacing=5)
+        csv_btn = self._button(lambda inst: self.export("csv"))
+        csv_btn.text = process_text("تصدير CSV")
+        export_box.add_widget(csv_btn)
+        ics_btn = self._button(lambda inst: self.export("ics"))
+        ics_btn.text = process_text("تصدير ICS للتقويم")
+        export_box.add_widget(ics_btn)
+        self.add_widget(export_box)
+
+        self.status_label = Label(
+            text="",
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=30,
+            halign="center", valign="middle"
+        )
+        self.status_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.status_label)
+
         self.update_content(dt)
 
+    def _button(self, callback):
+        btn = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='15sp',
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        btn.bind(on_release=callback)
+        return btn
+
+    def cycle_span(self, instance):
+        self.span_index = (self.span_index + 1) % len(self.SPANS)
+        self.refresh()
+
+    def toggle_kind(self, key):
+        self.kinds.symmetric_difference_update({key})
+        self.refresh()
+
+    def date_range(self):
+        start = self.dt.date()
+        months = self.SPANS[self.span_index][0]
+        month_index = start.month - 1 + months
+        year, month = start.year + month_index // 12, month_index % 12 + 1
+        end = datetime.date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+        return start, end
+
     def update_content(self, dt):
-        self.clear_widgets()
-        oman_tz = pytz.timezone('Asia/Muscat')
-        dt_local = dt if dt.tzinfo else oman_tz.localize(dt)
-        dt_utc = dt_local.astimezone(pytz.UTC)
-        t = ts.from_datetime(dt_utc)
+        self.dt = dt
+        self.refresh()
 
-        location = get_current_location()
-        observer = eph['earth'] + location
+    def refresh(self):
+        loc = getattr(App.get_running_app(), "current_location_name", "مسقط")
+        start, end = self.date_range()
+        self.title_label.text = process_text(
+            f"تصدير أحداث {loc} من {start.strftime('%d/%m/%Y')} إلى {end.strftime('%d/%m/%Y')}")
+        self.span_button.text = process_text(f"المدة: {self.SPANS[self.span_index][1]}")
+        for key, label in CALENDAR_KINDS:
+            selected = key in self.kinds
+            self.kind_buttons[key].text = process_text(("✓ " if selected else "") + label)
+            self.kind_buttons[key].background_color = hex_to_rgba("#521876" if selected else "#2a0b3d")
+
+    def export(self, fmt):
+        """
+        يكتب الملف في خيط منفصل فلا تتجمد الواجهة أثناء تصدير سنوات عدة؛ يُعرض التقدم عند كل شهر
+        جديد من الأحداث، والنتيجة في النهاية، في خيط الواجهة عبر Clock.
+        """
+        if self.exporting:
+            return
+        if not self.kinds:
+            self.status_label.text = process_text("اختر نوعاً واحداً على الأقل من الأحداث")
+            return
+        loc = getattr(App.get_running_app(), "current_location_name", "مسقط")
+        start, end = self.date_range()
+        path = os.path.join(EXPORT_FOLDER, f"astro_{loc}_{start.isoformat()}_{end.isoformat()}.{fmt}")
+        events = iter_calendar_events([loc], start, end, kinds=set(self.kinds))
+        writer = write_calendar_ics if fmt == "ics" else write_calendar_csv
+        self.exporting = True
+        self.status_label.text = process_text("جارٍ التصدير...")
+
+        def with_progress(events):
+            month = None
+            for count, event in enumerate(events):
+                if event["dt"].strftime("%m/%Y") != month:
+                    month = event["dt"].strftime("%m/%Y")
+                    Clock.schedule_once(lambda _, n=count, m=month: self._show_progress(n, m), 0)
+                yield event
+
+        def run():
+            try:
+                message = f"تم حفظ {writer(with_progress(events), path)} حدثاً في {path}"
+            except Exception as e:
+                print("calendar export failed:", e)
+                message = "تعذّر التصدير"
+            Clock.schedule_once(lambda _: self._export_done(message), 0)
+        threading.Thread(target=run, daemon=True).start()
 
-        planets = {
-            'venus': 'الزهرة',
-            'mercury': 'عطارد',
-            'JUPITER BARYCENTER': 'المشتري',
-            'mars': 'المريخ',
-            'Uranus BARYCENTER': 'أورانوس',
-            'SATURN BARYCENTER': 'زحل',
-            'Neptune BARYCENTER': 'نبتون'
-        }
-        image_map = {
-            'mercury': 'planetimg/mercury.png',
-            'venus': 'planetimg/venus.png',
-            'mars': 'planetimg/mars.png',
-            'JUPITER BARYCENTER': 'planetimg/jupiter.png',
-            'SATURN BARYCENTER': 'planetimg/saturn.png',
-            'Uranus BARYCENTER': 'planetimg/uranus.png',
-            'Neptune BARYCENTER': 'planetimg/neptune.png'
-        }
+    def _show_progress(self, count, month):
+        if self.exporting:
+            self.status_label.text = process_text(f"جارٍ التصدير... {count} حدثاً حتى {month}")
 
-        grid = GridLayout(cols=2, spacing=10, size_hint_y=None)
-        grid.bind(minimum_height=grid.setter('height'))
+    def _export_done(self, message):
+        self.exporting = False
+        self.status_label.text = process_text(message)
 
-        for key, arabic_name in planets.items():
-            planet = eph[key]
-            astrometric = observer.at(t).observe(planet).apparent()
-            alt, az, _ = astrometric.altaz()
-            alt_corrected = apply_refraction_correction(alt.degrees)
-            rise_str, set_str = get_rise_set(ts, dt, planet)
-            image_path = image_map.get(key, '')
-            item = PlanetItem(
-                image_path=image_path,
-                arabic_name=arabic_name,
-                rise_str=rise_str,
-                set_str=set_str,
-                altitude=alt_corrected,
-                azimuth=az.degrees
-            )
-            grid.add_widget(item)
-        self.add_widget(grid)
+# -------------------------------------------------------------------
+# رسم العلامات النقطية دفعة واحدة عبر Mesh
+MESH_MAX_QUADS = 16384  # فهارس OpenGL ES من نوع unsigned short تحدّ كل Mesh بـ 65536 رأساً
+
+_QUAD_CORNERS = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]], dtype=np.float32)
+_QUAD_UVS = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float32)
+_QUAD_INDICES = (np.arange(MESH_MAX_QUADS, dtype=np.uint32)[:, None] * 4
+                 + np.array([0, 1, 2, 2, 3, 0], dtype=np.uint32)).astype(np.uint16)
+_disc_texture = None
+
+def set_mesh_data(mesh, vertices, indices):
+    """
+    يملأ مخزني رؤوس وفهارس Mesh من مصفوفتي NumPy. عند عدم وجود ما يُرسم تُسند قائمتان فارغتان،
+    لأن Kivy يطبع خطأ IndexError عند كل رسم إذا أُسندت إليه مصفوفة NumPy فارغة.
+    """
+    if len(indices):
+        mesh.vertices = vertices
+        mesh.indices = indices
+    else:
+        mesh.vertices = []
+        mesh.indices = []
+
+def get_disc_texture(size=32):
+    """نسيج قرص دائري بحافة ناعمة يُنشأ مرة واحدة ويُستخدم لكل العلامات النقطية."""
+    global _disc_texture
+    if _disc_texture is None:
+        yy, xx = np.mgrid[0:size, 0:size]
+        r = np.hypot(xx - (size - 1) / 2, yy - (size - 1) / 2) / (size / 2)
+        alpha = np.clip((1 - r) * size / 2, 0, 1)
+        buf = np.full((size, size, 4), 255, dtype=np.uint8)
+        buf[..., 3] = (alpha * 255).astype(np.uint8)
+        _disc_texture = Texture.create(size=(size, size), colorfmt='rgba')
+        _disc_texture.blit_buffer(buf.tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+    return _disc_texture
+
+class MarkerMesh:
+    """
+    مجموعة علامات نقطية بلون واحد تُرسم كمربعات ذات نسيج دائري داخل Mesh واحد
+    (أو عدة Mesh إذا تجاوز العدد حد الفهارس). يُملأ مخزن الرؤوس مباشرة من مصفوفات NumPy،
+    فيصبح تحديث آلاف العلامات رفعاً واحداً للمخزن بدلاً من إنشاء تعليمة لكل علامة.
+    """
+    def __init__(self, canvas, rgba=(1, 1, 1, 1)):
+        self.group = InstructionGroup()
+        self.color = Color(*rgba)
+        self.group.add(self.color)
+        self.meshes = []
+        canvas.add(self.group)
+
+    def set_points(self, xs, ys, sizes):
+        xs = np.asarray(xs, dtype=np.float32)
+        ys = np.asarray(ys, dtype=np.float32)
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=np.float32), xs.shape)
+        count = len(xs)
+        vertices = np.empty((count, 4, 4), dtype=np.float32)
+        vertices[:, :, 0] = xs[:, None] + _QUAD_CORNERS[:, 0] * sizes[:, None]
+        vertices[:, :, 1] = ys[:, None] + _QUAD_CORNERS[:, 1] * sizes[:, None]
+        vertices[:, :, 2:] = _QUAD_UVS
+
+        chunks = range(0, count, MESH_MAX_QUADS)
+        while len(self.meshes) < len(chunks):
+            mesh = Mesh(mode='triangles', texture=get_disc_texture())
+            self.meshes.append(mesh)
+            self.group.add(mesh)
+        for i, mesh in enumerate(self.meshes):
+            if i < len(chunks):
+                start = chunks[i]
+                n = min(MESH_MAX_QUADS, count - start)
+                set_mesh_data(mesh, vertices[start:start + n].reshape(-1), _QUAD_INDICES[:n].reshape(-1))
+            else:
+                set_mesh_data(mesh, [], [])
+
+    def clear(self):
+        self.set_points([], [], 0)
+
+# -------------------------------------------------------------------
+# أطلس نصوص التسميات
+LABEL_FONT = "fonts/Amiri-Regular.ttf"
+
+class LabelAtlas:
+    """
+    أطلس نسيج مشترك للتسميات الثابتة (أسماء الأجرام، الاتجاهات، العناوين):
+    يُرسم كل نص بحجم خط معيّن مرة واحدة فقط عبر CoreLabel داخل صفحة Fbo ثابتة الحجم،
+    ثم يُرسم بعد ذلك كمربع يشير إلى منطقته في الصفحة. ذاكرة النسيج محدودة بعدد الصفحات وحجمها،
+    وما يزيد عنها يُرسم بنسيج مستقل دون تخزين.
+    """
+    def __init__(self, page_size=(1024, 512), max_pages=2, padding=2):
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.padding = padding
+        self.pages = []
+        self.entries = {}
+        self._sources = []
+        self._cursor = (0, 0, 0)  # (x, y, ارتفاع الرف الحالي)
+
+    def _new_page(self):
+        fbo = Fbo(size=self.page_size)
+        with fbo:
+            ClearColor(0, 0, 0, 0)
+            ClearBuffers()
+            Color(1, 1, 1, 1)
+        fbo.texture.mag_filter = 'linear'
+        self.pages.append(fbo)
+        self._cursor = (0, 0, 0)
+        return fbo
+
+    def _allocate(self, w, h):
+        """حجز مكان للنص في الصفحة الحالية بتعبئة الرفوف، أو None إذا امتلأ الأطلس."""
+        if w > self.page_size[0] or h > self.page_size[1]:
+            return None
+        if not self.pages:
+            self._new_page()
+        x, y, shelf = self._cursor
+        if x + w > self.page_size[0]:
+            x, y, shelf = 0, y + shelf + self.padding, 0
+        if y + h > self.page_size[1]:
+            if len(self.pages) >= self.max_pages:
+                return None
+            self._new_page()
+            x, y, shelf = 0, 0, 0
+        self._cursor = (x + w + self.padding, y, max(shelf, h))
+        return self.pages[-1], x, y
+
+    def get(self, text, font_size):
+        """يعيد (نسيج الصفحة، منطقة النص) للنص المعطى، ويرسمه في الأطلس عند أول طلب فقط."""
+        key = (text, int(round(font_size)))
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry
+        core = CoreLabel(text=process_text(text), font_size=font_size, font_name=LABEL_FONT)
+        core.refresh()
+        source = core.texture
+        w, h = source.size
+        slot = self._allocate(w, h)
+        if slot is None:
+            print("label atlas full, drawing uncached:", text)
+            return source, source
+        fbo, x, y = slot
+        with fbo:
+            Rectangle(pos=(x, y), size=(w, h), texture=source, tex_coords=source.tex_coords)
+        fbo.draw()
+        # نحتفظ بالنسيج الأصلي لأن Fbo يعيد تنفيذ تعليماته عند استعادة سياق OpenGL
+        self._sources.append(source)
+        entry = (fbo.texture, fbo.texture.get_region(x, y, w, h))
+        self.entries[key] = entry
+        return entry
+
+    def preload(self, texts_by_size):
+        for font_size, texts in texts_by_size:
+            for text in texts:
+                self.get(text, font_size)
+
+label_atlas = LabelAtlas()
+
+class AtlasTextLayer:
+    """
+    تسميات كثيرة تُرسم كمربعات منسوجة من أطلس التسميات، في Mesh واحد لكل صفحة من الأطلس،
+    بدلاً من ودجت Label لكل تسمية.
+    """
+    def __init__(self, canvas, rgba=(1, 1, 1, 1)):
+        self.group = InstructionGroup()
+        self.group.add(Color(*rgba))
+        self.meshes = {}
+        canvas.add(self.group)
+
+    def set_items(self, items):
+        """items: قائمة (النص، حجم الخط، x المركز، y، "center" أو "bottom")."""
+        quads = {}
+        for text, font_size, x, y, anchor in items:
+            page, region = label_atlas.get(text, font_size)
+            w, h = region.size
+            y0 = y - h / 2 if anchor == "center" else y
+            quads.setdefault(page, []).append((x - w / 2, y0, w, h, region.tex_coords))
+
+        for page, mesh in self.meshes.items():
+            if page not in quads:
+                set_mesh_data(mesh, [], [])
+        for page, page_quads in quads.items():
+            mesh = self.meshes.get(page)
+            if mesh is None:
+                mesh = Mesh(mode='triangles', texture=page)
+                self.meshes[page] = mesh
+                self.group.add(mesh)
+            n = len(page_quads)
+            rects = np.array([q[:4] for q in page_quads], dtype=np.float32)
+            vertices = np.empty((n, 4, 4), dtype=np.float32)
+            vertices[:, :, 0] = rects[:, 0:1] + _QUAD_UVS[:, 0] * rects[:, 2:3]
+            vertices[:, :, 1] = rects[:, 1:2] + _QUAD_UVS[:, 1] * rects[:, 3:4]
+            vertices[:, :, 2:] = np.array([q[4] for q in page_quads], dtype=np.float32).reshape(n, 4, 2)
+            set_mesh_data(mesh, vertices.reshape(-1), _QUAD_INDICES[:n].reshape(-1))
+
+class AtlasLabel(Widget):
+    """ودجت خفيف يعرض نصاً ثابتاً من أطلس التسميات بمستطيل واحد."""
+    text = StringProperty("")
+    font_size = NumericProperty(sp(16))
+    halign = StringProperty("center")
+    color = ListProperty([1, 1, 1, 1])
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        with self.canvas:
+            self._color = Color(*self.color)
+            self._rect = Rectangle()
+        self.bind(text=self._update, font_size=self._update, halign=self._update,
+                  pos=self._update, size=self._update, color=self._update)
+        self._update()
+
+    def _update(self, *args):
+        self._color.rgba = self.color
+        if not self.text:
+            self._rect.size = (0, 0)
+            return
+        _, region = label_atlas.get(self.text, self.font_size)
+        w, h = region.size
+        if self.halign == "left":
+            x = self.x
+        elif self.halign == "right":
+            x = self.right - w
+        else:
+            x = self.center_x - w / 2
+        self._rect.texture = region
+        self._rect.pos = (x, self.center_y - h / 2)
+        self._rect.size = (w, h)
 
 # -------------------------------------------------------------------
 # خريطة السماء
@@ -455,115 +4572,207 @@ class SkyMapWidget(Widget):
     """
     ودجت لرسم خريطة السماء باستخدام Kivy.
     يقوم هذا الودجت برسم دائرة تمثل السماء، ويضع عليها علامات الاتجاه
-    وأماكن الأجرام السماوية مع تسميات مركزة.
+    وأماكن الأجرام السماوية مع تسميات مركزة، إضافة إلى النجوم اللامعة وخطوط الكوكبات.
     """
     dt = ObjectProperty(None)
+    location_name = StringProperty("")  # فارغ: الموقع الحالي في التطبيق
+    show_constellations = BooleanProperty(True)
+    limiting_magnitude = NumericProperty(5.0)
+    selected_info = StringProperty("")
+
+    # (أقصى قدر، الشفافية) لكل فئة سطوع؛ يُرسم كل منها في MarkerMesh مستقل
+    STAR_CLASSES = [(1.0, 1.0), (2.5, 0.95), (4.0, 0.8), (99.0, 0.6)]
+    BODY_MARKER_SIZE = 10  # قطر علامة الجسم
+    DIRECTIONS = {"شمال": 0, "شرق": 90, "جنوب": 180, "غرب": 270}
+    BODIES = {
+        "الشمس": "sun",
+        "القمر": "moon",
+        "عطارد": "mercury",
+        "الزهرة": "venus",
+        "المريخ": "mars",
+        "المشتري": "JUPITER BARYCENTER",
+        "زحل": "SATURN BARYCENTER"
+    }
+    PLANET_COLORS = {
+        "الشمس":    "#FDB813",
+        "القمر":    "#CCCCCC",
+        "عطارد":   "#B1B1B1",
+        "الزهرة":  "#F7D358",
+        "المريخ":  "#FF4500",
+        "المشتري": "#FFA500",
+        "زحل":     "#D2B48C"
+    }
 
     def __init__(self, dt, **kwargs):
         super().__init__(**kwargs)
         self.dt = dt
-        self.bind(pos=self.update_map, size=self.update_map)
+        self.star_ids = np.empty(0, dtype=int)
+        self.star_alt = np.empty(0)
+        self.star_az = np.empty(0)
+        self.star_index = None
+        self.body_points = []
+
+        # طبقات الرسم تُنشأ مرة واحدة، ثم تُحدَّث مخازن رؤوسها فقط عند كل تحديث
+        self.background_layer = InstructionGroup()
+        self.canvas.add(self.background_layer)
+        self.lines_layer = InstructionGroup()
+        self.lines_layer.add(Color(*hex_to_rgba("#5a6fb0", 0.6)))
+        self.lines_mesh = Mesh(mode='lines')
+        self.lines_layer.add(self.lines_mesh)
+        self.canvas.add(self.lines_layer)
+        self.star_layers = [MarkerMesh(self.canvas, (1, 1, 1, alpha)) for _, alpha in self.STAR_CLASSES]
+        self.body_layers = {colour: MarkerMesh(self.canvas, hex_to_rgba(colour))
+                            for colour in dict.fromkeys(self.PLANET_COLORS.values())}
+        self.text_layer = AtlasTextLayer(self.canvas)
+
+        self.bind(pos=self.update_map, size=self.update_map,
+                  show_constellations=self.update_map, limiting_magnitude=self.update_map)
         self.update_map()
 
     def update_map(self, *args):
-        self.canvas.clear()
-        self.clear_widgets()
-
         # إعداد القياسات الأساسية
         margin = 20
         radius = (min(self.width, self.height) - 2 * margin) / 2
         center_x, center_y = self.center_x, self.center_y
 
-        with self.canvas:
-            # رسم خلفية الدائرة ولونها الداكن
-            Color(*hex_to_rgba("#0c0842"))
-            Ellipse(pos=(center_x - radius, center_y - radius), size=(2 * radius, 2 * radius))
-            # رسم حدود الدائرة البيضاء
-            Color(1, 1, 1, 1)
-            Line(circle=(center_x, center_y, radius), width=2)
-
-        # رسم علامات الاتجاه عند طرف الدائرة
-        directions = {"شمال": 0, "شرق": 90, "جنوب": 180, "غرب": 270}
+        self.background_layer.clear()
+        # رسم خلفية الدائرة ولونها الداكن
+        self.background_layer.add(Color(*hex_to_rgba("#0c0842")))
+        self.background_layer.add(Ellipse(pos=(center_x - radius, center_y - radius),
+                                          size=(2 * radius, 2 * radius)))
+        # رسم حدود الدائرة البيضاء
+        self.background_layer.add(Color(1, 1, 1, 1))
+        self.background_layer.add(Line(circle=(center_x, center_y, radius), width=2))
+
+        # علامات الاتجاه عند طرف الدائرة، مركزة على النقطة المحسوبة
+        labels = []
         dir_offset = 20  # مسافة إضافية لوضع النص خارج الدائرة
-        for dir_label, angle in directions.items():
+        for dir_label, angle in self.DIRECTIONS.items():
             rad = math.radians(angle)
             x = center_x + math.cos(rad) * (radius + dir_offset)
             y = center_y + math.sin(rad) * (radius + dir_offset)
-            lbl = Label(text=process_text(dir_label),
-                        font_size='14sp',
-                        color=(1, 1, 1, 1),
-                        size_hint=(None, None))
-            lbl.texture_update()
-            lbl_size = lbl.texture_size
-            lbl.size = lbl_size
-            # ضبط الموضع بحيث يكون النص مركزاً على النقطة المحسوبة
-            lbl.pos = (float(x) - lbl_size[0] / 2, float(y) - lbl_size[1] / 2)
-            self.add_widget(lbl)
+            labels.append((dir_label, sp(14), x, y, "center"))
 
         # حساب مواقع الأجرام السماوية باستخدام Skyfield
-        oman_tz = pytz.timezone('Asia/Muscat')
-        dt_local = self.dt if self.dt.tzinfo else oman_tz.localize(self.dt)
+        location_name = self.location_name or getattr(App.get_running_app(), "current_location_name", "مسقط")
+        local_tz = get_location_timezone(location_name)
+        dt_local = self.dt if self.dt.tzinfo else local_tz.localize(self.dt)
         dt_utc = dt_local.astimezone(pytz.UTC)
         t = ts.from_datetime(dt_utc)
-        location = get_current_location()
+        location = Topos(*OMAN_LOCATIONS.get(location_name, OMAN_LOCATIONS["مسقط"]))
         observer = eph['earth'] + location
-
-        bodies = {
-            "الشمس": "sun",
-            "القمر": "moon",
-            "عطارد": "mercury",
-            "الزهرة": "venus",
-            "المريخ": "mars",
-            "المشتري": "JUPITER BARYCENTER",
-            "زحل": "SATURN BARYCENTER"
-        }
-        planet_colors = {
-            "الشمس":    "#FDB813",
-            "القمر":    "#CCCCCC",
-            "عطارد":   "#B1B1B1",
-            "الزهرة":  "#F7D358",
-            "المريخ":  "#FF4500",
-            "المشتري": "#FFA500",
-            "زحل":     "#D2B48C"
-        }
-
-        for name, key in bodies.items():
+        profile = load_horizon_profile(location_name)
+        if profile is not None:
+            # خط الأفق الحقيقي للموقع (الجبال والمباني) بإسقاط الأجرام نفسه
+            az_grid = np.radians(np.append(np.arange(HORIZON_SAMPLES) * HORIZON_STEP, 360.0))
+            r = (1 - np.append(profile, profile[0]) / 90.0) * radius
+            points = np.column_stack([center_x + np.cos(az_grid) * r, center_y + np.sin(az_grid) * r])
+            self.background_layer.add(Color(*hex_to_rgba("#8d6e63", 0.9)))
+            self.background_layer.add(Line(points=points.ravel().tolist(), width=1.5))
+
+        self.draw_stars(t, location, center_x, center_y, radius, profile)
+
+        self.body_points = []
+        markers = {}
+        d = self.BODY_MARKER_SIZE
+        for name, key in self.BODIES.items():
             try:
                 body = eph[key]
             except Exception:
                 continue
             astrometric = observer.at(t).observe(body).apparent()
             alt, az, _ = astrometric.altaz()
-            if alt.degrees < 0:
-                continue  # تجاهل الأجرام غير الظاهرة (تحت الأفق)
+            if alt.degrees < horizon_altitude(profile, az.degrees):
+                continue  # تجاهل الأجرام غير الظاهرة (تحت الأفق أو خلف تضاريسه)
 
             # حساب موقع الجسم داخل الدائرة؛ يُستخدم ارتفاع الجسم كنسبة تحدد بعد النقطة عن المركز
             r_factor = (1 - alt.degrees / 90.0) * radius
             rad_az = math.radians(az.degrees)
             x = center_x + math.cos(rad_az) * r_factor
             y = center_y + math.sin(rad_az) * r_factor
-
-            with self.canvas:
-                Color(*hex_to_rgba(planet_colors.get(name, "#FFFFFF")))
-                d = 10  # قطر علامة الجسم
-                Ellipse(pos=(float(x) - d/2, float(y) - d/2), size=(d, d))
-
-            # إضافة تسمية للجسم فوق العلامة
-            lbl = Label(text=process_text(name),
-                        font_size='12sp',
-                        color=(1, 1, 1, 1),
-                        size_hint=(None, None))
-            lbl.texture_update()
-            lbl_size = lbl.texture_size
-            lbl.size = lbl_size
-            # وضع التسمية فوق العلامة مع إزاحة بسيطة
-            lbl.pos = (float(x) - lbl_size[0] / 2, float(y) + d/2 + 2)
-            self.add_widget(lbl)
+            self.body_points.append((float(x), float(y), name, alt.degrees, az.degrees))
+            markers.setdefault(self.PLANET_COLORS[name], []).append((float(x), float(y)))
+            # تسمية الجسم فوق العلامة مع إزاحة بسيطة
+            labels.append((name, sp(12), x, y + d/2 + 2, "bottom"))
+
+        for colour, layer in self.body_layers.items():
+            points = markers.get(colour)
+            if points:
+                xs, ys = zip(*points)
+                layer.set_points(xs, ys, d)
+            else:
+                layer.clear()
+        self.text_layer.set_items(labels)
+
+    def draw_stars(self, t, location, center_x, center_y, radius, profile=None):
+        """
+        رسم النجوم الأعلى من الأفق (أو من مظهر أفق الموقع profile) والأسطع من القدر الحدّي دفعة واحدة:
+        يُحسب موقع كل النجوم بعملية NumPy واحدة، ثم تُملأ مخازن رؤوس MarkerMesh لكل فئة سطوع
+        وMesh خطوط الكوكبات مباشرة من المصفوفات.
+        """
+        count, alt, az = project_stars(t, location.latitude.degrees, location.longitude.degrees,
+                                       self.limiting_magnitude)
+        r = (1 - alt / 90.0) * radius
+        rad_az = np.radians(az)
+        xs = center_x + np.cos(rad_az) * r
+        ys = center_y + np.sin(rad_az) * r
+        visible = alt > horizon_altitude(profile, az)
+
+        catalogue = load_star_catalogue()
+        lines = np.asarray(catalogue["lines"], dtype=int)
+        if self.show_constellations and len(lines):
+            lines = lines[(lines < count).all(axis=1)]
+            lines = lines[visible[lines].all(axis=1)]
+        else:
+            lines = lines[:0]
+        ends = lines.ravel()
+        vertices = np.zeros((len(ends), 4), dtype=np.float32)
+        vertices[:, 0] = xs[ends]
+        vertices[:, 1] = ys[ends]
+        set_mesh_data(self.lines_mesh, vertices.reshape(-1), np.arange(len(ends), dtype=np.uint16))
+
+        mags = np.asarray(catalogue["stars"]['mag'][:count])
+        sizes = np.clip(8.0 - 1.1 * mags, 2.5, 9.0)
+        lower = -99.0
+        for (upper, _), layer in zip(self.STAR_CLASSES, self.star_layers):
+            sel = visible & (mags > lower) & (mags <= upper)
+            lower = upper
+            layer.set_points(xs[sel], ys[sel], sizes[sel])
+
+        self.star_ids = np.nonzero(visible)[0]
+        self.star_alt = alt[visible]
+        self.star_az = az[visible]
+        self.star_index = ScreenGridIndex(xs[visible], ys[visible])
+
+    def identify(self, x, y, max_distance=15.0):
+        """نص تعريفي لأقرب جرم أو نجم لموضع اللمس، أو None."""
+        for bx, by, name, alt, az in self.body_points:
+            if math.hypot(bx - x, by - y) <= max_distance:
+                return f"{name} | الارتفاع: {alt:.1f}° | السمت: {az:.1f}°"
+        if self.star_index is None:
+            return None
+        i = self.star_index.nearest(x, y, max_distance)
+        if i is None:
+            return None
+        star = load_star_catalogue()["stars"][self.star_ids[i]]
+        hip = int(star['hip'])
+        name = STAR_NAMES_AR.get(hip, f"HIP {hip}")
+        return (f"{name} | القدر: {float(star['mag']):.2f} | "
+                f"الارتفاع: {self.star_alt[i]:.1f}° | السمت: {self.star_az[i]:.1f}°")
+
+    def on_touch_down(self, touch):
+        if self.collide_point(*touch.pos):
+            info = self.identify(touch.x, touch.y)
+            if info:
+                self.selected_info = info
+                return True
+        return super().on_touch_down(touch)
 
 
 class MapContent(BoxLayout):
     """
-    ودجت لعرض خريطة السماء باستخدام SkyMapWidget بدلاً من matplotlib.
+    ودجت لعرض خريطة السماء.
+    الآن تعتمد على SkyMapWidget الذي يرسم الخريطة باستخدام Kivy بدلاً من matplotlib.
     """
     def __init__(self, dt, **kwargs):
         super().__init__(**kwargs)
@@ -571,37 +4780,70 @@ class MapContent(BoxLayout):
         self.padding = 10
         self.spacing = 10
         self.size_hint_y = None
-        self.height = 400
+        self.height = 500
         self.dt = dt
-        self.update_content(dt)
 
-    def update_content(self, dt):
-        self.dt = dt
-        self.clear_widgets()
-        sky_map = SkyMapWidget(dt=dt)
-        self.add_widget(sky_map)
+        self.sky_map = SkyMapWidget(dt=dt)
+        self.sky_map.bind(selected_info=self.on_selected_info)
+        self.add_widget(self.sky_map)
 
+        controls = BoxLayout(orientation="horizontal", size_hint_y=None, height=40, spacing=5)
+        self.lines_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='14sp',
+            background_normal='',
+            background_color=hex_to_rgba("#410a63")
+        )
+        self.lines_button.bind(on_release=self.toggle_constellations)
+        controls.add_widget(self.lines_button)
+        self.magnitude_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='14sp',
+            background_normal='',
+            background_color=hex_to_rgba("#410a63")
+        )
+        self.magnitude_button.bind(on_release=self.cycle_magnitude)
+        controls.add_widget(self.magnitude_button)
+        self.add_widget(controls)
 
-class MapContent(BoxLayout):
-    """
-    ودجت لعرض خريطة السماء.
-    الآن تعتمد على SkyMapWidget الذي يرسم الخريطة باستخدام Kivy بدلاً من matplotlib.
-    """
-    def __init__(self, dt, **kwargs):
-        super().__init__(**kwargs)
-        self.orientation = "vertical"
-        self.padding = 10
-        self.spacing = 10
-        self.size_hint_y = None
-        self.height = 400
-        self.dt = dt
-        self.update_content(dt)
+        self.info_label = Label(
+            text="",
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=30,
+            halign='center', valign='middle'
+        )
+        self.info_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.info_label)
+        self.update_controls()
+
+    def update_controls(self):
+        self.lines_button.text = process_text(
+            "إخفاء الكوكبات" if self.sky_map.show_constellations else "إظهار الكوكبات"
+        )
+        self.magnitude_button.text = process_text(f"القدر الحدّي: {self.sky_map.limiting_magnitude:g}")
+
+    def toggle_constellations(self, instance):
+        self.sky_map.show_constellations = not self.sky_map.show_constellations
+        self.update_controls()
+
+    def cycle_magnitude(self, instance):
+        limits = [3.0, 4.0, 5.0, 6.0]
+        current = self.sky_map.limiting_magnitude
+        self.sky_map.limiting_magnitude = limits[(limits.index(current) + 1) % len(limits)] \
+            if current in limits else 5.0
+        self.update_controls()
+
+    def on_selected_info(self, instance, value):
+        self.info_label.text = process_text(value)
 
     def update_content(self, dt):
         self.dt = dt
-        self.clear_widgets()
-        sky_map = SkyMapWidget(dt=dt)
-        self.add_widget(sky_map)
+        self.info_label.text = ""
+        self.sky_map.dt = dt
+        self.sky_map.update_map()
 
 # -------------------------------------------------------------------
 # ValueAdjuster - لضبط الأرقام
@@ -627,8 +4869,8 @@ class ValueAdjuster(BoxLayout):
         self.up_button = Button(
             size_hint=(1, None),
             size=(20, 20),
-            background_normal='planetimg/up-arrow.png',
-            background_down='planetimg/up-arrow.png',
+            background_normal=icon_source('up-arrow'),
+            background_down=icon_source('up-arrow'),
             border=(0, 0, 0, 0)
         )
         self.up_button.bind(on_release=self.increment)
@@ -653,8 +4895,8 @@ class ValueAdjuster(BoxLayout):
         self.down_button = Button(
             size_hint=(1, None),
             size=(20, 20),
-            background_normal='planetimg/down-arrow.png',
-            background_down='planetimg/down-arrow.png',
+            background_normal=icon_source('down-arrow'),
+            background_down=icon_source('down-arrow'),
             border=(0, 0, 0, 0)
         )
         self.down_button.bind(on_release=self.decrement)
@@ -725,8 +4967,8 @@ class PeriodAdjuster(BoxLayout):
         self.up_button = Button(
             size_hint=(1, None),
             size=(20, 20),
-            background_normal='planetimg/up-arrow.png',
-            background_down='planetimg/up-arrow.png',
+            background_normal=icon_source('up-arrow'),
+            background_down=icon_source('up-arrow'),
             border=(0, 0, 0, 0)
         )
         self.up_button.bind(on_release=self.toggle)
@@ -747,8 +4989,8 @@ class PeriodAdjuster(BoxLayout):
         self.down_button = Button(
             size_hint=(1, None),
             size=(20, 20),
-            background_normal='planetimg/down-arrow.png',
-            background_down='planetimg/down-arrow.png',
+            background_normal=icon_source('down-arrow'),
+            background_down=icon_source('down-arrow'),
             border=(0, 0, 0, 0)
         )
         self.down_button.bind(on_release=self.toggle)
@@ -1106,10 +5348,11 @@ class LocationPopup(Popup):
         app = App.get_running_app()
         app.current_location_name = actual_location
         app.save_location_preference()
+        sky_snapshots.cancel()
         current_dt = (
             app.root.options_widget.dt_adjuster.get_datetime()
             if hasattr(app.root, 'options_widget')
-            else datetime.datetime.now(pytz.timezone('Asia/Muscat'))
+            else datetime.datetime.now(get_location_timezone())
         )
         update_all_screens(current_dt)
         self.dismiss()
@@ -1142,8 +5385,8 @@ class CombinedDateTimeAdjuster(BoxLayout):
             self.location_button.parent.remove_widget(self.location_button)
         self.location_button = Button(
             size_hint=(None, None), size=(50, 50),
-            background_normal='planetimg/location.png',
-            background_down='planetimg/location.png',
+            background_normal=icon_source('location'),
+            background_down=icon_source('location'),
             border=(0, 0, 0, 0)
         )
         self.location_button.bind(on_release=self.open_location_popup)
@@ -1155,8 +5398,8 @@ class CombinedDateTimeAdjuster(BoxLayout):
             size_hint=(None, None),
             size=(50, 50),
             border=(0, 0, 0, 0),
-            background_normal='planetimg/redo.png',
-            background_down='planetimg/redo.png'
+            background_normal=icon_source('redo'),
+            background_down=icon_source('redo')
         )
         self.reset_button.bind(on_release=self.reset_to_now)
         anchor_reset.add_widget(self.reset_button)
@@ -1191,8 +5434,8 @@ class CombinedDateTimeAdjuster(BoxLayout):
             if hour_12 == 12:
                 hour_12 = 0
 
-        oman_tz = pytz.timezone('Asia/Muscat')
-        return oman_tz.localize(datetime.datetime(date_.year, date_.month, date_.day, hour_12, minute_))
+        local_tz = get_location_timezone()
+        return local_tz.localize(datetime.datetime(date_.year, date_.month, date_.day, hour_12, minute_))
 
     def on_datetime_change(self):
         if self.datetime_change_callback:
@@ -1221,8 +5464,8 @@ class CombinedDateTimeAdjuster(BoxLayout):
         self.on_datetime_change()
 
     def reset_to_now(self, instance):
-        oman_tz = pytz.timezone('Asia/Muscat')
-        now = datetime.datetime.now(oman_tz)
+        local_tz = get_location_timezone()
+        now = datetime.datetime.now(local_tz)
 
         self.date_group.current_date = now.date()
         self.date_group.year_adjuster.current_value = now.year
@@ -1257,6 +5500,19 @@ class CombinedDateTimeAdjuster(BoxLayout):
 # -------------------------------------------------------------------
 # الصفحة الرئيسية
 class HomeContent(BoxLayout):
+    BODIES = {
+        'Neptune BARYCENTER': 'نبتون',
+        'Uranus BARYCENTER': 'أورانوس',
+        'SATURN BARYCENTER': 'زحل',
+        'JUPITER BARYCENTER': 'المشتري',
+        'mars': 'المريخ',
+        'venus': 'الزهرة',
+        'mercury': 'عطارد',
+        'moon': 'القمر',
+        'sun': 'الشمس',
+    }
+    CAPTIONS = ["مرحباً بك", "طور القمر الحالي:", "لا توجد أجرام ظاهرة"]
+
     def __init__(self, dt, **kwargs):
         super().__init__(**kwargs)
         self.dt = dt
@@ -1266,16 +5522,13 @@ class HomeContent(BoxLayout):
         self.size_hint_y = None
         self.bind(minimum_height=self.setter('height'))
 
-        welcome_label = Label(
-            text=process_text("مرحباً بك"),
-            font_size='20sp',
-            font_name="fonts/Amiri-Regular.ttf",
+        welcome_label = AtlasLabel(
+            text="مرحباً بك",
+            font_size=sp(20),
             halign="center",
-            valign="middle",
             size_hint_y=None,
             height=40
         )
-        welcome_label.bind(size=lambda inst, val: setattr(inst, 'text_size', (val[0], None)))
         self.add_widget(welcome_label)
 
         phrases = [
@@ -1309,6 +5562,19 @@ class HomeContent(BoxLayout):
         self.location_label.bind(size=lambda inst, val: setattr(inst, 'text_size', (val[0], None)))
         self.add_widget(self.location_label)
 
+        self.stale_label = Label(
+            text="",
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            color=hex_to_rgba("#FDB813"),
+            halign="center",
+            valign="middle",
+            size_hint_y=None,
+            height=0
+        )
+        self.stale_label.bind(size=lambda inst, val: setattr(inst, 'text_size', (val[0], None)))
+        self.add_widget(self.stale_label)
+
         self.moon_phase_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=40, spacing=5)
         self.phase_label = Label(
             text="",
@@ -1319,16 +5585,13 @@ class HomeContent(BoxLayout):
         )
         self.phase_label.bind(size=lambda inst, val: setattr(inst, 'text_size', (val[0], None)))
         self.moon_phase_box.add_widget(self.phase_label)
-        phase_title_label = Label(
-            text=process_text("طور القمر الحالي:"),
-            font_size='18sp',
-            font_name="fonts/Amiri-Regular.ttf",
+        phase_title_label = AtlasLabel(
+            text="طور القمر الحالي:",
+            font_size=sp(18),
             halign="left",
-            valign="middle",
             size_hint_x=None,
             width=220
         )
-        phase_title_label.bind(size=lambda inst, val: setattr(inst, 'text_size', (val[0], None)))
         self.moon_phase_box.add_widget(phase_title_label)
         self.add_widget(self.moon_phase_box)
 
@@ -1348,6 +5611,15 @@ class HomeContent(BoxLayout):
         self.bodies_box.bind(minimum_height=self.bodies_box.setter('height'))
         self.add_widget(self.bodies_box)
 
+        # تسميات الأجرام تُنشأ مرة واحدة من أطلس التسميات ويُعاد ترتيبها فقط عند كل تحديث
+        self.body_labels = {
+            key: AtlasLabel(text=name, font_size=sp(16), halign="left",
+                            size_hint=(None, None), size=(100, 30))
+            for key, name in self.BODIES.items()
+        }
+        self.no_bodies_label = AtlasLabel(text="لا توجد أجرام ظاهرة", font_size=sp(16),
+                                          size_hint_y=None, height=30)
+
         self.update_content(dt)
 
     def update_content(self, dt):
@@ -1357,75 +5629,392 @@ class HomeContent(BoxLayout):
         time_str = dt.strftime("%I:%M %p").replace("AM", "ص").replace("PM", "م")
         self.location_label.text = process_text(f"الموقع: {loc} | التاريخ: {date_str} | الوقت: {time_str}")
 
-        oman_tz = pytz.timezone('Asia/Muscat')
-        dt_local = dt if dt.tzinfo else oman_tz.localize(dt)
-        dt_utc = dt_local.astimezone(pytz.UTC)
-        t = ts.from_datetime(dt_utc)
-        location = get_current_location()
-        observer = eph['earth'] + location
+        local_tz = get_location_timezone()
+        dt_local = dt if dt.tzinfo else local_tz.localize(dt)
+
+        # عند التشغيل: لقطة الجلسة السابقة تُعرض فوراً، والحساب الحقيقي يجري في الخلفية
+        app = App.get_running_app()
+        warm = getattr(app, "warm_snapshot", None)
+        if warm is not None:
+            app.warm_snapshot = None
+            if warm["location_name"] == loc:
+                if SnapshotPrefetcher._key(warm["dt"], loc) == SnapshotPrefetcher._key(dt_local, loc):
+                    sky_snapshots.put(warm)
+                else:
+                    self.show_snapshot(warm, stale=True)
+                    sky_snapshots.get_async(dt_local, loc, lambda snapshot: self.show_computed(dt, snapshot))
+                    return
+        self.show_snapshot(sky_snapshots.get(dt_local, loc))
+
+    def show_computed(self, dt, snapshot):
+        # قد يكون المستخدم غيّر الوقت أو الموقع أثناء الحساب فعُرضت لقطة أحدث
+        if self.dt != dt:
+            return
+        if snapshot is None:
+            # فشل الحساب: لا يبقى شريط "جارٍ التحديث" معلّقاً
+            self.stale_label.text = ""
+            self.stale_label.height = 0
+        elif snapshot["location_name"] == getattr(App.get_running_app(), "current_location_name", "مسقط"):
+            self.show_snapshot(snapshot)
+
+    def show_snapshot(self, snapshot, stale=False):
+        if stale:
+            saved = snapshot["dt"].strftime("%d/%m/%Y %I:%M %p").replace("AM", "ص").replace("PM", "م")
+            self.stale_label.text = process_text(f"بيانات محفوظة من {saved}، جارٍ التحديث…")
+            self.stale_label.height = 30
+        else:
+            self.stale_label.text = ""
+            self.stale_label.height = 0
 
-        phase_angle = almanac.moon_phase(eph, t).degrees
+        phase_angle = snapshot["phase_angle"]
         waxing = True if phase_angle < 180 else False
         phase_name = get_moon_phase_name(phase_angle, waxing)
-        phase_ar_map = {
-            "New Moon": "قمر جديد",
-            "Waxing Crescent": "الهلال متزايد",
-            "First Quarter": "التربيع الأول",
-            "Waxing Gibbous": "الأحدب المتزايد",
-            "Full Moon": "البدر",
-            "Waning Gibbous": "أحدب متناقص",
-            "Last Quarter": "التربيع الأخير",
-            "Waning Crescent": "الهلال المتناقص",
-            "Unknown": "غير معروف"
-        }
-        phase_name_ar = phase_ar_map.get(phase_name, phase_name)
+        phase_name_ar = MOON_PHASE_AR.get(phase_name, phase_name)
         self.phase_label.text = process_text(phase_name_ar)
 
-        bodies = {
-            'Neptune BARYCENTER': 'نبتون',
-            'Uranus BARYCENTER': 'أورانوس',
-            'SATURN BARYCENTER': 'زحل',
-            'JUPITER BARYCENTER': 'المشتري',
-            'mars': 'المريخ',
-            'venus': 'الزهرة',
-            'mercury': 'عطارد',
-            'moon': 'القمر',
-            'sun': 'الشمس',
-        }
-        visible_bodies = []
-        for key, arabic_name in bodies.items():
-            try:
-                body = eph[key]
-            except Exception:
-                continue
-            astrometric = observer.at(t).observe(body).apparent()
-            alt, _, _ = astrometric.altaz()
-            if alt.degrees > 0:
-                visible_bodies.append(arabic_name)
+        visible_bodies = [key for key in self.BODIES if snapshot["bodies"][key]["visible"]]
         self.bodies_box.clear_widgets()
         if visible_bodies:
-            for name in visible_bodies:
-                lbl = Label(
-                    text=process_text(name),
-                    font_size='16sp',
-                    font_name="fonts/Amiri-Regular.ttf",
-                    halign="left",
-                    valign="top",
-                    size_hint=(None, None),
-                    size=(100, 30)
-                )
-                lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', (val[0], None)))
-                self.bodies_box.add_widget(lbl)
+            for key in visible_bodies:
+                self.bodies_box.add_widget(self.body_labels[key])
         else:
-            lbl = Label(
-                text=process_text("لا توجد أجرام ظاهرة"),
-                font_size='16sp',
-                font_name="fonts/Amiri-Regular.ttf",
-                halign="center",
-                valign="middle"
-            )
-            lbl.bind(size=lambda inst, val: setattr(inst, 'text_size', (val[0], None)))
-            self.bodies_box.add_widget(lbl)
+            self.bodies_box.add_widget(self.no_bodies_label)
+
+def preload_label_atlas():
+    """رسم كل التسميات الثابتة في الأطلس مرة واحدة عند بدء التشغيل."""
+    label_atlas.preload([
+        (sp(14), SkyMapWidget.DIRECTIONS.keys()),
+        (sp(12), SkyMapWidget.BODIES.keys()),
+        (sp(16), list(HomeContent.BODIES.values()) + HomeContent.CAPTIONS[2:]),
+        (sp(20), HomeContent.CAPTIONS[:1]),
+        (sp(18), HomeContent.CAPTIONS[1:2]),
+    ])
+
+# -------------------------------------------------------------------
+# تشخيص الذاكرة وتسرّب الودجات في الجلسات الطويلة
+DIAGNOSTICS_INTERVAL = 30.0      # ثوانٍ بين العينات
+DIAGNOSTICS_MAX_SAMPLES = 240    # ساعتان من العينات
+DIAGNOSTICS_RETRY = 1.0          # ثوانٍ قبل إعادة عينة أُجّلت لأن لقطة أمامية قيد الحساب
+LEAK_WINDOW = 6                  # عدد العينات الأخيرة التي يُفحص فيها نمو كل صنف
+TRACEMALLOC_FRAMES = 5
+TEXTURE_BYTES_PER_PIXEL = {'rgba': 4, 'bgra': 4, 'rgb': 3, 'bgr': 3,
+                           'luminance_alpha': 2, 'rg': 2, 'luminance': 1, 'red': 1, 'alpha': 1}
+
+def read_diagnostics_enabled(config_file="user_settings.ini"):
+    """هل وضع تشخيص الذاكرة مفعّل في ملف الإعدادات (معطّل افتراضياً)."""
+    parser = ConfigParser()
+    if os.path.exists(config_file):
+        parser.read(config_file)
+        if parser.has_section("Diagnostics") and parser.has_option("Diagnostics", "enabled"):
+            return parser.get("Diagnostics", "enabled") == "1"
+    return False
+
+def save_diagnostics_enabled(enabled, config_file="user_settings.ini"):
+    """يحفظ حالة وضع التشخيص ليبدأ مع التشغيل التالي أيضاً، فتُرصد الجلسة من أولها."""
+    app = App.get_running_app()
+    parser = getattr(app, "config_parser", None)
+    if parser is None:
+        parser = ConfigParser()
+        parser.read(config_file)
+    if not parser.filename:
+        parser.filename = config_file
+    if not parser.has_section("Diagnostics"):
+        parser.add_section("Diagnostics")
+    parser.set("Diagnostics", "enabled", "1" if enabled else "0")
+    parser.write()
+
+class MemoryDiagnostics:
+    """
+    عينات دورية لحالة الذاكرة: عدد الودجات الحية لكل صنف، وعدد القوام وحجمها التقريبي في ذاكرة الرسوم،
+    وذاكرة Python المتتبَّعة عبر tracemalloc. يُعلَّم الصنف الذي لا يتناقص عدده ويزيد صافياً على امتداد
+    آخر LEAK_WINDOW عينات، ويُقارن آخر لقطة tracemalloc بلقطة البداية لمعرفة أسطر الكود التي نمت ذاكرتها.
+    المسح يمر على كل كائنات gc بعد جمع القمامة، فكلفته بعشرات الملّي ثانية كل DIAGNOSTICS_INTERVAL.
+    يُوقف حساب اللقطات في الخلفية أثناء المسح حتى لا تُكشف كائنات خيط آخر وهي قيد الإنشاء، وتُؤجَّل
+    العينة DIAGNOSTICS_RETRY ثانية بدل انتظار لقطة أمامية لا تتوقف في منتصفها فتتجمد الواجهة،
+    ويُصنَّف كل كائن بـ type() لا isinstance() لأن الأخيرة تلمس مرجع الوكيل الضعيف الميت فتثير ReferenceError.
+    """
+    def __init__(self, interval=DIAGNOSTICS_INTERVAL, max_samples=DIAGNOSTICS_MAX_SAMPLES):
+        self.interval = interval
+        self.samples = deque(maxlen=max_samples)
+        self.baseline = None
+        self.latest = None
+        self.started = None
+        self._event = None
+        self._retry = None
+
+    @property
+    def enabled(self):
+        return self._event is not None
+
+    def start(self):
+        if self._event is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.samples.clear()
+        self.started = datetime.datetime.now()
+        self.baseline = self._heap_snapshot()
+        self.sample()
+        self._event = Clock.schedule_interval(lambda dt: self.sample(), self.interval)
+
+    def stop(self):
+        if self._event is None:
+            return
+        self._event.cancel()
+        self._event = None
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+        self.baseline = self.latest = None
+        tracemalloc.stop()
+
+    @staticmethod
+    def _heap_snapshot():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+
+    def sample(self):
+        """يأخذ عينة ويعيدها، أو يعيد None ويعيد المحاولة بعد DIAGNOSTICS_RETRY إن كانت لقطة أمامية جارية."""
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+        if not sky_snapshots.try_pause():
+            self._retry = Clock.schedule_once(lambda dt: self.sample(), DIAGNOSTICS_RETRY)
+            return None
+        widgets = Counter()
+        textures = 0
+        texture_bytes = 0
+        try:
+            gc.collect()
+            objects = gc.get_objects()
+            for obj in objects:
+                cls = type(obj)
+                if issubclass(cls, Widget):
+                    widgets[cls.__name__] += 1
+                elif issubclass(cls, Texture) and not issubclass(cls, TextureRegion):
+                    # المناطق تشترك في نسيج أصلها فلا تُحسب مرتين
+                    w, h = obj.size
+                    textures += 1
+                    texture_bytes += (w * h * TEXTURE_BYTES_PER_PIXEL.get(obj.colorfmt, 4)
+                                      * (4 / 3 if obj.mipmap else 1))
+            gc_objects = len(objects)
+            del objects
+        finally:
+            sky_snapshots.resume()
+        heap, heap_peak = tracemalloc.get_traced_memory()
+        self.latest = self._heap_snapshot()
+        sample = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "widgets": dict(widgets),
+            "widget_total": sum(widgets.values()),
+            "textures": textures,
+            "texture_bytes": int(texture_bytes),
+            "heap_bytes": heap,
+            "heap_peak_bytes": heap_peak,
+            "gc_objects": gc_objects,
+        }
+        self.samples.append(sample)
+        return sample
+
+    def growing_classes(self, window=LEAK_WINDOW):
+        """(الصنف، العدد في أول النافذة، العدد الآن) لكل صنف لم يتناقص ونما صافياً خلال آخر window عينات."""
+        if len(self.samples) < window:
+            return []
+        recent = list(self.samples)[-window:]
+        growing = []
+        for name in recent[-1]["widgets"]:
+            counts = [s["widgets"].get(name, 0) for s in recent]
+            if counts[-1] > counts[0] and all(b >= a for a, b in zip(counts, counts[1:])):
+                growing.append((name, counts[0], counts[-1]))
+        return sorted(growing, key=lambda g: g[2] - g[1], reverse=True)
+
+    def heap_growth(self, limit=15):
+        """أكثر أسطر الكود نمواً في ذاكرة Python منذ بدء التشخيص: (الموضع، فرق البايتات، فرق عدد الكتل)."""
+        if self.baseline is None or self.latest is None:
+            return []
+        stats = self.latest.compare_to(self.baseline, "lineno")
+        return [(str(stat.traceback[0]), stat.size_diff, stat.count_diff) for stat in stats[:limit]]
+
+    def report(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds") if self.started else None,
+            "interval_seconds": self.interval,
+            "growing_widget_classes": [
+                {"class": name, "first": first, "last": last} for name, first, last in self.growing_classes()
+            ],
+            "heap_growth": [
+                {"where": where, "size_diff_bytes": size, "count_diff": count}
+                for where, size, count in self.heap_growth()
+            ],
+            "samples": list(self.samples),
+        }
+
+    def export(self, folder=EXPORT_FOLDER):
+        """يكتب التقرير JSON في مجلد التصدير ويعيد مساره."""
+        path = os.path.join(folder, f"memory_report_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1)
+        return path
+
+memory_diagnostics = MemoryDiagnostics()
+
+# -------------------------------------------------------------------
+# إعدادات الحساب
+class SettingsContent(BoxLayout):
+    BACKEND_NAMES = {
+        "jpl": "دقيق (ملف JPL)",
+        "analytic": "تحليلي خفيف (دقة دقائق قوسية)",
+    }
+
+    def __init__(self, dt, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "vertical"
+        self.spacing = 5
+        self.padding = [10, 10, 10, 10]
+        self.size_hint_y = None
+        self.bind(minimum_height=self.setter('height'))
+        self.selected_backend = read_ephemeris_backend()
+
+        title = Label(
+            text=process_text("محرك الحسابات الفلكية"),
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        title.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(title)
+
+        self.backend_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='16sp',
+            size_hint_y=None, height=44,
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        self.backend_button.bind(on_release=self.toggle_backend)
+        self.add_widget(self.backend_button)
+
+        self.status_label = Label(
+            text="",
+            font_size='14sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=60,
+            halign="center", valign="middle"
+        )
+        self.status_label.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(self.status_label)
+
+        diagnostics_title = Label(
+            text=process_text("تشخيص الذاكرة"),
+            font_size='18sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None, height=40,
+            halign="center", valign="middle"
+        )
+        diagnostics_title.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
+        self.add_widget(diagnostics_title)
+
+        diagnostics_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=44, spacing=5)
+        self.diagnostics_button = Button(
+            text="",
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='16sp',
+            background_normal='',
+            background_color=hex_to_rgba("#521876")
+        )
+        self.diagnostics_button.bind(on_release=self.toggle_diagnostics)
+        diagnostics_box.add_widget(self.diagnostics_button)
+        export_btn = Button(
+            text=process_text("تصدير التقرير"),
+            font_name="fonts/Amiri-Regular.ttf",
+            font_size='16sp',
+            background_normal='',
+            background_color=hex_to_rgba("#410a63")
+        )
+        export_btn.bind(on_release=self.export_diagnostics)
+        diagnostics_box.add_widget(export_btn)
+        self.add_widget(diagnostics_box)
+
+        self.diagnostics_label = Label(
+            text="",
+            font_size='13sp',
+            font_name="fonts/Amiri-Regular.ttf",
+            size_hint_y=None,
+            halign="center", valign="middle"
+        )
+        self.diagnostics_label.bind(width=lambda inst, value: setattr(inst, 'text_size', (value, None)))
+        self.diagnostics_label.bind(texture_size=lambda inst, value: setattr(inst, 'height', value[1]))
+        self.add_widget(self.diagnostics_label)
+
+        self.update_content(dt)
+
+    def toggle_diagnostics(self, instance):
+        if memory_diagnostics.enabled:
+            memory_diagnostics.stop()
+        else:
+            memory_diagnostics.start()
+        save_diagnostics_enabled(memory_diagnostics.enabled)
+        self.update_diagnostics()
+
+    def export_diagnostics(self, instance):
+        if not memory_diagnostics.samples:
+            self.diagnostics_label.text = process_text("لا توجد عينات بعد؛ فعّل التشخيص أولاً")
+            return
+        path = memory_diagnostics.export()
+        self.update_diagnostics()
+        self.diagnostics_label.text += "\n" + process_text(f"تم الحفظ: {path}")
+
+    def update_diagnostics(self):
+        self.diagnostics_button.text = process_text(
+            "التشخيص: مفعّل" if memory_diagnostics.enabled else "التشخيص: معطّل"
+        )
+        if not memory_diagnostics.samples:
+            self.diagnostics_label.text = ""
+            return
+        last = memory_diagnostics.samples[-1]
+        lines = [
+            f"آخر عينة: {last['time'][11:]} | العينات: {len(memory_diagnostics.samples)}",
+            f"الودجات الحية: {last['widget_total']} | القوام: {last['textures']} "
+            f"({last['texture_bytes'] / 1048576:.1f} م.ب)",
+            f"ذاكرة Python المتتبَّعة: {last['heap_bytes'] / 1048576:.1f} م.ب",
+        ]
+        for name, first, current in memory_diagnostics.growing_classes()[:5]:
+            lines.append(f"نمو مستمر: {name} {first} ← {current}")
+        self.diagnostics_label.text = "\n".join(process_text(line) for line in lines)
+
+    def toggle_backend(self, instance):
+        i = EPHEMERIS_BACKENDS.index(self.selected_backend)
+        self.selected_backend = EPHEMERIS_BACKENDS[(i + 1) % len(EPHEMERIS_BACKENDS)]
+        save_ephemeris_backend(self.selected_backend)
+        self.update_content(None)
+
+    def update_content(self, dt):
+        self.backend_button.text = process_text(self.BACKEND_NAMES[self.selected_backend])
+        if self.selected_backend == EPHEMERIS_BACKEND:
+            self.status_label.text = process_text("المحرك الحالي قيد الاستخدام")
+        else:
+            self.status_label.text = process_text("يُطبَّق التغيير عند إعادة تشغيل التطبيق")
+        self.update_diagnostics()
+
+# -------------------------------------------------------------------
+# الأقسام الإضافية التي تظهر في قائمة "المزيد"
+EXTRA_SECTIONS = [
+    ("التقويم الهجري", HijriCalendarContent),
+    ("مواقيت الصلاة والشفق", PrayerTimesContent),
+    ("الأحداث الفلكية القادمة", EventsContent),
+    ("ممرات الأقمار الصناعية", SatellitePassesContent),
+    ("مقارنة المواقع", LocationComparisonContent),
+    ("الكويكبات والمذنبات", MinorBodiesContent),
+    ("مسار الشمس", SunPathContent),
+    ("ارتفاعات الليلة", NightChartContent),
+    ("خطة الرصد", ObservationPlanContent),
+    ("تصدير التقويم", CalendarExportContent),
+    ("الإعدادات", SettingsContent),
+]
 
 # -------------------------------------------------------------------
 # شريط القائمة السفلية
@@ -1443,7 +6032,7 @@ class MenuWidget(BoxLayout):
             self.bg_rect = Rectangle(pos=self.pos, size=self.size)
         self.bind(pos=self.update_bg, size=self.update_bg)
 
-        sections = ["الخريطة", "القمر", "الكواكب", "الرئيسية"]
+        sections = ["المزيد", "الخريطة", "القمر", "الكواكب", "الرئيسية"]
         for section in sections:
             btn = Button(
                 text=process_text(section),
@@ -1456,6 +6045,21 @@ class MenuWidget(BoxLayout):
             btn.bind(on_release=self.menu_pressed)
             self.add_widget(btn)
 
+        self.more_dropdown = CustomDropDown()
+        for title, content_cls in EXTRA_SECTIONS:
+            btn = Button(
+                text=process_text(title),
+                font_name="fonts/Amiri-Regular.ttf",
+                font_size='16sp',
+                size_hint_y=None,
+                height=44,
+                background_normal='',
+                background_color=hex_to_rgba("#55117e"),
+                color=(1, 1, 1, 1)
+            )
+            btn.bind(on_release=lambda inst, cls=content_cls: self.open_extra_section(cls))
+            self.more_dropdown.add_widget(btn)
+
         self.options_widget = None
         self.preloaded_map = None
 
@@ -1468,7 +6072,9 @@ class MenuWidget(BoxLayout):
         dt_full = dt_group.get_datetime()
         text = instance.text
 
-        if text == process_text("الكواكب"):
+        if text == process_text("المزيد"):
+            self.more_dropdown.open(instance)
+        elif text == process_text("الكواكب"):
             self.content_area.set_content(PlanetsContent(dt=dt_full))
         elif text == process_text("القمر"):
             self.content_area.set_content(MoonContent(dt=dt_full))
@@ -1482,6 +6088,11 @@ class MenuWidget(BoxLayout):
             dt_full = self.options_widget.dt_adjuster.get_datetime()
             self.content_area.set_content(HomeContent(dt=dt_full))
 
+    def open_extra_section(self, content_cls):
+        self.more_dropdown.dismiss()
+        dt_full = self.options_widget.dt_adjuster.get_datetime()
+        self.content_area.set_content(content_cls(dt=dt_full))
+
 # -------------------------------------------------------------------
 # رأس الصفحة
 class HeaderWidget(BoxLayout):
@@ -1530,6 +6141,9 @@ class ContentArea(BoxLayout):
         self.bg_rect.size = self.size
 
     def set_content(self, widget):
+        # المحتوى المستبدَل لن يُعرض، فلا داعي لإكمال بنائه
+        for child in self.children:
+            widget_builds.cancel(child)
         self.clear_widgets()
         self.add_widget(widget)
 
@@ -1563,10 +6177,11 @@ class MainWidget(BoxLayout):
 
         self.add_widget(header_area)
 
-        scroll = ScrollView(size_hint=(1, 1))
+        # التمرير أفقياً محجوز لسحب التنقل بين الأيام
+        self.scroll = ScrollView(size_hint=(1, 1), do_scroll_x=False)
         self.content_area = ContentArea()
-        scroll.add_widget(self.content_area)
-        self.add_widget(scroll)
+        self.scroll.add_widget(self.content_area)
+        self.add_widget(self.scroll)
 
         self.menu.options_widget = self.options_widget
         self.menu.content_area = self.content_area
@@ -1595,6 +6210,31 @@ class MainWidget(BoxLayout):
         self.bg_rect.pos = self.pos
         self.bg_rect.size = self.size
 
+    SWIPE_MIN_DISTANCE = 80
+    SWIPE_MAX_DURATION = 0.6
+
+    def on_touch_down(self, touch):
+        if self.scroll.collide_point(*touch.pos):
+            touch.ud['day_swipe'] = (touch.x, touch.y, Clock.get_time())
+        return super().on_touch_down(touch)
+
+    def on_touch_up(self, touch):
+        start = touch.ud.pop('day_swipe', None)
+        if start is not None and self.is_day_swipe(touch, start):
+            # الواجهة من اليمين إلى اليسار: السحب نحو اليمين يقلب الصفحة إلى اليوم التالي
+            direction = 'increment' if touch.x > start[0] else 'decrement'
+            self.options_widget.dt_adjuster.adjust_date_by_day(direction)
+            return True
+        return super().on_touch_up(touch)
+
+    def is_day_swipe(self, touch, start):
+        x0, y0, t0 = start
+        dx, dy = touch.x - x0, touch.y - y0
+        if abs(dx) < self.SWIPE_MIN_DISTANCE or abs(dx) < 2 * abs(dy):
+            return False
+        # الخريطة لا تستخدم إلا النقر لتعريف الجرم، فالسحب الأفقي يقلب اليوم فوقها أيضاً
+        return Clock.get_time() - t0 <= self.SWIPE_MAX_DURATION
+
     def update_current_content(self, new_dt):
         if self.content_area.children:
             widget = self.content_area.children[0]
@@ -1627,7 +6267,7 @@ class PlanetsScreen(Screen):
         header.bind(size=lambda inst, val: setattr(inst, 'text_size', val))
         layout.add_widget(header)
 
-        self.planets_content = PlanetsContent(dt=datetime.datetime.now(pytz.timezone('Asia/Muscat')))
+        self.planets_content = PlanetsContent(dt=datetime.datetime.now(get_location_timezone()))
         layout.add_widget(self.planets_content)
 
         back_button = Button(
@@ -1675,6 +6315,7 @@ class MyApp(App):
         self.config_parser = ConfigParser()
         self.config_file = "user_settings.ini"
         self.current_location_name = "مسقط"
+        self.warm_snapshot = None
         self.load_location_preference()
 
     def load_location_preference(self):
@@ -1695,10 +6336,29 @@ class MyApp(App):
         self.config_parser.write()
 
     def build(self):
+        if read_diagnostics_enabled():
+            memory_diagnostics.start()
+        self.warm_snapshot = load_warm_snapshot()
+        preload_label_atlas()
+        preload_icon_atlas()
         sm = MyScreenManager()
         sm.add_widget(MainScreen(name='main'))
         sm.add_widget(PlanetsScreen(name='planets'))
         return sm
 
+    def store_warm_snapshot(self):
+        if sky_snapshots.latest is not None:
+            try:
+                save_warm_snapshot(sky_snapshots.latest)
+            except Exception as e:
+                print("could not save warm-start snapshot:", e)
+
+    def on_pause(self):
+        self.store_warm_snapshot()
+        return True
+
+    def on_stop(self):
+        self.store_warm_snapshot()
+
 if __name__ == '__main__':
     MyApp().run()
@@ -0,0 +1,250 @@
+"""
+حارس الدقة للمسارات السريعة: مقارنة أي محرك حساب بديل بمخرجات مرجعية محفوظة.
+
+تُحسب المخرجات المرجعية مرة واحدة بمسار Skyfield الدقيق الحالي (ملف JPL) لمصفوفة ثابتة من
+التواريخ والمواقع والأجرام، وتُحفظ في data/golden_outputs.npz:
+  - الارتفاع والسمت لكل (تاريخ، موقع، جرم).
+  - نسبة إضاءة القمر وزاوية طوره لكل تاريخ.
+  - لحظتا الشروق والغروب لكل (تاريخ، موقع، جرم) ببحث almanac الدقيق في get_rise_set، بالأفق نفسه
+    الذي تعرضه الشاشات (snapshot_horizon: الحافة العليا للشمس والقمر، ومركز الكواكب) ومنطقة كل موقع.
+
+ثم يُشغَّل محرك بديل على المصفوفة نفسها، ويُطبع لكل كمية أسوأ خطأ وموضعه مقابل حدّها المسموح،
+مع التسريع مقارنة بزمن المسار المرجعي. ينتهي البرنامج برمز خطأ إن تجاوزت أي كمية حدّها.
+
+المحركات المتاحة:
+  - analytic: التقويم التحليلي منخفض الدقة (AnalyticEphemeris) عبر المسار نفسه.
+  - track: مسار BodyTrack المتجه (استيفاء المسار المركزي الأرضي) للارتفاع والسمت،
+           و compute_sky_snapshot للشروق والغروب، أي المسار الذي تعرضه الشاشة الرئيسية فعلاً.
+
+الاستخدام (من جذر المستودع):
+    python tools/accuracy_harness.py record
+    python tools/accuracy_harness.py compare analytic
+    python tools/accuracy_harness.py compare track --retime
+"""
+import datetime
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+GOLDEN_FILE = os.path.join("data", "golden_outputs.npz")
+GOLDEN_VERSION = 2   # 2: شروق وغروب بأفق snapshot_horizon وبمنطقة كل موقع
+
+DATES = [
+    (1955, 3, 21, 6), (1963, 7, 4, 19), (1972, 11, 15, 22), (1981, 1, 9, 5),
+    (1990, 5, 27, 12), (1999, 8, 11, 14), (2006, 12, 2, 20), (2013, 6, 18, 3),
+    (2020, 2, 29, 18), (2024, 3, 11, 19), (2031, 9, 5, 1), (2045, 10, 23, 9),
+]
+LOCATIONS = ["مسقط", "صلالة", "خصب", "مكة", "الرياض"]
+BODIES = list(main.HomeContent.BODIES)
+
+# الحدود المسموحة لكل كمية (السمت يُقاس على دائرة الأفق، أي مضروباً في جيب تمام الارتفاع)
+TOLERANCES = {
+    "altitude": 0.2,            # درجة
+    "azimuth": 0.2,             # درجة على الأفق
+    "illumination": 0.002,      # كسر من القرص
+    "phase_angle": 0.2,         # درجة
+    "rise": 2.0,                # دقيقة
+    "set": 2.0,                 # دقيقة
+}
+UNITS = {"altitude": "°", "azimuth": "°", "illumination": "", "phase_angle": "°", "rise": " min", "set": " min"}
+
+TZ = pytz.timezone("Asia/Muscat")
+
+
+def matrix_datetimes():
+    return [TZ.localize(datetime.datetime(*d)) for d in DATES]
+
+
+def matrix_locations():
+    return [main.Topos(*main.OMAN_LOCATIONS[name]) for name in LOCATIONS]
+
+
+def matrix_timezones():
+    return [main.get_location_timezone(name) for name in LOCATIONS]
+
+
+def parse_rise_set(text, tz):
+    """يحوّل نص select_rise_set (مع التاريخ، بتوقيت tz) إلى ثوانٍ منذ 1970، أو NaN."""
+    try:
+        value = datetime.datetime.strptime(text.replace("ص", "AM").replace("م", "PM"), "%d/%m/%Y %I:%M %p")
+    except ValueError:
+        return np.nan
+    return tz.localize(value).timestamp()
+
+
+# -------------------------------------------------------------------
+# المحركات: كل محرك يعيد قاموس {الكمية: مصفوفة} وقاموس {المجموعة: الزمن بالثواني}
+
+def skyfield_engine(eph):
+    """المسار الدقيق: observe().apparent().altaz() و almanac، و get_rise_set بأفق snapshot_horizon."""
+    main.eph = eph
+    dts, locations, tzs = matrix_datetimes(), matrix_locations(), matrix_timezones()
+    shape = (len(dts), len(locations), len(BODIES))
+    out = {name: np.full(shape, np.nan) for name in ("altitude", "azimuth", "rise", "set")}
+    timings = {}
+
+    start = time.perf_counter()
+    for i, dt in enumerate(dts):
+        t = main.ts.from_datetime(dt)
+        for j, location in enumerate(locations):
+            observer = eph['earth'] + location
+            for k, key in enumerate(BODIES):
+                alt, az, _ = observer.at(t).observe(eph[key]).apparent().altaz()
+                out["altitude"][i, j, k] = alt.degrees
+                out["azimuth"][i, j, k] = az.degrees
+    timings["altaz"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    t = main.ts.from_datetimes(dts)
+    out["illumination"] = np.asarray(main.almanac.fraction_illuminated(eph, "moon", t))
+    out["phase_angle"] = main.almanac.moon_phase(eph, t).degrees
+    timings["moon"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, dt in enumerate(dts):
+        for j, location in enumerate(locations):
+            for k, key in enumerate(BODIES):
+                rise, set_ = main.get_rise_set(main.ts, dt, eph[key], include_date=True, location=location,
+                                               tz=tzs[j], horizon=main.snapshot_horizon(key))
+                out["rise"][i, j, k] = parse_rise_set(rise, tzs[j])
+                out["set"][i, j, k] = parse_rise_set(set_, tzs[j])
+    timings["rise_set"] = time.perf_counter() - start
+    return out, timings
+
+
+def track_engine(golden):
+    """
+    المسار المتجه: BodyTrack للارتفاع والسمت، و compute_sky_snapshot للشروق والغروب كما تعرضهما
+    الشاشة الرئيسية (عبورات الأفق على شبكة BodyTrack ثم اختيار الحدثين بـ select_rise_set).
+    تُعطَّل مظاهر أفق المواقع أثناء القياس لأن المرجع أفق مستوٍ.
+    """
+    dts, locations, tzs = matrix_datetimes(), matrix_locations(), matrix_timezones()
+    shape = (len(dts), len(locations), len(BODIES))
+    out = {name: np.full(shape, np.nan) for name in ("altitude", "azimuth", "rise", "set")}
+    timings = {}
+    lat = np.array([loc.latitude.degrees for loc in locations])
+    lon = np.array([loc.longitude.degrees for loc in locations])
+
+    start = time.perf_counter()
+    for i, dt in enumerate(dts):
+        tt = main.ts.from_datetime(dt).tt
+        for k, key in enumerate(BODIES):
+            alt, az = main.BodyTrack(main.eph[key], tt - 1.5, tt + 1.5).altaz(tt, lat, lon)
+            out["altitude"][i, :, k] = alt
+            out["azimuth"][i, :, k] = az
+    timings["altaz"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_horizon_profile = main.load_horizon_profile
+    main.load_horizon_profile = lambda location_name: None
+    try:
+        for i, dt in enumerate(dts):
+            for j, name in enumerate(LOCATIONS):
+                bodies = main.compute_sky_snapshot(dt, name)["bodies"]
+                for k, key in enumerate(BODIES):
+                    out["rise"][i, j, k] = parse_rise_set(bodies[key]["rise"], tzs[j])
+                    out["set"][i, j, k] = parse_rise_set(bodies[key]["set"], tzs[j])
+    finally:
+        main.load_horizon_profile = load_horizon_profile
+    timings["rise_set"] = time.perf_counter() - start
+    return out, timings
+
+
+ENGINES = {
+    "analytic": lambda golden: skyfield_engine(main.AnalyticEphemeris()),
+    "track": track_engine,
+}
+
+# -------------------------------------------------------------------
+
+def record():
+    out, timings = skyfield_engine(main.eph)
+    kernel = os.path.basename(getattr(main.eph, "path", ""))
+    np.savez(GOLDEN_FILE, version=GOLDEN_VERSION, kernel=kernel, timings=json.dumps(timings),
+             dates=np.array([str(d) for d in DATES]), locations=np.array(LOCATIONS), bodies=np.array(BODIES), **out)
+    print(f"reference outputs written to {GOLDEN_FILE} ({sum(timings.values()):.1f} s)")
+
+
+def quantity_errors(name, ref, value, ref_alt):
+    if name == "azimuth":
+        diff = (value - ref + 180.0) % 360.0 - 180.0
+        return np.abs(diff) * np.cos(np.radians(ref_alt))
+    if name in ("rise", "set"):
+        return np.abs(value - ref) / 60.0
+    return np.abs(value - ref)
+
+
+def describe_index(name, index):
+    if name in ("illumination", "phase_angle"):
+        return f"{DATES[index[0]]}"
+    i, j, k = index
+    return f"{DATES[i]} {main.get_display(LOCATIONS[j])} {BODIES[k]}"
+
+
+def compare(engine, retime=False):
+    golden = np.load(GOLDEN_FILE)
+    if "version" not in golden.files or int(golden["version"]) != GOLDEN_VERSION:
+        print("golden outputs were recorded by an older harness; run 'record' again")
+        return 2
+    if list(golden["bodies"]) != BODIES or list(golden["locations"]) != LOCATIONS:
+        print("golden outputs were recorded for a different matrix; run 'record' again")
+        return 2
+    ref_timings = json.loads(str(golden["timings"]))
+    if retime:
+        _, ref_timings = skyfield_engine(main.eph)
+
+    reference_eph = main.eph
+    try:
+        out, timings = ENGINES[engine](golden)
+    finally:
+        main.eph = reference_eph
+
+    failed = False
+    print(f"engine: {engine} (reference: {golden['kernel']})")
+    for name, tolerance in TOLERANCES.items():
+        if name not in out:
+            continue
+        ref = golden[name]
+        errors = quantity_errors(name, ref, out[name], golden["altitude"])
+        both = ~np.isnan(ref) & ~np.isnan(out[name])
+        if not np.any(both):
+            print(f"  {name:13s} not provided")
+            continue
+        # حدث موجود في أحد المسارين دون الآخر، أو فرق يقارب يوماً كاملاً (اختيار حدث آخر)، خطأ لا تحذير
+        missing = np.isnan(ref) != np.isnan(out[name])
+        selection = both & (errors >= 12 * 60) if name in ("rise", "set") else np.zeros_like(both)
+        errors = np.where(both, errors, -np.inf)
+        worst = np.unravel_index(np.argmax(errors), errors.shape)
+        status = "ok" if errors[worst] <= tolerance and not np.any(missing) else "FAIL"
+        failed |= status == "FAIL"
+        print(f"  {name:13s} worst {errors[worst]:.4f}{UNITS[name]} (limit {tolerance}{UNITS[name]}) "
+              f"over {int(np.sum(both))} values at {describe_index(name, worst)}  {status}")
+        for index in zip(*np.nonzero(selection)):
+            print(f"  {'':13s} a different {name} event was selected at {describe_index(name, index)}")
+        for index in zip(*np.nonzero(missing)):
+            print(f"  {'':13s} {name} present in only one of the outputs at {describe_index(name, index)}")
+    for group, seconds in timings.items():
+        speedup = ref_timings[group] / seconds if seconds > 0 else float("inf")
+        print(f"  time {group:9s} {seconds:7.3f} s vs {ref_timings[group]:7.3f} s  (x{speedup:.1f})")
+    return 1 if failed else 0
+
+
+def main_cli(argv):
+    if len(argv) >= 2 and argv[1] == "record":
+        record()
+        return 0
+    if len(argv) >= 3 and argv[1] == "compare" and argv[2] in ENGINES:
+        return compare(argv[2], retime="--retime" in argv[3:])
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli(sys.argv))
@@ -0,0 +1,106 @@
+"""
+اختبار حمل لخدمة tools/api_server.py.
+
+يفتح عدداً من الاتصالات المتزامنة (مع إبقائها مفتوحة) ويرسل طلبات GET متتالية من مزيج يشبه
+استخدام شاشات العرض: مواضع "الآن" ومواقيت اليوم لعدة مواقع وطور القمر، مع طلبات دفعية أحياناً.
+يطبع عدد الطلبات في الثانية ومئينات زمن الاستجابة وعدد الأخطاء، ثم إحصاءات الذاكرة من /stats.
+
+الاستخدام (والخدمة تعمل):
+    python tools/api_load_test.py --url http://127.0.0.1:8765 --connections 50 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+LOCATIONS = ["مسقط", "صلالة", "صحار", "نزوى", "صور", "خصب", "عبري", "الدقم"]
+
+
+def request_mix(rng):
+    """مسار الطلب التالي؛ التكرار مقصود لأن العملاء الحقيقيين يطلبون الأرقام نفسها."""
+    location = quote(rng.choice(LOCATIONS))
+    day = f"2024-03-{rng.randint(1, 28):02d}"
+    roll = rng.random()
+    if roll < 0.4:
+        return f"/positions?location={location}&datetime=now"
+    if roll < 0.7:
+        return f"/riseset?location={location}&date={day}&bodies=sun,moon"
+    if roll < 0.9:
+        return f"/moon?datetime={day}T20:00"
+    if roll < 0.98:
+        return f"/positions?location={location}&datetime={day}T{rng.randint(0, 23):02d}:00"
+    return f"/batch/riseset?locations={quote(','.join(LOCATIONS))}&start=2024-03-01&end=2024-04-01"
+
+
+async def fetch(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, body
+
+
+async def client(host, port, deadline, latencies, errors, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            path = request_mix(rng)
+            start = time.perf_counter()
+            status, _ = await fetch(reader, writer, host, path)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append((status, path))
+    finally:
+        writer.close()
+
+
+async def run(url, connections, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, start + duration, latencies, errors, i)
+                           for i in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, stats = await fetch(reader, writer, host, "/stats")
+    writer.close()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    print(f"{len(latencies)} requests in {elapsed:.1f} s over {connections} connections: "
+          f"{len(latencies) / elapsed:.0f} req/s")
+    print(f"latency p50 {percentile(50):.1f} ms  p90 {percentile(90):.1f} ms  "
+          f"p99 {percentile(99):.1f} ms  max {latencies[-1] * 1000:.1f} ms")
+    print(f"errors: {len(errors)}" + (f" (first: {errors[0]})" if errors else ""))
+    print("server:", json.loads(stats))
+    return 1 if errors else 0
+
+
+def main_cli(argv):
+    parser = argparse.ArgumentParser(description="load test for tools/api_server.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args(argv[1:])
+    return asyncio.run(run(args.url, args.connections, args.duration))
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli(sys.argv))
@@ -0,0 +1,389 @@
+"""
+خدمة JSON محلية (دون واجهة) تعرض حسابات التطبيق نفسها لأدوات أخرى مثل شاشات العرض وطابعة المواقيت.
+
+تعمل على asyncio وتستمع على 127.0.0.1 فقط. كل حساب Skyfield يُنفَّذ في مجمّع خيوط (executor)
+فلا تتوقف حلقة الأحداث، والطلبات المتطابقة المتزامنة تنتظر حساباً واحداً، والنتائج المسلسلة
+تُحفظ في ذاكرة مشتركة بمدة صلاحية (TTL).
+
+النقاط (التواريخ والأوقات بالتوقيت المحلي للموقع، وبتوقيت مسقط إن لم يكن للطلب موقع واحد؛
+والمواقع بأسمائها في OMAN_LOCATIONS):
+  GET /positions?location=مسقط&datetime=2024-03-11T19:00
+  GET /riseset?location=مسقط&date=2024-03-11[&bodies=sun,moon]
+  GET /moon?datetime=2024-03-11T19:00
+  GET /batch/riseset?locations=مسقط,صلالة&start=2024-03-01&end=2024-04-01[&bodies=sun,moon]
+  GET /batch/positions?locations=مسقط,صلالة&start=2024-03-11T18:00&end=2024-03-12T06:00&step=10
+  GET /stats
+
+الاستخدام (من جذر المستودع):
+    python tools/api_server.py --port 8765
+    python tools/api_load_test.py --url http://127.0.0.1:8765 --duration 10
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# تشغيل Kivy دون نافذة: كثافة الشاشة ثابتة بدلاً من قراءتها من النافذة
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_WINDOW", "")
+os.environ.setdefault("KIVY_DPI", "96")
+os.environ.setdefault("KIVY_METRICS_DENSITY", "1")
+os.environ.setdefault("KIVY_METRICS_FONTSCALE", "1")
+
+import numpy as np  # noqa: E402
+import pytz  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+TZ = pytz.timezone("Asia/Muscat")
+BODIES = {key: name for key, name in main.EVENT_BODIES}
+DEFAULT_RISE_SET_BODIES = ["sun", "moon"]
+MAX_RANGE_DAYS = 366
+MAX_POSITION_SAMPLES = 20000
+STEP_MINUTES = 10
+
+
+class RequestError(Exception):
+    """خطأ في معاملات الطلب يُعاد للعميل برمز 400."""
+
+
+# -------------------------------------------------------------------
+# قراءة المعاملات
+
+def param(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise RequestError(f"missing parameter '{name}'")
+        return default
+    return values[0]
+
+
+def parse_locations(text):
+    names = [n.strip() for n in text.split(",") if n.strip()]
+    unknown = [n for n in names if n not in main.OMAN_LOCATIONS]
+    if unknown or not names:
+        raise RequestError(f"unknown location: {','.join(unknown) or text}")
+    return names
+
+
+def parse_bodies(text):
+    keys = [k.strip() for k in text.split(",") if k.strip()]
+    lookup = {k.lower(): k for k in BODIES}
+    try:
+        return [lookup[k.lower()] for k in keys]
+    except KeyError as e:
+        raise RequestError(f"unknown body {e}; expected one of {', '.join(BODIES)}")
+
+
+def parse_datetime(text, tz=TZ):
+    """وقت محلي بصيغة ISO، أو "now" مقطوعاً إلى الدقيقة كي تشترك الطلبات المتقاربة في الذاكرة."""
+    if text == "now":
+        return datetime.datetime.now(tz).replace(second=0, microsecond=0)
+    try:
+        value = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise RequestError(f"bad datetime '{text}'")
+    return value.astimezone(tz) if value.tzinfo else tz.localize(value)
+
+
+def parse_date(text):
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        raise RequestError(f"bad date '{text}'")
+
+
+def iso_times(tt_values, tz=TZ):
+    """أوقات TT إلى نصوص ISO محلية بتحويل واحد للمصفوفة كلها (None للقيم المفقودة)."""
+    half_second = datetime.timedelta(milliseconds=500)
+    return [None if t is None else (t + half_second).isoformat(timespec="seconds")
+            for t in main.tt_to_local(np.ravel(tt_values), tz)]
+
+
+# -------------------------------------------------------------------
+# الحسابات (تُنفَّذ داخل مجمّع الخيوط)
+
+def compute_positions(location_name, dt):
+    location = main.Topos(*main.OMAN_LOCATIONS[location_name])
+    observer = (main.eph['earth'] + location).at(main.ts.from_datetime(dt.astimezone(pytz.UTC)))
+    bodies = {}
+    for key in BODIES:
+        alt, az, distance = observer.observe(main.eph[key]).apparent().altaz()
+        bodies[key] = {
+            "name": BODIES[key],
+            "altitude": round(alt.degrees, 4),
+            "apparent_altitude": round(main.apply_refraction_correction(alt.degrees), 4),
+            "azimuth": round(az.degrees, 4),
+            "distance_au": round(distance.au, 8),
+        }
+    return {"location": location_name, "datetime": dt.isoformat(), "bodies": bodies}
+
+
+def compute_moon(dt):
+    t = main.ts.from_datetime(dt.astimezone(pytz.UTC))
+    phase_angle = main.almanac.moon_phase(main.eph, t).degrees
+    phase_name = main.get_moon_phase_name(phase_angle, phase_angle < 180)
+    return {
+        "datetime": dt.isoformat(),
+        "illumination": round(float(main.almanac.fraction_illuminated(main.eph, "moon", t)), 6),
+        "phase_angle": round(float(phase_angle), 4),
+        "phase": phase_name,
+        "phase_ar": main.MOON_PHASE_AR.get(phase_name, phase_name),
+    }
+
+
+def compute_rise_set(location_names, start, end, bodies):
+    """
+    أول شروق وغروب لكل جرم في كل يوم محلي (بمنطقة كل موقع) من [start, end) لكل المواقع:
+    BodyTrack واحد لكل جرم على المدى كله، وعبورات الأفق لكل المواقع معاً عبر horizon_crossings،
+    بأفق snapshot_horizon ومظهر أفق كل موقع كما تعرضه الشاشات.
+    """
+    days = (end - start).days
+    if not 0 < days <= MAX_RANGE_DAYS:
+        raise RequestError(f"date range must be 1..{MAX_RANGE_DAYS} days")
+    locations = [main.Topos(*main.OMAN_LOCATIONS[name]) for name in location_names]
+    lat = np.array([loc.latitude.degrees for loc in locations])
+    lon = np.array([loc.longitude.degrees for loc in locations])
+    zones = [main.get_location_timezone(name) for name in location_names]
+    day0 = np.array([main.local_midnight_tt(start, tz) for tz in zones])
+    step = STEP_MINUTES / 1440.0
+    tt = np.arange(day0.min(), day0.max() + days + step, step)
+    profiles = main.location_horizons(location_names)
+
+    # الجدول [موقع، يوم، جرم، شروق/غروب]
+    table = np.full((len(location_names), days, len(bodies), 2), np.nan)
+    for b, key in enumerate(bodies):
+        track = main.BodyTrack(main.eph[key], tt[0], tt[-1])
+        for column, rising in enumerate((True, False)):
+            loc_idx, roots = main.horizon_crossings(track, tt, lat, lon, rising,
+                                                    main.snapshot_horizon(key), profiles)
+            day_idx = np.floor(roots - day0[loc_idx]).astype(int)
+            ok = (day_idx >= 0) & (day_idx < days)
+            # العبورات مرتبة حسب الموقع ثم الزمن، فأول ظهور لكل (موقع، يوم) هو أول عبور فيه
+            _, first = np.unique(loc_idx[ok] * days + day_idx[ok], return_index=True)
+            table[loc_idx[ok][first], day_idx[ok][first], b, column] = roots[ok][first]
+
+    result = {}
+    for j, name in enumerate(location_names):
+        text = np.array(iso_times(table[j], zones[j]), dtype=object).reshape(table[j].shape)
+        result[name] = {
+            (start + datetime.timedelta(days=d)).isoformat(): {
+                key: {"rise": text[d, b, 0], "set": text[d, b, 1]}
+                for b, key in enumerate(bodies)
+            }
+            for d in range(days)
+        }
+    return result
+
+
+def compute_batch_positions(location_names, start, end, step_minutes):
+    if end <= start or step_minutes <= 0:
+        raise RequestError("end must be after start and step positive")
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise RequestError(f"range must be at most {MAX_RANGE_DAYS} days")
+    tt0, tt1 = main.ts.from_datetimes([start.astimezone(pytz.UTC), end.astimezone(pytz.UTC)]).tt
+    # يُفحص العدد قبل إنشاء الشبكة حتى لا تُحجز مصفوفة ضخمة لخطوة صغيرة جداً
+    if (int((tt1 - tt0) * 1440.0 / step_minutes) + 1) * len(location_names) > MAX_POSITION_SAMPLES:
+        raise RequestError(f"too many samples (limit {MAX_POSITION_SAMPLES} times x locations)")
+    tt = np.arange(tt0, tt1 + 1e-9, step_minutes / 1440.0)
+    locations = [main.Topos(*main.OMAN_LOCATIONS[name]) for name in location_names]
+    lat = np.array([loc.latitude.degrees for loc in locations])[:, None]
+    lon = np.array([loc.longitude.degrees for loc in locations])[:, None]
+
+    bodies = {}
+    for key in BODIES:
+        alt, az = main.BodyTrack(main.eph[key], tt0, tt1).altaz(tt, lat, lon)
+        bodies[key] = {"altitude": np.round(alt, 3).tolist(), "azimuth": np.round(az, 3).tolist()}
+    return {
+        "locations": location_names,
+        "times": iso_times(tt),
+        "bodies": bodies,
+    }
+
+
+def route(path, params):
+    """يعيد (مفتاح الذاكرة، دالة الحساب) للطلب، أو يرفع RequestError."""
+    if path == "/positions":
+        location = parse_locations(param(params, "location", "مسقط"))[0]
+        dt = parse_datetime(param(params, "datetime", "now"), main.get_location_timezone(location))
+        return ("positions", location, dt.isoformat()), lambda: compute_positions(location, dt)
+    if path == "/moon":
+        dt = parse_datetime(param(params, "datetime", "now"))
+        return ("moon", dt.isoformat()), lambda: compute_moon(dt)
+    if path == "/riseset":
+        location = parse_locations(param(params, "location", "مسقط"))
+        date_ = parse_date(param(params, "date", datetime.datetime.now(TZ).date().isoformat()))
+        bodies = parse_bodies(param(params, "bodies", ",".join(DEFAULT_RISE_SET_BODIES)))
+        return (("riseset", tuple(location), date_, tuple(bodies)),
+                lambda: compute_rise_set(location, date_, date_ + datetime.timedelta(days=1), bodies))
+    if path == "/batch/riseset":
+        locations = parse_locations(param(params, "locations"))
+        start, end = parse_date(param(params, "start")), parse_date(param(params, "end"))
+        bodies = parse_bodies(param(params, "bodies", ",".join(DEFAULT_RISE_SET_BODIES)))
+        return (("batch_riseset", tuple(locations), start, end, tuple(bodies)),
+                lambda: compute_rise_set(locations, start, end, bodies))
+    if path == "/batch/positions":
+        locations = parse_locations(param(params, "locations"))
+        start, end = parse_datetime(param(params, "start")), parse_datetime(param(params, "end"))
+        try:
+            step = float(param(params, "step", str(STEP_MINUTES)))
+        except ValueError:
+            raise RequestError("bad step")
+        if not math.isfinite(step):
+            raise RequestError("bad step")
+        return (("batch_positions", tuple(locations), start.isoformat(), end.isoformat(), step),
+                lambda: compute_batch_positions(locations, start, end, step))
+    return None, None
+
+
+# -------------------------------------------------------------------
+# الذاكرة المشتركة ودمج الطلبات المتطابقة
+
+class ResultCache:
+    """
+    نتائج مسلسلة (bytes) بمدة صلاحية وحد أقصى للعدد (الأقدم استخداماً يُحذف أولاً).
+    الطلب الذي يصل أثناء حساب المفتاح نفسه ينتظر المستقبل (Future) الجاري بدلاً من حساب جديد.
+    """
+
+    def __init__(self, executor, ttl=60.0, max_entries=2048):
+        self.executor = executor
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    async def get(self, key, compute):
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        self.stats["misses"] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, lambda: encode(compute()))
+        self.in_flight[key] = future
+        try:
+            body = await future
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            del self.in_flight[key]
+        self.entries[key] = (time.monotonic() + self.ttl, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return body
+
+
+def encode(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# -------------------------------------------------------------------
+# خادم HTTP/1.1 مصغّر (GET فقط، مع إبقاء الاتصال مفتوحاً)
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error"}
+
+
+class ApiServer:
+    def __init__(self, workers=4, ttl=60.0):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ephemeris")
+        self.cache = ResultCache(self.executor, ttl=ttl)
+        self.requests = 0
+        self.started = time.monotonic()
+
+    async def respond(self, method, target):
+        if method != "GET":
+            return 405, encode({"error": "only GET is supported"})
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/") or "/"
+        params = parse_qs(url.query)
+        if path == "/stats":
+            uptime = time.monotonic() - self.started
+            return 200, encode({"requests": self.requests, "uptime_s": round(uptime, 1),
+                                "cache_entries": len(self.cache.entries), **self.cache.stats})
+        try:
+            key, compute = route(path, params)
+            if key is None:
+                return 404, encode({"error": f"unknown endpoint {path}"})
+            return 200, await self.cache.get(key, compute)
+        except RequestError as e:
+            return 400, encode({"error": str(e)})
+        except Exception as e:
+            print("request failed:", target, e)
+            return 500, encode({"error": "internal error"})
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                self.requests += 1
+                status, body = await self.respond(method, target)
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection") != "close") or \
+                    headers.get("connection") == "keep-alive"
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"astro API listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main_cli(argv):
+    parser = argparse.ArgumentParser(description="local JSON API for the astronomy computations")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ttl", type=float, default=60.0, help="cache lifetime in seconds")
+    args = parser.parse_args(argv[1:])
+    try:
+        asyncio.run(ApiServer(args.workers, args.ttl).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli(sys.argv))
@@ -0,0 +1,56 @@
+"""
+تجميع أيقونات planetimg في أطلس Kivy واحد يقرؤه التطبيق.
+
+تُصغَّر كل صورة PNG في planetimg/ (الأصل 512×512 وتُعرض بين 20 و50 بكسلاً) إلى ICON_SIZE،
+ثم تُعبّأ في صفحة واحدة عبر kivy.atlas، فيحمّل التطبيق نسيجاً واحداً عند البدء بدلاً من ملف لكل أيقونة.
+
+المخرجات (في مجلد data/):
+  - icons.atlas: فهرس JSON لمنطقة كل أيقونة (اسم الملف دون الامتداد).
+  - icons-0.png: صفحة الأطلس.
+
+الاستخدام (قبل buildozer؛ يتطلب kivy و Pillow):
+    python tools/build_icon_atlas.py
+"""
+import glob
+import os
+import sys
+import tempfile
+
+from PIL import Image
+
+ICON_SIZE = 128
+ATLAS_SIZE = (1024, 512)
+PADDING = 2
+
+
+def main(argv):
+    from kivy.atlas import Atlas
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = sorted(glob.glob(os.path.join(root, 'planetimg', '*.png')))
+    if not sources:
+        print("no icons found in planetimg/")
+        return 1
+    out_dir = os.path.join(root, 'data')
+    os.makedirs(out_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scaled = []
+        for path in sources:
+            icon = Image.open(path).convert('RGBA')
+            icon.thumbnail((ICON_SIZE, ICON_SIZE), Image.LANCZOS)
+            target = os.path.join(tmp, os.path.basename(path))
+            icon.save(target)
+            scaled.append(target)
+        result = Atlas.create(os.path.join(out_dir, 'icons'), scaled, ATLAS_SIZE, padding=PADDING)
+    if not result:
+        print(f"icons do not fit in a {ATLAS_SIZE[0]}x{ATLAS_SIZE[1]} atlas")
+        return 1
+    _, meta = result
+    count = sum(len(regions) for regions in meta.values())
+    print(f"{count} icons packed into {len(meta)} page(s) in {out_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
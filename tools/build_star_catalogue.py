@@ -0,0 +1,67 @@
+"""
+تحويل فهرس النجوم اللامعة إلى الصيغة الثنائية التي يقرؤها التطبيق.
+
+المدخلات:
+  - ملف CSV بالأعمدة hip,ra,dec,Vmag (الإحداثيات بالدرجات، J2000) لنجوم هيبارخوس حتى القدر 6
+    تقريباً، مثل المرفق بحزمة skychart (رخصة MIT).
+  - ملف constellationship.fab بصيغة Stellarium لخطوط الكوكبات.
+
+المخرجات (في مجلد data/):
+  - stars.npy: مصفوفة مهيكلة (hip, ra, dec, mag) مرتبة تصاعدياً حسب القدر،
+    بحيث يصبح القطع حسب القدر الحدّي مجرد اقتطاع لبداية المصفوفة.
+  - constellation_lines.npy: أزواج مؤشرات (int16) داخل stars.npy لكل قطعة خط.
+
+الاستخدام:
+    python tools/build_star_catalogue.py hip_stars.csv constellationship.fab
+"""
+import csv
+import os
+import sys
+
+import numpy as np
+
+STAR_DTYPE = np.dtype([('hip', '<i4'), ('ra', '<f4'), ('dec', '<f4'), ('mag', '<f4')])
+
+
+def read_stars(path):
+    rows = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            rows.append((int(row['hip']), float(row['ra']), float(row['dec']), float(row['Vmag'])))
+    stars = np.array(rows, dtype=STAR_DTYPE)
+    stars = stars[np.argsort(stars['mag'], kind='stable')]
+    _, first = np.unique(stars['hip'], return_index=True)
+    return stars[np.sort(first)]
+
+
+def read_lines(path, stars):
+    index_of = {int(hip): i for i, hip in enumerate(stars['hip'])}
+    pairs = []
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 4:
+                continue
+            hips = [int(p) for p in parts[2:]]
+            for a, b in zip(hips[0::2], hips[1::2]):
+                if a in index_of and b in index_of:
+                    pairs.append((index_of[a], index_of[b]))
+    return np.array(pairs, dtype=np.int16).reshape(-1, 2)
+
+
+def main(argv):
+    if len(argv) != 3:
+        print(__doc__)
+        return 1
+    stars = read_stars(argv[1])
+    lines = read_lines(argv[2], stars)
+    out_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, 'stars.npy'), stars)
+    np.save(os.path.join(out_dir, 'constellation_lines.npy'), lines)
+    print(f"{len(stars)} stars, {len(lines)} constellation segments written to {out_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,153 @@
+"""
+تصدير خرائط السماء وأقراص القمر صوراً PNG دون نافذة ظاهرة، لمدى من التواريخ وعلى عدة أنوية.
+
+يُرسم SkyMapWidget و MoonPhaseWidget نفسيهما كما في التطبيق داخل Fbo خارج الشاشة ثم يُحفظ
+النسيج ملفاً. تُقسم الإطارات إلى دفعات متتالية على عمليات عاملة (spawn)، لكل عملية سياق OpenGL
+خاص بها من نافذة SDL2 مخفية؛ ومع مشغّل SDL "offscreen" و Mesa البرمجي (llvmpipe) يعمل على خادم
+بلا شاشة. إن لم يتوفر EGL للمشغّل offscreen فيمكن التشغيل داخل xvfb-run مع SDL_VIDEODRIVER=x11.
+
+المخرجات في المجلد --out:
+  - sky_00000.png، sky_00001.png، ... و moon_00000.png، ... (ترقيم متصل يصلح لصنع فيديو بـ ffmpeg).
+  - frames.csv: رقم كل إطار ووقته المحلي.
+
+الاستخدام (من جذر المستودع):
+    python tools/render_sky_charts.py --location مسقط --start 2025-01-01T21:00 --end 2025-12-31T21:00
+    python tools/render_sky_charts.py --start 2025-03-29T18:00 --end 2025-03-30T06:00 --step 10 --what sky
+    ffmpeg -framerate 24 -i exports/charts/sky_%05d.png -pix_fmt yuv420p sky.mp4
+"""
+import argparse
+import csv
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+
+# OpenGL دون شاشة: نافذة مخفية على مشغّل SDL الخارج عن الشاشة، وكثافة ثابتة ليتطابق حجم الخط بين الأجهزة
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KCFG_GRAPHICS_WINDOW_STATE", "hidden")
+os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+os.environ.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+os.environ.setdefault("KIVY_DPI", "96")
+os.environ.setdefault("KIVY_METRICS_DENSITY", "1")
+os.environ.setdefault("KIVY_METRICS_FONTSCALE", "1")
+# بلا معالج إشارات SDL في العمليات العاملة، فتبقى SIGTERM/SIGINT لـ Python ويُنهي المُجمِّع عمّاله
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import pytz  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+from kivy.core.image import Image as CoreImage  # noqa: E402
+from kivy.graphics import Fbo, ClearColor, ClearBuffers, Scale, Translate  # noqa: E402
+
+KINDS = ["sky", "moon"]
+BACKGROUND = "#300544"
+
+
+def render_widget(widget, path, background=BACKGROUND):
+    """يرسم لوحة الودجت في Fbo بحجمه فوق لون خلفية ثابت ويحفظ النتيجة PNG (كما export_as_image)."""
+    fbo = Fbo(size=widget.size, with_stencilbuffer=True)
+    with fbo:
+        ClearColor(*main.hex_to_rgba(background))
+        ClearBuffers()
+        Scale(1, -1, 1)
+        Translate(-widget.x, -widget.y - widget.height, 0)
+    fbo.add(widget.canvas)
+    fbo.draw()
+    CoreImage(fbo.texture).save(path)
+    fbo.remove(widget.canvas)
+
+
+def render_chunk(job):
+    """
+    يرسم دفعة إطارات متتالية في العملية الحالية. الودجتان تُنشآن مرة واحدة لكل دفعة،
+    ثم يتغير الوقت فقط فتبقى مخازن الرؤوس وأطلس التسميات مستخدمة من إطار لآخر.
+    """
+    location_name, frames, size, kinds, out_dir = job
+    location = main.Topos(*main.OMAN_LOCATIONS[location_name])
+    sky = moon = None
+    if "sky" in kinds:
+        sky = main.SkyMapWidget(dt=frames[0][1], location_name=location_name,
+                                size_hint=(None, None), size=(size, size))
+    if "moon" in kinds:
+        moon = main.MoonPhaseWidget(size_hint=(None, None), size=(size, size))
+    for index, dt in frames:
+        if sky is not None:
+            sky.dt = dt
+            sky.update_map()
+            render_widget(sky, os.path.join(out_dir, f"sky_{index:05d}.png"))
+        if moon is not None:
+            t = main.ts.from_datetime(dt.astimezone(pytz.UTC))
+            moon.geometry = main.moon_disc_geometry(t, location)
+            render_widget(moon, os.path.join(out_dir, f"moon_{index:05d}.png"))
+    return len(frames)
+
+
+def frame_times(start, end, step_minutes, tz):
+    """أوقات الإطارات بخطوة ثابتة على ساعة الموقع، فتبقى ساعة الخريطة ثابتة عبر تغيّر التوقيت الصيفي."""
+    step = datetime.timedelta(minutes=step_minutes)
+    times = []
+    current = start
+    while current <= end:
+        times.append(tz.localize(current))
+        current += step
+    return times
+
+
+def chunked(frames, workers):
+    size = max(1, len(frames) // (workers * 4))
+    return [frames[i:i + size] for i in range(0, len(frames), size)]
+
+
+def main_cli(argv):
+    parser = argparse.ArgumentParser(description="headless sky-map and moon PNG export")
+    parser.add_argument("--location", default="مسقط")
+    parser.add_argument("--start", required=True, help="local time, ISO format")
+    parser.add_argument("--end", required=True, help="local time, ISO format")
+    parser.add_argument("--step", type=float, default=1440, help="minutes between frames")
+    parser.add_argument("--size", type=int, default=1080, help="frame width and height in pixels")
+    parser.add_argument("--what", default="sky,moon", help="comma-separated: " + ",".join(KINDS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", default=os.path.join(main.EXPORT_FOLDER, "charts"))
+    args = parser.parse_args(argv[1:])
+
+    if args.location not in main.OMAN_LOCATIONS:
+        parser.error(f"unknown location '{args.location}'")
+    kinds = [k.strip() for k in args.what.split(",") if k.strip()]
+    if not kinds or any(k not in KINDS for k in kinds):
+        parser.error(f"--what expects a subset of {','.join(KINDS)}")
+    tz = main.get_location_timezone(args.location)
+    start, end = (datetime.datetime.fromisoformat(v) for v in (args.start, args.end))
+    frames = list(enumerate(frame_times(start, end, args.step, tz)))
+    if not frames:
+        parser.error("--end is before --start")
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, "frames.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame", "local_time"])
+        writer.writerows((index, dt.isoformat()) for index, dt in frames)
+
+    jobs = [(args.location, chunk, args.size, kinds, args.out) for chunk in chunked(frames, args.workers)]
+    started = time.perf_counter()
+    done = 0
+    if args.workers <= 1:
+        for job in jobs:
+            done += render_chunk(job)
+            print(f"{done}/{len(frames)} frames")
+    else:
+        # spawn لا fork: لكل عملية سياق OpenGL ونافذة مخفية خاصة بها
+        with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+            for count in pool.imap_unordered(render_chunk, jobs):
+                done += count
+                print(f"{done}/{len(frames)} frames")
+            # إغلاق منظّم قبل الخروج من الكتلة: __exit__ يستدعي terminate() التي قد تعلق مع عامل OpenGL
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - started
+    print(f"{done} frames x {len(kinds)} in {elapsed:.1f} s ({args.workers} workers) -> {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli(sys.argv))